@@ -0,0 +1,13 @@
+"""
+Listes de l'admin pour les grandes tables : comptage borné (EstimatedCountPaginator) et
+hiérarchie de dates (date_hierarchy) servie par l'index de la colonne date
+(balise date_hierarchy_indexee, Pret/templatetags/admin_grandes_tables.py).
+"""
+from Pret.pagination import EstimatedCountPaginator
+
+
+class GrandeTableAdminMixin:
+    """A placer avant admin.ModelAdmin (ou une de ses sous-classes)."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False  # pas de second COUNT(*) sur la table entière
+    change_list_template = 'admin/change_list_grande_table.html'
@@ -3,6 +3,10 @@ ASGI config for Pret project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The Server-Sent Events endpoint (api/messagerie/flux/) keeps connections open
+and must be served through this entry point, e.g. ``uvicorn Pret.asgi:application``;
+under WSGI each connected client would hold a worker thread.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
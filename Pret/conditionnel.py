@@ -0,0 +1,41 @@
+import hashlib
+
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+
+class ConditionalGetMixin:
+    """
+    GET conditionnel (ETag, Last-Modified) pour les vues DRF en lecture : un client qui renvoie
+    If-None-Match / If-Modified-Since reçoit 304 sans que la réponse soit requêtée ni sérialisée.
+
+    La vue implémente validateurs(), appelée après l'authentification : elle retourne
+    (version, derniere_modification) à partir d'une requête légère (agrégats, colonnes), ou None
+    pour laisser la vue répondre normalement (404...). `version` doit changer avec tout ce que la
+    réponse contient ; `derniere_modification` (datetime ou None) est plus grossière (à la seconde,
+    et seulement ce qui est horodaté) : Django donne la priorité à If-None-Match.
+    """
+
+    def validateurs(self):
+        raise NotImplementedError
+
+    def etag(self, version):
+        # La représentation dépend aussi de l'utilisateur (rôle), des paramètres (page, curseur) et du format
+        user = self.request.user
+        cle = (user.pk, user.is_staff, self.request.get_full_path(), self.request.accepted_renderer.format, version)
+        return hashlib.sha256(repr(cle).encode()).hexdigest()[:32]
+
+    def get(self, request, *args, **kwargs):
+        valeurs = self.validateurs()
+        if valeurs is None:
+            return super().get(request, *args, **kwargs)
+        version, derniere_modification = valeurs
+        etag = self.etag(version)
+        vue = condition(
+            etag_func=lambda *args, **kwargs: etag,
+            last_modified_func=lambda *args, **kwargs: derniere_modification,
+        )(super().get)
+        response = vue(request, *args, **kwargs)
+        # Réponse propre à l'utilisateur, toujours revalidée par le navigateur (If-None-Match)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
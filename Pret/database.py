@@ -0,0 +1,47 @@
+"""
+Configuration des bases de données : profil de production pour SQLite (WAL, pragmas,
+transactions IMMEDIATE) et connexions persistantes avec contrôle de validité.
+"""
+
+# Mode de journal : lecteurs et rédacteur ne se bloquent plus mutuellement. Il est enregistré dans
+# le fichier de la base, donc activé une fois (manage.py activer_wal) et non à chaque connexion,
+# qui réécrirait toute base ouverte, y compris par manage.py check ou test.
+MODE_JOURNAL = 'WAL'
+
+# Appliqués à chaque nouvelle connexion (OPTIONS['init_command'])
+PRAGMAS_SQLITE = {
+    'synchronous': 'NORMAL',      # sûr en WAL ; un fsync par checkpoint plutôt que par transaction
+    'busy_timeout': 20000,        # ms d'attente du verrou avant « database is locked »
+    'cache_size': -32000,         # ~32 Mo de cache de pages par connexion
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+def configurer_base(base, conn_max_age=0, pragmas=None, wal=False):
+    """
+    Complète une entrée de DATABASES. Pour SQLite : pragmas ci-dessus et transactions IMMEDIATE
+    (le verrou d'écriture est pris dès BEGIN, avec attente, au lieu d'échouer lors de la montée
+    en écriture d'une transaction commencée en lecture) ; `wal` ajoute le mode WAL aux pragmas de
+    connexion (bases jetables). Pour tous les moteurs : connexions vérifiées avant réutilisation
+    (CONN_HEALTH_CHECKS), persistantes si `conn_max_age` > 0 (WSGI uniquement : sous ASGI, les
+    connexions ouvertes par sync_to_async ne sont pas fermées par le cycle des requêtes).
+    """
+    base = dict(base)
+    base.setdefault('CONN_MAX_AGE', conn_max_age)
+    base.setdefault('CONN_HEALTH_CHECKS', True)
+    if base['ENGINE'] == 'django.db.backends.sqlite3':
+        pragmas = {**({'journal_mode': MODE_JOURNAL} if wal else {}), **PRAGMAS_SQLITE, **(pragmas or {})}
+        options = dict(base.get('OPTIONS', {}))
+        options.setdefault('timeout', pragmas['busy_timeout'] / 1000)
+        options.setdefault('transaction_mode', 'IMMEDIATE')
+        options.setdefault('init_command', ''.join(f"PRAGMA {nom}={valeur};" for nom, valeur in pragmas.items()))
+        base['OPTIONS'] = options
+    return base
+
+
+def activer_wal(connexion):
+    """Passe une base SQLite en mode WAL (persistant) ; retourne le mode de journal obtenu."""
+    with connexion.cursor() as curseur:
+        curseur.execute(f"PRAGMA journal_mode={MODE_JOURNAL}")
+        return curseur.fetchone()[0]
@@ -0,0 +1,161 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import F, Field, Func, Q, Value
+from django.db.models.lookups import GreaterThan, LessThan
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+
+class _Ligne(Func):
+    # Valeur de ligne SQL : (a, b)
+    function = ''
+    output_field = Field()
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Pagination par clé composite : le curseur porte la valeur de chaque champ de l'ordre
+    (`cursor_ordering`, terminé par un champ unique) et la page suivante est filtrée sur le tuple,
+    (date, id) > (d, i), et non sur le seul premier champ suivi d'un décalage. Ni COUNT(*) ni OFFSET,
+    même quand beaucoup de lignes partagent la même date : le coût ne dépend pas de la profondeur.
+    Les positions étant uniques, les liens next/previous de CursorPagination restent sans décalage.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*(champ[1:] if champ.startswith('-') else f'-{champ}' for champ in self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            try:
+                queryset = queryset.filter(self._apres_position(queryset, json.loads(current_position), reverse))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def _apres_position(self, queryset, valeurs, reverse):
+        """Lignes strictement après `valeurs` dans l'ordre parcouru (comparaison de tuples)."""
+        if not isinstance(valeurs, list) or len(valeurs) != len(self.ordering):
+            raise ValueError(valeurs)
+        noms = [champ.lstrip('-') for champ in self.ordering]
+        operateurs = ['lt' if reverse != champ.startswith('-') else 'gt' for champ in self.ordering]
+        if len(set(operateurs)) == 1 and connections[queryset.db].vendor != 'oracle':
+            # Comparaison de lignes (date, id) > (d, i) : l'index composite est parcouru directement à
+            # partir de la position, même quand des milliers de lignes partagent la date
+            meta = queryset.model._meta
+            champs = [meta.pk if nom == 'pk' else meta.get_field(nom) for nom in noms]
+            comparaison = GreaterThan if operateurs[0] == 'gt' else LessThan
+            return comparaison(
+                _Ligne(*(F(nom) for nom in noms)),
+                _Ligne(*(Value(champ.to_python(valeur), output_field=champ) for champ, valeur in zip(champs, valeurs))),
+            )
+        # Sens mélangés : date > d OR (date = d AND id < i)
+        condition = Q()
+        egalites = {}
+        for nom, operateur, valeur in zip(noms, operateurs, valeurs):
+            condition |= Q(**egalites, **{f'{nom}__{operateur}': valeur})
+            egalites[nom] = valeur
+        return condition
+
+    def _get_position_from_instance(self, instance, ordering):
+        valeurs = []
+        for champ in ordering:
+            nom = champ.lstrip('-')
+            valeurs.append(str(instance[nom] if isinstance(instance, dict) else getattr(instance, nom)))
+        return json.dumps(valeurs)
+
+class CursorPaginationMixin:
+    """
+    Bascule une vue de liste en pagination par curseur quand le client la demande
+    (`?pagination=curseur`, ou un `cursor` issu d'un lien `next`/`previous`).
+    Sans ce paramètre la pagination par numéro de page (avec `count`) reste active.
+    """
+    cursor_ordering = None
+    cursor_mode_param = 'pagination'
+    cursor_mode_value = 'curseur'
+
+    def pagination_curseur_demandee(self):
+        params = self.request.query_params
+        return (
+            params.get(self.cursor_mode_param) == self.cursor_mode_value
+            or KeysetCursorPagination.cursor_query_param in params
+        )
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator') and self.cursor_ordering and self.pagination_curseur_demandee():
+            self._paginator = KeysetCursorPagination()
+            self._paginator.ordering = self.cursor_ordering
+        return super().paginator
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginateur des listes de l'admin pour les grandes tables. Le comptage est borné : jusqu'à
+    `exact_count_threshold` lignes il est exact ; au-delà, sans filtre, il est estimé par la plus
+    grande clé primaire (une lecture d'index, au lieu d'un COUNT(*) sur toute la table). Une liste
+    filtrée au-delà du seuil est comptée exactement (filtres de l'admin adossés à des index).
+    A utiliser avec `show_full_result_count = False` pour éviter le second COUNT(*) de l'admin.
+    """
+    exact_count_threshold = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list.order_by()
+        borne = queryset[:self.exact_count_threshold + 1].count()
+        if borne <= self.exact_count_threshold:
+            return borne
+        if not queryset.query.has_filters():
+            return queryset.order_by('-pk').values_list('pk', flat=True).first() or borne
+        return queryset.count()
@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 from datetime import timedelta
+from Pret.database import configurer_base
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
@@ -24,6 +25,7 @@ INSTALLED_APPS = [
     'corsheaders',
 
     # Mes applications
+    'Pret',  # gabarits et balises partagés (admin des grandes tables)
     'users',
     'loans', # Nous allons la développer après
 
@@ -33,6 +35,7 @@ INSTALLED_APPS = [
     # Django REST Framework
     'rest_framework',
     'rest_framework_simplejwt', # Pour JWT
+    'rest_framework_simplejwt.token_blacklist',  # Révocation (rotation, déconnexion) ; purge : `manage.py purger_jetons`
 
     # Django OAuth2 Toolkit & Social Auth
     'oauth2_provider',
@@ -98,11 +101,14 @@ WSGI_APPLICATION = 'Pret.wsgi.application'
 
 
 
+# Profil SQLite de production (pragmas, transactions IMMEDIATE) : Pret/database.py ; le mode WAL s'active
+# une fois par base avec `manage.py activer_wal`. Connexions persistantes seulement sur demande
+# (DB_CONN_MAX_AGE=600 par exemple) et seulement sous WSGI : le flux SSE de la messagerie exige ASGI.
 DATABASES = {
-    'default': {
+    'default': configurer_base({
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    }, conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', 0))),
 }
 
 
@@ -144,6 +150,62 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles') # Où les fichiers statiques
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media') # Où les fichiers téléchargés par les utilisateurs seront stockés
 
+# Téléversement des pièces jointes en morceaux (api/pieces/televersements/)
+CHUNKED_UPLOAD = {
+    'DIR': os.path.join(BASE_DIR, 'televersements'),  # morceaux en attente d'assemblage
+    'CHUNK_SIZE': 5 * 1024 * 1024,
+    'MAX_CHUNK_SIZE': 16 * 1024 * 1024,
+    'MAX_FILE_SIZE': 200 * 1024 * 1024,
+    'EXPIRATION_HOURS': 24,  # sessions inactives supprimées par `manage.py nettoyer_televersements`
+}
+
+# Envoi direct des pièces jointes vers le stockage (URL signée puis confirmation).
+# 'pieces.direct.TeleversementS3' (boto3, URL PUT présignée) ou l'équivalent local ci-dessous.
+# En mode S3, PIECES_JOINTES_STORAGE doit pointer sur le même bucket et une règle de cycle de vie
+# doit expirer les objets non confirmés du préfixe pieces_jointes/direct/.
+DIRECT_UPLOAD = {
+    'BACKEND': os.environ.get('DIRECT_UPLOAD_BACKEND', 'pieces.direct.TeleversementLocal'),
+    'URL_LIFETIME': 15 * 60,
+    'TOKEN_LIFETIME': 60 * 60,
+    'MAX_FILE_SIZE': 200 * 1024 * 1024,
+    'DIR': os.path.join(BASE_DIR, 'televersements_directs'),  # dépôts locaux en attente de confirmation
+    'BUCKET': os.environ.get('DIRECT_UPLOAD_BUCKET'),
+    'ENDPOINT_URL': os.environ.get('DIRECT_UPLOAD_ENDPOINT_URL'),
+    'REGION': os.environ.get('DIRECT_UPLOAD_REGION'),
+}
+
+# Miniatures des pièces jointes, générées dans un pool de processus après l'enregistrement
+THUMBNAILS = {
+    'WORKERS': 2,
+    'SYNC': False,  # True : génération dans la requête (tests, développement)
+}
+
+# Téléchargement des pièces jointes : après contrôle d'accès, transfert délégué au serveur frontal.
+# 'x-accel' (nginx, location internal sur INTERNAL_PREFIX -> MEDIA_ROOT) ou 'x-sendfile' (Apache) ;
+# sans serveur frontal, Django diffuse le fichier par blocs (Range, ETag).
+PROTECTED_DOWNLOADS = {
+    'BACKEND': os.environ.get('PROTECTED_DOWNLOADS_BACKEND') or None,
+    'INTERNAL_PREFIX': '/media-protege/',
+    'CHUNK_SIZE': 64 * 1024,
+}
+
+# Projection du portefeuille accepté (loans.portefeuille) : lecture par blocs, résultat en cache
+# jusqu'au prochain changement de statut
+PORTFOLIO_PROJECTION = {
+    'CHUNK_SIZE': 2000,       # prêts par bloc ; mémoire ~ CHUNK_SIZE x HORIZON x 8 octets par tableau
+    'HORIZON': 360,           # mois projetés par défaut
+    'MAX_HORIZON': 600,
+    'CACHE_TIMEOUT': 24 * 60 * 60,
+}
+
+# Recherche plein texte des demandes (loans.recherche) : FTS5 sous SQLite, index inversé sinon
+SEARCH_INDEX = {
+    'BACKEND': 'auto',        # 'auto', 'fts5' ou 'table'
+    'MAX_RESULTS': 1000,      # résultats classés au plus par recherche (endpoint)
+    'RANK_WINDOW': 2000,      # correspondances classées par bm25 (FTS5)
+    'MAX_TERMS': 8,
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -157,8 +219,8 @@ AUTH_USER_MODEL = 'users.User' # Indique à Django d'utiliser notre modèle User
 # --- Django REST Framework Settings ---
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'oauth2_provider.contrib.rest_framework.OAuth2Authentication', # Pour OAuth2 (social login)
-        'rest_framework_simplejwt.authentication.JWTAuthentication', # Pour JWT (login classique)
+        # JWT (login classique, utilisateur mis en cache) ou jeton opaque OAuth2 (social login), selon la forme du jeton
+        'users.authentication.AuthentificationParTypeDeJeton',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated', # Par défaut, toutes les vues nécessitent une authentification
@@ -176,7 +238,37 @@ REST_FRAMEWORK = {
 
 
 
+# --- Flux SSE des messages (api/messagerie/flux/, servi en ASGI) ---
+MESSAGE_STREAM = {
+    'POLL_INTERVAL': 1.0,        # une lecture de la base par intervalle pour tous les clients du processus
+    'HEARTBEAT_INTERVAL': 15.0,
+    'MAX_BACKLOG': 500,          # messages renvoyés par lot lors d'une reprise (Last-Event-ID)
+    'QUEUE_SIZE': 100,
+    # Ticket d'ouverture (POST api/messagerie/flux/ticket/), à usage unique ; stocké dans le cache
+    # par défaut, qui doit être partagé (Redis, memcached) si plusieurs processus servent le flux
+    'TICKET_TTL': 30,
+}
+
+
 # --- Simple JWT Settings ---
+# Cache des utilisateurs authentifiés par JWT (users.authentication), par processus
+AUTH_USER_CACHE = {
+    'MAX_SIZE': 10000,
+    'TTL': 60,  # secondes ; borne la propagation d'une désactivation faite par un autre processus
+}
+
+# Jetons révoqués : purge par lots des jetons expirés et filtre de Bloom en mémoire (users.liste_noire)
+TOKEN_BLACKLIST = {
+    'PURGE_BATCH_SIZE': 1000,
+    'PURGE_PAUSE': 0.05,          # secondes entre deux lots
+    'BLOOM_CAPACITY': 100000,
+    'BLOOM_ERROR_RATE': 0.001,
+    'REBUILD_INTERVAL': 3600,     # reconstruction complète (écarte les jetons purgés)
+    # Révocations des autres processus relues à chaque contrôle (id > dernier connu). Un intervalle (s)
+    # les espace, mais un jeton révoqué ailleurs reste alors accepté jusqu'à ce délai (rejeu possible)
+    'SYNC_INTERVAL': 0,
+}
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60), # Durée de vie du token d'accès
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),    # Augmenté pour la commodité, à ajuster
@@ -203,6 +295,7 @@ SIMPLE_JWT = {
     'TOKEN_USER_CLASS': 'rest_framework_simplejwt.models.TokenUser',
 
     'JTI_CLAIM': 'jti',
+    'TOKEN_REFRESH_SERIALIZER': 'users.serializers.TokenRefreshFiltreSerializer',
 
     'SLIDING_TOKEN_REFRESH_EXP_CLAIM': 'refresh_exp',
     'SLIDING_TOKEN_LIFETIME': timedelta(minutes=5),
@@ -230,8 +323,8 @@ AUTHENTICATION_BACKENDS = (
     'social_core.backends.google.GoogleOAuth2',
     # Django-rest-framework-social-oauth2 (utilise un backend OAuth2 générique pour les tokens)
     'drf_social_oauth2.backends.DjangoOAuth2',
-    # Django ModelBackend (pour l'authentification classique par nom d'utilisateur/mot de passe)
-    'django.contrib.auth.backends.ModelBackend',
+    # Authentification classique : nom d'utilisateur ou e-mail et mot de passe (une requête, un hachage)
+    'users.backends.EmailOuNomUtilisateurBackend',
 )
 
 # Clés d'API Google (TRÈS IMPORTANT !)
@@ -263,7 +356,10 @@ SOCIAL_AUTH_PIPELINE = (
 # --- Configuration Email ---
 # Pour le développement, voir les emails dans la console
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Remplaçable sans toucher au code, ex. EMAIL_BACKEND=django.core.mail.backends.console.EmailBackend
+# ou django.core.mail.backends.filebased.EmailBackend (avec EMAIL_FILE_PATH)
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = os.environ.get('EMAIL_FILE_PATH', os.path.join(BASE_DIR, 'emails_envoyes'))
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587             # Port standard pour le chiffrement TLS (STARTTLS)
 EMAIL_USE_TLS = True         # Active le chiffrement TLS
@@ -274,6 +370,15 @@ EMAIL_HOST_PASSWORD = 'exdx huxd gkli bbdb' # Le mot de passe de 16 caractères
 DEFAULT_FROM_EMAIL = 'Pret <ddavidotis@gmail.com>' # L'adresse d'envoi visible pour les destinataires
 SERVER_EMAIL = DEFAULT_FROM_EMAIL # Email pour les messages d'erreur du serveur Django
 
+# Les e-mails applicatifs passent par une file (users.EmailSortant) vidée par `manage.py envoyer_emails`
+EMAIL_OUTBOX = {
+    'BATCH_SIZE': 50,        # e-mails envoyés par connexion SMTP
+    'MAX_ATTEMPTS': 5,       # au-delà, l'e-mail est marqué « abandonné »
+    'RETRY_DELAY': 60,       # secondes avant le 1er nouvel essai, doublé ensuite
+    'MAX_RETRY_DELAY': 3600,
+    'LEASE': 300,            # secondes avant qu'un lot réservé par un processus interrompu soit repris
+}
+
 # N'oubliez pas le SECRET_KEY dans votre settings.py, il est essentiel pour JWT et les tokens d'activation
 # SECRET_KEY = '...'
 
@@ -0,0 +1,104 @@
+"""
+Balise {% date_hierarchy_indexee cl %} des listes de l'admin pour les grandes tables
+(gabarit admin/change_list_grande_table.html, cf. Pret.admin.GrandeTableAdminMixin).
+
+La balise date_hierarchy de Django calcule ses bornes par un MIN et un MAX combinés et ses
+choix par un SELECT DISTINCT sur la date tronquée : deux parcours complets de la table. Ici
+les bornes sont deux lectures d'index séparées et chaque période proposée (au plus 31 jours,
+12 mois ou une par année couverte) est vérifiée par un EXISTS borné ; le rendu reste celui de Django.
+"""
+import datetime
+
+from django import template
+from django.contrib.admin.templatetags.admin_list import date_hierarchy
+from django.contrib.admin.templatetags.base import InclusionAdminNode
+from django.utils import timezone
+
+register = template.Library()
+
+
+def _debut_periode(valeur, periode):
+    if periode == 'year':
+        return valeur.replace(month=1, day=1)
+    if periode == 'month':
+        return valeur.replace(day=1)
+    return valeur
+
+
+def _periode_suivante(debut, periode):
+    if periode == 'year':
+        return debut.replace(year=debut.year + 1)
+    if periode == 'month':
+        return (debut + datetime.timedelta(days=32)).replace(day=1)
+    return debut + datetime.timedelta(days=1)
+
+
+class _DatesIndexees:
+    """Répond aux seuls appels de date_hierarchy sur cl.queryset (aggregate, dates, datetimes)."""
+
+    def __init__(self, queryset, champ):
+        self.queryset = queryset.filter(**{f'{champ}__isnull': False}).order_by()
+        self.champ = champ
+        self._bornes = None
+
+    def bornes(self):
+        if self._bornes is None:
+            valeurs = self.queryset.values_list(self.champ, flat=True)
+            self._bornes = (valeurs.order_by(self.champ).first(), valeurs.order_by(f'-{self.champ}').first())
+        return self._bornes
+
+    def aggregate(self, **agregats):
+        premier, dernier = self.bornes()
+        return {'first': premier, 'last': dernier}
+
+    def dates(self, champ, periode):
+        return self._periodes(periode, avec_heure=False)
+
+    def datetimes(self, champ, periode):
+        return self._periodes(periode, avec_heure=True)
+
+    def _periodes(self, periode, avec_heure):
+        premier, dernier = self.bornes()
+        if premier is None:
+            return []
+        if avec_heure:
+            premier, dernier = (
+                timezone.localtime(valeur).date() if timezone.is_aware(valeur) else valeur.date()
+                for valeur in (premier, dernier)
+            )
+        periodes = []
+        debut = _debut_periode(premier, periode)
+        while debut <= dernier:
+            fin = _periode_suivante(debut, periode)
+            bornes = (debut, fin)
+            if avec_heure:
+                bornes = tuple(timezone.make_aware(datetime.datetime.combine(jour, datetime.time())) for jour in bornes)
+            # Bornes de la période en tête du WHERE : SQLite n'utilise qu'un intervalle par colonne pour
+            # parcourir l'index, le premier rencontré (sinon celui de l'année déjà sélectionnée, bien plus large)
+            periode_seule = self.queryset.model._default_manager.filter(
+                **{f'{self.champ}__gte': bornes[0], f'{self.champ}__lt': bornes[1]}
+            )
+            if (periode_seule & self.queryset).exists():
+                periodes.append(bornes[0])
+            debut = fin
+        return periodes
+
+
+class _ChangeListDatesIndexees:
+    def __init__(self, cl):
+        self._cl = cl
+        self.queryset = _DatesIndexees(cl.queryset, cl.date_hierarchy)
+
+    def __getattr__(self, nom):
+        return getattr(self._cl, nom)
+
+
+def date_hierarchy_indexee(cl):
+    return date_hierarchy(_ChangeListDatesIndexees(cl))
+
+
+@register.tag(name='date_hierarchy_indexee')
+def date_hierarchy_indexee_tag(parser, token):
+    return InclusionAdminNode(
+        parser, token, func=date_hierarchy_indexee, template_name='date_hierarchy.html', takes_context=False,
+    )
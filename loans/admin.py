@@ -1,24 +1,45 @@
 from django.contrib import admin
+
+from Pret.admin import GrandeTableAdminMixin
+from . import recherche
 from .models import DemandePret, TypePret, HistoriqueStatut
 
 
 @admin.register(DemandePret)
-class DemandePretAdmin(admin.ModelAdmin):
+class DemandePretAdmin(GrandeTableAdminMixin, admin.ModelAdmin):
     list_display = ('numero_dossier', 'fonctionnaire', 'type_pret', 'montant', 'statut', 'date_soumission')
-    list_filter = ('statut', 'type_pret', 'date_soumission')
-    search_fields = ('numero_dossier', 'fonctionnaire__email', 'fonctionnaire__cin_number')
+    list_filter = ('statut', 'type_pret')
+    list_select_related = ('fonctionnaire', 'type_pret')
+    date_hierarchy = 'date_soumission'  # index demande_date_idx
+    search_fields = ('numero_dossier', 'adresse_bien', 'fonctionnaire__email', 'fonctionnaire__cin_number')
+    autocomplete_fields = ('fonctionnaire', 'type_pret')
     readonly_fields = ('numero_dossier', 'date_soumission')
+    ordering = ('-date_soumission',)
 
     fields = ('fonctionnaire', 'type_pret', 'montant', 'duree_remboursement', 'adresse_bien', 'statut')
 
+    def get_search_results(self, request, queryset, search_term):
+        # Index plein texte (loans.recherche) plutôt que LIKE '%terme%' sur chaque champ de search_fields
+        if not search_term.strip():
+            return queryset, False
+        ids = recherche.sous_requete(search_term)
+        if ids is None:
+            return queryset.none(), False
+        return queryset.filter(pk__in=ids), False
+
 
 
 @admin.register(TypePret)
 class TypePretAdmin(admin.ModelAdmin):
-    list_display = ('nom', 'description')
+    list_display = ('nom', 'taux_annuel', 'description')
+    search_fields = ('nom',)
 
 
 @admin.register(HistoriqueStatut)
-class HistoriqueStatutAdmin(admin.ModelAdmin):
+class HistoriqueStatutAdmin(GrandeTableAdminMixin, admin.ModelAdmin):
     list_display = ('demande', 'statut', 'date_modification', 'commentaire')
-    list_filter = ('statut', 'date_modification')
+    list_filter = ('statut',)
+    list_select_related = ('demande__fonctionnaire',)  # DemandePret.__str__ lit l'e-mail du fonctionnaire
+    date_hierarchy = 'date_modification'  # index historique_date_idx
+    autocomplete_fields = ('demande',)
+    ordering = ('-date_modification',)
@@ -0,0 +1,64 @@
+"""
+Calcul des mensualités et des tableaux d'amortissement (prêts à échéances constantes),
+vectorisé avec NumPy : aucune boucle Python par mois ni par demande.
+"""
+import numpy as np
+
+PRECISION = 2  # montants arrondis au centime
+
+
+def _taux_mensuels(taux_annuels):
+    return np.asarray(taux_annuels, dtype=float) / 1200
+
+
+def mensualites(montants, taux_annuels, durees):
+    """Mensualités constantes pour des tableaux de montants, de taux annuels (%) et de durées (mois)."""
+    montants = np.asarray(montants, dtype=float)
+    durees = np.asarray(durees, dtype=float)
+    taux = _taux_mensuels(taux_annuels)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        annuites = montants * taux / -np.expm1(-durees * np.log1p(taux))
+    return np.round(np.where(taux == 0, montants / durees, annuites), PRECISION)
+
+
+def echeancier(montant, taux_annuel, duree):
+    """
+    Tableau d'amortissement complet d'un prêt : colonnes numero, echeance, interets, capital
+    et capital_restant (tableaux NumPy de longueur `duree`). Le capital remboursé est l'écart
+    entre deux soldes arrondis : il totalise exactement le montant prêté, les échéances
+    pouvant varier d'un centime autour de la mensualité.
+    """
+    taux = float(taux_annuel) / 1200
+    montant = float(montant)
+    mensualite = float(mensualites(montant, taux_annuel, duree))
+    periodes = np.arange(duree + 1)
+    # Solde après k échéances, forme fermée : B(k) = P(1+r)^k - A((1+r)^k - 1) / r
+    if taux:
+        croissance = np.power(1 + taux, periodes)
+        soldes = montant * croissance - mensualite * (croissance - 1) / taux
+    else:
+        soldes = montant - mensualite * periodes
+    soldes = np.round(np.maximum(soldes, 0), PRECISION)
+    soldes[0], soldes[-1] = montant, 0
+    interets = np.round(soldes[:-1] * taux, PRECISION)
+    capital = np.round(soldes[:-1] - soldes[1:], PRECISION)
+    return {
+        'numero': periodes[1:],
+        'echeance': np.round(capital + interets, PRECISION),
+        'interets': interets,
+        'capital': capital,
+        'capital_restant': soldes[1:],
+    }
+
+
+def synthese(montants, taux_annuels, durees):
+    """Mensualité, coût total et intérêts totaux de nombreuses demandes en un seul calcul."""
+    montants = np.asarray(montants, dtype=float)
+    durees = np.asarray(durees, dtype=float)
+    mensuel = mensualites(montants, taux_annuels, durees)
+    cout_total = np.round(mensuel * durees, PRECISION)
+    return {
+        'mensualite': mensuel,
+        'cout_total': cout_total,
+        'interets_totaux': np.round(cout_total - montants, PRECISION),
+    }
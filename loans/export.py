@@ -0,0 +1,80 @@
+import csv
+import datetime
+import decimal
+import json
+
+from django.db.models import OuterRef, Subquery
+
+from .models import DemandePret, HistoriqueStatut
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+# (nom de colonne, chemin ORM)
+COLONNES = [
+    ('numero_dossier', 'numero_dossier'),
+    ('date_soumission', 'date_soumission'),
+    ('statut', 'statut'),
+    ('montant', 'montant'),
+    ('duree_remboursement', 'duree_remboursement'),
+    ('adresse_bien', 'adresse_bien'),
+    ('type_pret', 'type_pret__nom'),
+    ('fonctionnaire_email', 'fonctionnaire__email'),
+    ('fonctionnaire_nom', 'fonctionnaire__last_name'),
+    ('fonctionnaire_prenom', 'fonctionnaire__first_name'),
+    ('fonctionnaire_cin', 'fonctionnaire__cin_number'),
+    ('dernier_statut', 'dernier_statut'),
+    ('dernier_statut_date', 'dernier_statut_date'),
+    ('dernier_statut_commentaire', 'dernier_statut_commentaire'),
+]
+
+TAILLE_PAQUET = 2000
+
+
+def demandes_a_exporter(queryset=None):
+    """Tuples prêts à écrire, lus par paquets : la mémoire ne dépend pas de la taille de la table."""
+    if queryset is None:
+        queryset = DemandePret.objects.all()
+    dernier = HistoriqueStatut.objects.filter(demande=OuterRef('pk')).order_by('-date_modification', '-id')
+    return (
+        queryset
+        .annotate(
+            dernier_statut=Subquery(dernier.values('statut')[:1]),
+            dernier_statut_date=Subquery(dernier.values('date_modification')[:1]),
+            dernier_statut_commentaire=Subquery(dernier.values('commentaire')[:1]),
+        )
+        .order_by('date_soumission', 'id')
+        .values_list(*(chemin for _, chemin in COLONNES))
+        .iterator(chunk_size=TAILLE_PAQUET)
+    )
+
+
+def _valeur(valeur):
+    if isinstance(valeur, (datetime.date, datetime.datetime)):
+        return valeur.isoformat()
+    if isinstance(valeur, decimal.Decimal):
+        return str(valeur)
+    return valeur
+
+
+class _Echo:
+    # Pseudo-fichier : csv.writer renvoie directement la ligne formatée
+    def write(self, valeur):
+        return valeur
+
+
+def lignes_export(format_export, queryset=None):
+    noms = [nom for nom, _ in COLONNES]
+    lignes = demandes_a_exporter(queryset)
+    if format_export == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(noms)
+        for ligne in lignes:
+            yield writer.writerow([_valeur(v) for v in ligne])
+    elif format_export == 'jsonl':
+        for ligne in lignes:
+            yield json.dumps(dict(zip(noms, map(_valeur, ligne))), ensure_ascii=False) + '\n'
+    else:
+        raise ValueError(f"Format d'export inconnu : {format_export}")
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from Pret.database import MODE_JOURNAL, activer_wal
+
+
+class Command(BaseCommand):
+    help = (
+        "Passe la base SQLite en mode WAL (lecteurs et rédacteur concurrents). Le mode est enregistré "
+        "dans le fichier de la base : à lancer une fois par base, au déploiement."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connexion = connections[options['database']]
+        if connexion.vendor != 'sqlite':
+            raise CommandError(f"La base '{options['database']}' n'est pas une base SQLite.")
+        mode = activer_wal(connexion)
+        if mode.upper() != MODE_JOURNAL:
+            raise CommandError(f"Mode de journal obtenu : {mode} (base en mémoire ?).")
+        self.stdout.write(f"Base '{options['database']}' en mode {mode.upper()}.")
@@ -0,0 +1,28 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from loans.export import FORMATS, lignes_export
+from loans.models import DemandePret
+
+
+class Command(BaseCommand):
+    help = "Exporte les demandes de prêt (avec le dernier statut de l'historique) en CSV ou JSONL."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv', dest='format_export')
+        parser.add_argument('--sortie', help="Fichier de destination (sortie standard par défaut).")
+        parser.add_argument('--statut', choices=[code for code, _ in DemandePret.STATUT_CHOICES])
+
+    def handle(self, *args, **options):
+        queryset = DemandePret.objects.all()
+        if options['statut']:
+            queryset = queryset.filter(statut=options['statut'])
+
+        sortie = open(options['sortie'], 'w', encoding='utf-8', newline='') if options['sortie'] else sys.stdout
+        try:
+            for ligne in lignes_export(options['format_export'], queryset):
+                sortie.write(ligne)
+        finally:
+            if options['sortie']:
+                sortie.close()
@@ -0,0 +1,70 @@
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from loans.amortissement import echeancier, synthese
+
+
+def echeancier_python(montant, taux_annuel, duree):
+    # Référence : calcul mois par mois, tel qu'on le ferait à la main
+    taux = taux_annuel / 1200
+    mensualite = round(montant * taux / (1 - (1 + taux) ** -duree), 2) if taux else round(montant / duree, 2)
+    solde = montant
+    lignes = []
+    for numero in range(1, duree + 1):
+        interets = round(solde * taux, 2)
+        capital = round(mensualite - interets, 2) if numero < duree else solde
+        solde = round(solde - capital, 2)
+        lignes.append((numero, round(capital + interets, 2), interets, capital, solde))
+    return mensualite, lignes
+
+
+def synthese_python(montants, taux_annuels, durees):
+    resultats = []
+    for montant, taux_annuel, duree in zip(montants, taux_annuels, durees):
+        mensualite, lignes = echeancier_python(montant, taux_annuel, duree)
+        cout_total = round(sum(ligne[1] for ligne in lignes), 2)
+        resultats.append((mensualite, cout_total, round(cout_total - montant, 2)))
+    return resultats
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare le moteur d'amortissement NumPy (loans.amortissement) à une boucle Python mois par mois, "
+        "sur un portefeuille synthétique : tarification par lot, puis échéancier d'une demande."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--demandes', type=int, default=10000)
+        parser.add_argument('--repetitions', type=int, default=5)
+        parser.add_argument('--graine', type=int, default=0)
+
+    def handle(self, *args, **options):
+        generateur = random.Random(options['graine'])
+        nombre = options['demandes']
+        montants = [round(generateur.uniform(10000, 2000000), 2) for _ in range(nombre)]
+        taux = [generateur.choice((0, 2.5, 4.75, 6, 8.5, 12)) for _ in range(nombre)]
+        durees = [generateur.randrange(12, 301) for _ in range(nombre)]
+
+        def chronometrer(fonction, *arguments):
+            debut = time.perf_counter()
+            for _ in range(options['repetitions']):
+                resultat = fonction(*arguments)
+            return (time.perf_counter() - debut) / options['repetitions'], resultat
+
+        duree_python, reference = chronometrer(synthese_python, montants, taux, durees)
+        duree_numpy, resultat = chronometrer(synthese, montants, taux, durees)
+        ecart = np.abs(resultat['mensualite'] - np.array([ligne[0] for ligne in reference])).max()
+        self.stdout.write(
+            f"lot de {nombre} demandes   python {duree_python * 1000:9.2f} ms  numpy {duree_numpy * 1000:8.2f} ms  "
+            f"(x{duree_python / max(duree_numpy, 1e-9):.1f})  écart max mensualité {ecart:.2f}"
+        )
+
+        duree_python, _ = chronometrer(echeancier_python, 1500000.0, 4.75, 300)
+        duree_numpy, _ = chronometrer(echeancier, 1500000.0, 4.75, 300)
+        self.stdout.write(
+            f"échéancier de 300 mois  python {duree_python * 1000:9.2f} ms  numpy {duree_numpy * 1000:8.2f} ms  "
+            f"(x{duree_python / max(duree_numpy, 1e-9):.1f})"
+        )
@@ -0,0 +1,118 @@
+import os
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+
+from Pret.database import configurer_base
+
+PROFILS = {
+    # DATABASES d'origine : journal par défaut, transactions DEFERRED, une connexion par requête
+    'defaut': lambda nom: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': nom, 'CONN_MAX_AGE': 0},
+    'production': lambda nom: configurer_base({'ENGINE': 'django.db.backends.sqlite3', 'NAME': nom}, conn_max_age=600, wal=True),
+}
+
+SCHEMA = (
+    "CREATE TABLE mesure_demande (id INTEGER PRIMARY KEY, fonctionnaire INTEGER, montant REAL, date TEXT)",
+    "CREATE TABLE mesure_message (id INTEGER PRIMARY KEY, demande INTEGER, contenu TEXT, date TEXT)",
+    "CREATE INDEX mesure_message_demande ON mesure_message (demande, id)",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le débit de lectures et d'écritures concurrentes (soumissions de demandes et messages) "
+        "et les erreurs « database is locked », avec la configuration SQLite d'origine puis le profil de "
+        "production. Chaque mesure utilise une base temporaire."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--redacteurs', type=int, default=4)
+        parser.add_argument('--lecteurs', type=int, default=8)
+        parser.add_argument('--duree', type=float, default=5.0, help="Durée (s) de chaque mesure.")
+        parser.add_argument('--profil', choices=sorted(PROFILS), action='append', help="Par défaut : tous.")
+
+    def handle(self, *args, **options):
+        for nom in options['profil'] or PROFILS:
+            with tempfile.TemporaryDirectory() as dossier:
+                resultat = self.mesurer(nom, os.path.join(dossier, 'mesure.sqlite3'), options)
+            self.stdout.write(
+                f"{nom:<11} écritures {resultat['ecritures'] / options['duree']:8.1f}/s  "
+                f"lectures {resultat['lectures'] / options['duree']:8.1f}/s  "
+                f"verrous {resultat['verrous']:5d}  connexions ouvertes {resultat['connexions']:6d}"
+            )
+
+    def mesurer(self, nom, chemin, options):
+        alias = f'mesure_{nom}'
+        configuree = connections.configure_settings({'default': connections.settings['default'], alias: PROFILS[nom](chemin)})
+        connections.settings[alias] = configuree[alias]
+        compteurs = {'ecritures': 0, 'lectures': 0, 'verrous': 0, 'connexions': 0}
+        verrou = threading.Lock()
+        try:
+            with connections[alias].cursor() as curseur:
+                for instruction in SCHEMA:
+                    curseur.execute(instruction)
+            connections[alias].close()
+
+            fin = time.monotonic() + options['duree']
+            travailleurs = (
+                [threading.Thread(target=self.travailler, args=(alias, self.ecrire, 'ecritures', fin, compteurs, verrou)) for _ in range(options['redacteurs'])]
+                + [threading.Thread(target=self.travailler, args=(alias, self.lire, 'lectures', fin, compteurs, verrou)) for _ in range(options['lecteurs'])]
+            )
+            for travailleur in travailleurs:
+                travailleur.start()
+            for travailleur in travailleurs:
+                travailleur.join()
+        finally:
+            connections[alias].close()
+            del connections.settings[alias]
+        return compteurs
+
+    def travailler(self, alias, operation, compteur, fin, compteurs, verrou):
+        connexion = connections[alias]
+        faites = verrous = ouvertes = 0
+        try:
+            while time.monotonic() < fin:
+                if connexion.connection is None:
+                    ouvertes += 1
+                try:
+                    operation(alias)
+                    faites += 1
+                except OperationalError as erreur:
+                    if 'locked' not in str(erreur) and 'busy' not in str(erreur):
+                        raise
+                    verrous += 1
+                # Fin de « requête » : même traitement que le signal request_finished
+                connexion.close_if_unusable_or_obsolete()
+        finally:
+            connexion.close()
+            with verrou:
+                compteurs[compteur] += faites
+                compteurs['verrous'] += verrous
+                compteurs['connexions'] += ouvertes
+
+    def ecrire(self, alias):
+        # Lecture puis écriture dans la même transaction, comme une soumission qui vérifie l'existant
+        with transaction.atomic(using=alias), connections[alias].cursor() as curseur:
+            curseur.execute("SELECT COUNT(*) FROM mesure_demande WHERE fonctionnaire = %s", [threading.get_ident() % 100])
+            curseur.execute(
+                "INSERT INTO mesure_demande (fonctionnaire, montant, date) VALUES (%s, %s, datetime('now'))",
+                [threading.get_ident() % 100, 150000.0],
+            )
+            demande = curseur.lastrowid
+            curseur.executemany(
+                "INSERT INTO mesure_message (demande, contenu, date) VALUES (%s, %s, datetime('now'))",
+                [(demande, 'Pièces complémentaires envoyées.'), (demande, 'Dossier reçu.')],
+            )
+
+    def lire(self, alias):
+        with connections[alias].cursor() as curseur:
+            curseur.execute("SELECT MAX(id) FROM mesure_demande")
+            dernier = curseur.fetchone()[0] or 0
+            curseur.execute(
+                "SELECT id, contenu, date FROM mesure_message WHERE demande >= %s ORDER BY id DESC LIMIT 20",
+                [max(dernier - 10, 0)],
+            )
+            curseur.fetchall()
@@ -0,0 +1,46 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand
+
+from loans.portefeuille import projection, projeter
+
+COLONNES = ('mois', 'encaissements', 'interets', 'capital', 'encours', 'prets_actifs')
+
+
+class Command(BaseCommand):
+    help = (
+        "Projette les encaissements mensuels (intérêts et capital) et l'encours de tous les prêts acceptés. "
+        "Par défaut le résultat est lu et mis en cache comme pour l'endpoint d'administration."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horizon', type=int, help="Nombre de mois projetés.")
+        parser.add_argument('--taille-bloc', type=int, help="Prêts lus et projetés par bloc.")
+        parser.add_argument('--sans-cache', action='store_true', help="Recalcule sans lire ni alimenter le cache.")
+        parser.add_argument('--csv', action='store_true', help="Écrit la projection en CSV sur la sortie standard.")
+
+    def handle(self, *args, **options):
+        debut = time.perf_counter()
+        if options['sans_cache'] or options['taille_bloc']:
+            resultat = projeter(options['horizon'], taille_bloc=options['taille_bloc'])
+        else:
+            resultat = projection(options['horizon'])
+        duree = time.perf_counter() - debut
+
+        if options['csv']:
+            redacteur = csv.DictWriter(self.stdout, fieldnames=COLONNES, lineterminator='\n')
+            redacteur.writeheader()
+            redacteur.writerows(resultat['projection'])
+            return
+        for ligne in resultat['projection']:
+            if not ligne['prets_actifs'] and not ligne['encours']:
+                continue
+            self.stdout.write(
+                f"{ligne['mois']}  encaissements {ligne['encaissements']:16,.2f}  intérêts {ligne['interets']:14,.2f}  "
+                f"capital {ligne['capital']:16,.2f}  encours {ligne['encours']:18,.2f}  prêts {ligne['prets_actifs']:7d}"
+            )
+        self.stdout.write(
+            f"{resultat['nombre_prets']} prêt(s) accepté(s), {resultat['montant_total']:,.2f} empruntés, "
+            f"{resultat['horizon']} mois à partir de {resultat['mois_depart']} en {duree:.2f} s."
+        )
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from loans import statistiques
+from loans.models import StatistiqueDemande
+
+
+class Command(BaseCommand):
+    help = "Recalcule entièrement le tableau de bord (StatistiqueDemande) à partir des demandes."
+
+    def handle(self, *args, **options):
+        statistiques.recalculer()
+        self.stdout.write(f"{StatistiqueDemande.objects.count()} ligne(s) de statistiques recalculée(s).")
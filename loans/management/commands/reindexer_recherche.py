@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from loans import recherche
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruit l'index de recherche des demandes (FTS5 ou index inversé selon la base), "
+        "par exemple après un import en masse qui contourne les signaux."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--taille-lot', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        total = recherche.reindexer(options['taille_lot'])
+        self.stdout.write(f"{total} demande(s) indexée(s) ({recherche.backend()}).")
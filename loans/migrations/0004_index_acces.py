@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0003_delete_piecejointe'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='demandepret',
+            index=models.Index(fields=['fonctionnaire', 'date_soumission', 'id'], name='demande_fonct_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='demandepret',
+            index=models.Index(fields=['date_soumission', 'id'], name='demande_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='demandepret',
+            index=models.Index(fields=['statut', 'date_soumission', 'id'], name='demande_statut_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='demandepret',
+            index=models.Index(fields=['type_pret', 'date_soumission', 'id'], name='demande_type_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historiquestatut',
+            index=models.Index(fields=['demande', 'date_modification', 'id'], name='historique_demande_date_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:07
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def remplir_statistiques(apps, schema_editor):
+    # Copie figée de loans.statistiques.calculer_lignes : la migration ne dépend pas du code courant
+    DemandePret = apps.get_model('loans', 'DemandePret')
+    StatistiqueDemande = apps.get_model('loans', 'StatistiqueDemande')
+    demandes = DemandePret.objects.using(schema_editor.connection.alias).order_by()
+    agregats = {'nombre': Count('id'), 'montant_total': Sum('montant')}
+    lignes = []
+    for ligne in demandes.values('statut').annotate(**agregats):
+        lignes.append(('statut', ligne['statut'], ligne['nombre'], ligne['montant_total']))
+    for ligne in demandes.values('type_pret_id').annotate(**agregats):
+        cle = str(ligne['type_pret_id']) if ligne['type_pret_id'] else 'aucun'
+        lignes.append(('type_pret', cle, ligne['nombre'], ligne['montant_total']))
+    for ligne in demandes.annotate(mois=TruncMonth('date_soumission')).values('mois').annotate(**agregats):
+        lignes.append(('mois', ligne['mois'].strftime('%Y-%m'), ligne['nombre'], ligne['montant_total']))
+    StatistiqueDemande.objects.using(schema_editor.connection.alias).bulk_create([
+        StatistiqueDemande(dimension=dimension, cle=cle, nombre=nombre, montant_total=montant or 0)
+        for dimension, cle, nombre, montant in lignes
+    ])
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0004_index_acces'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatistiqueDemande',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('statut', 'Statut'), ('type_pret', 'Type de prêt'), ('mois', 'Mois de soumission')], max_length=20)),
+                ('cle', models.CharField(max_length=50)),
+                ('nombre', models.IntegerField(default=0)),
+                ('montant_total', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'cle'), name='statistique_dimension_cle_unique')],
+            },
+        ),
+        migrations.RunPython(remplir_statistiques, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0005_statistiquedemande'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompteurDossier',
+            fields=[
+                ('jour', models.DateField(primary_key=True, serialize=False)),
+                ('dernier', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0006_compteurdossier'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='typepret',
+            name='taux_annuel',
+            field=models.DecimalField(decimal_places=4, default=0, help_text='Taux nominal annuel en %', max_digits=6),
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:43
+
+import re
+import unicodedata
+from collections import Counter
+
+import django.db.models.deletion
+from django.db import OperationalError, migrations, models
+
+# Copie figée de loans.recherche au moment de la migration : la migration ne dépend pas du code courant
+TABLE_FTS = 'loans_demande_fts'
+CHAMPS = ('numero_dossier', 'adresse_bien', 'fonctionnaire__email', 'fonctionnaire__cin_number')
+TOKENIZER_FTS = 'unicode61 remove_diacritics 2'
+PREFIXES_FTS = '2 3'
+TAILLE_LOT = 2000
+_MOT = re.compile(r'[^\W_]+')
+
+
+def termes(texte):
+    sans_accents = ''.join(
+        caractere for caractere in unicodedata.normalize('NFKD', texte or '') if not unicodedata.combining(caractere)
+    )
+    return [mot[:100] for mot in _MOT.findall(sans_accents.lower())]
+
+
+def termes_indexes(texte):
+    for mot in (texte or '').split():
+        parties = termes(mot)
+        yield from parties
+        if len(parties) > 1:
+            yield ' '.join(parties)[:100]
+
+
+def lots_de_documents(DemandePret, alias):
+    """Documents (pk, champs...) par lots, en parcourant la clé primaire (pas de chargement de toute la table)."""
+    demandes = DemandePret.objects.using(alias).order_by('pk')
+    dernier = 0
+    while True:
+        lot = list(demandes.filter(pk__gt=dernier).values_list('pk', *CHAMPS)[:TAILLE_LOT])
+        if not lot:
+            return
+        yield lot
+        dernier = lot[-1][0]
+
+
+def creer_index(apps, schema_editor):
+    DemandePret = apps.get_model('loans', 'DemandePret')
+    TermeRecherche = apps.get_model('loans', 'TermeRecherche')
+    alias = schema_editor.connection.alias
+    if schema_editor.connection.vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE {TABLE_FTS} USING fts5(numero_dossier, adresse_bien, email, cin, tokenize='{TOKENIZER_FTS}', prefix='{PREFIXES_FTS}')"
+            )
+        except OperationalError:
+            pass  # SQLite compilé sans FTS5 : index de repli
+        else:
+            with schema_editor.connection.cursor() as curseur:
+                for lot in lots_de_documents(DemandePret, alias):
+                    curseur.executemany(
+                        f"INSERT INTO {TABLE_FTS} (rowid, numero_dossier, adresse_bien, email, cin) VALUES (%s, %s, %s, %s, %s)",
+                        [(pk, *(valeur or '' for valeur in valeurs)) for pk, *valeurs in lot],
+                    )
+            return
+    for lot in lots_de_documents(DemandePret, alias):
+        TermeRecherche.objects.using(alias).bulk_create([
+            TermeRecherche(demande_id=pk, terme=terme, occurrences=min(nombre, 32767))
+            for pk, *valeurs in lot
+            for terme, nombre in Counter(t for valeur in valeurs for t in termes_indexes(valeur)).items()
+        ], batch_size=1000)
+
+
+def supprimer_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {TABLE_FTS}")
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0007_typepret_taux_annuel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TermeRecherche',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('terme', models.CharField(max_length=100)),
+                ('occurrences', models.PositiveSmallIntegerField(default=1)),
+                ('demande', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='termes_recherche', to='loans.demandepret')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('terme', 'demande'), name='terme_demande_unique')],
+            },
+        ),
+        migrations.RunPython(creer_index, supprimer_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0008_recherche'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='historiquestatut',
+            index=models.Index(fields=['date_modification', 'id'], name='historique_date_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:50
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0009_index_admin'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='demandepret',
+            name='duree_remboursement',
+            field=models.IntegerField(help_text='Durée en mois', validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(600)]),
+        ),
+    ]
@@ -1,18 +1,78 @@
-import datetime
-from django.utils.crypto import get_random_string
-from django.db import models
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.utils import timezone
 from users.models import User
 
+DUREE_MAX_MOIS = 600  # 50 ans : borne aussi la taille des échéanciers calculés
 
 
 class TypePret(models.Model):
     nom = models.CharField(max_length=100)
     description = models.TextField(blank=True)
+    taux_annuel = models.DecimalField(max_digits=6, decimal_places=4, default=0, help_text="Taux nominal annuel en %")
 
     def __str__(self):
         return self.nom
 
 
+class CompteurDossierManager(models.Manager):
+    def reserver(self, nombre=1, jour=None):
+        """
+        Réserve `nombre` numéros consécutifs pour le jour donné et renvoie leur plage.
+        Une seule écriture (incrément atomique de la ligne du jour) : le verrou de la ligne
+        sérialise les attributions concurrentes, sans collision ni nouvel essai.
+        """
+        jour = jour or timezone.localdate()
+        with transaction.atomic(using=self.db):
+            compteur = self.filter(jour=jour)
+            if compteur.update(dernier=F('dernier') + nombre):
+                dernier = compteur.values_list('dernier', flat=True).get()
+            else:
+                try:
+                    with transaction.atomic(using=self.db):
+                        dernier = self.create(jour=jour, dernier=nombre).dernier
+                except IntegrityError:
+                    # Ligne du jour créée entre-temps par une autre attribution
+                    compteur.update(dernier=F('dernier') + nombre)
+                    dernier = compteur.values_list('dernier', flat=True).get()
+        return range(dernier - nombre + 1, dernier + 1)
+
+
+class CompteurDossier(models.Model):
+    """Dernier numéro de dossier attribué pour chaque jour (numéros PRT-AAAAMMJJ-NNNNN denses et ordonnés)."""
+    jour = models.DateField(primary_key=True)
+    dernier = models.PositiveIntegerField(default=0)
+
+    objects = CompteurDossierManager()
+
+    def __str__(self):
+        return f"{self.jour:%Y%m%d} : {self.dernier}"
+
+
+def format_numero_dossier(jour, numero):
+    return f"PRT-{jour:%Y%m%d}-{numero:05d}"
+
+
+def attribuer_numeros_dossier(demandes, jour=None):
+    """Numérote en un bloc les demandes qui n'ont pas encore de numéro (imports, bulk_create)."""
+    sans_numero = [demande for demande in demandes if not demande.numero_dossier]
+    if sans_numero:
+        jour = jour or timezone.localdate()
+        for demande, numero in zip(sans_numero, CompteurDossier.objects.reserver(len(sans_numero), jour)):
+            demande.numero_dossier = format_numero_dossier(jour, numero)
+    return demandes
+
+
+class DemandePretQuerySet(models.QuerySet):
+    def avec_relations(self):
+        # Charge en une passe tout ce que DemandePretSerializer lit pour chaque ligne
+        return (
+            self.select_related('fonctionnaire', 'type_pret', 'compteur_non_lus')
+            .prefetch_related('pieces_jointes')
+        )
+
+
 class DemandePret(models.Model):
     STATUT_CHOICES = [
         ('soumis', 'Soumis'),
@@ -25,17 +85,44 @@ class DemandePret(models.Model):
     fonctionnaire = models.ForeignKey(User, on_delete=models.CASCADE, related_name="demandes")
     type_pret = models.ForeignKey(TypePret, on_delete=models.SET_NULL, null=True)
     montant = models.DecimalField(max_digits=12, decimal_places=2)
-    duree_remboursement = models.IntegerField(help_text="Durée en mois")
+    duree_remboursement = models.IntegerField(
+        help_text="Durée en mois", validators=[MinValueValidator(1), MaxValueValidator(DUREE_MAX_MOIS)]
+    )
     adresse_bien = models.TextField()
     statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='soumis')
     numero_dossier = models.CharField(max_length=100, unique=True)
     date_soumission = models.DateTimeField(auto_now_add=True)
 
+    objects = DemandePretQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # « mes demandes » : filtre par fonctionnaire, tri par date de soumission
+            models.Index(fields=['fonctionnaire', 'date_soumission', 'id'], name='demande_fonct_date_idx'),
+            # liste complète (admin) et date_hierarchy
+            models.Index(fields=['date_soumission', 'id'], name='demande_date_idx'),
+            # filtres de l'admin
+            models.Index(fields=['statut', 'date_soumission', 'id'], name='demande_statut_date_idx'),
+            models.Index(fields=['type_pret', 'date_soumission', 'id'], name='demande_type_date_idx'),
+        ]
+
+    # Valeurs dont dépendent les statistiques (loans.statistiques), mémorisées au chargement
+    # pour calculer l'écart au moment de l'enregistrement sans relire la ligne.
+    CHAMPS_STATISTIQUES = ('statut', 'type_pret_id', 'montant', 'date_soumission')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if all(champ in instance.__dict__ for champ in cls.CHAMPS_STATISTIQUES):
+            instance._etat_statistiques = instance.etat_statistiques()
+        return instance
+
+    def etat_statistiques(self):
+        return tuple(getattr(self, champ) for champ in self.CHAMPS_STATISTIQUES)
+
     def save(self, *args, **kwargs):
         if not self.numero_dossier:
-            today = datetime.date.today().strftime('%Y%m%d')
-            random_id = get_random_string(5).upper()
-            self.numero_dossier = f"PRT-{today}-{random_id}"
+            attribuer_numeros_dossier([self])
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -49,5 +136,51 @@ class HistoriqueStatut(models.Model):
     date_modification = models.DateTimeField(auto_now_add=True)
     commentaire = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['demande', 'date_modification', 'id'], name='historique_demande_date_idx'),
+            # liste de l'admin et date_hierarchy
+            models.Index(fields=['date_modification', 'id'], name='historique_date_idx'),
+        ]
+
     def __str__(self):
         return f"{self.demande.numero_dossier} - {self.statut}"
+
+
+
+class TermeRecherche(models.Model):
+    """Index inversé de repli (bases sans FTS5, voir loans.recherche) : un terme normalisé par demande."""
+    terme = models.CharField(max_length=100)
+    demande = models.ForeignKey(DemandePret, on_delete=models.CASCADE, related_name='termes_recherche')
+    occurrences = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            # sert aussi d'index pour les recherches par préfixe (terme >= x AND terme < x + '\uffff')
+            models.UniqueConstraint(fields=['terme', 'demande'], name='terme_demande_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.terme} -> {self.demande_id}"
+
+
+
+class StatistiqueDemande(models.Model):
+    DIMENSION_CHOICES = [
+        ('statut', 'Statut'),
+        ('type_pret', 'Type de prêt'),
+        ('mois', 'Mois de soumission'),
+    ]
+
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES)
+    cle = models.CharField(max_length=50)
+    nombre = models.IntegerField(default=0)
+    montant_total = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'cle'], name='statistique_dimension_cle_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.dimension}={self.cle} : {self.nombre}"
@@ -0,0 +1,173 @@
+"""
+Projection du portefeuille des prêts acceptés : encaissements mensuels attendus (intérêts et
+capital) et encours restant dû, agrégés sur toutes les demandes au statut « accepte ».
+
+Le portefeuille est lu par blocs (parcours de la clé primaire) sous forme de colonnes NumPy ;
+chaque bloc est projeté par une matrice demandes x mois puis ajouté aux totaux : la mémoire
+dépend de la taille du bloc et de l'horizon, pas du nombre de prêts.
+"""
+import hashlib
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .amortissement import PRECISION, mensualites
+from .models import DemandePret, HistoriqueStatut, TypePret
+
+
+def _portfolio_setting(nom):
+    defauts = {
+        'CHUNK_SIZE': 2000,
+        'HORIZON': 360,
+        'MAX_HORIZON': 600,
+        'CACHE_TIMEOUT': 24 * 60 * 60,
+    }
+    return getattr(settings, 'PORTFOLIO_PROJECTION', {}).get(nom, defauts[nom])
+
+
+def _indice_mois(date):
+    return date.year * 12 + date.month - 1
+
+
+def _libelle_mois(indice):
+    return f"{indice // 12:04d}-{indice % 12 + 1:02d}"
+
+
+def charger_par_blocs(taille_bloc=None):
+    """
+    Colonnes (montants, taux annuels, durées, mois d'acceptation) des prêts acceptés, bloc par bloc.
+    Le mois d'acceptation est celui du dernier passage au statut « accepte » dans l'historique,
+    à défaut le mois de soumission.
+    """
+    taille_bloc = taille_bloc or _portfolio_setting('CHUNK_SIZE')
+    # Sous-requête corrélée (index historique_demande_date_idx) plutôt qu'un GROUP BY sur la jointure :
+    # chaque bloc ne lit que ses propres lignes
+    acceptation = (
+        HistoriqueStatut.objects.filter(demande=OuterRef('pk'), statut='accepte')
+        .order_by('-date_modification', '-id').values('date_modification')[:1]
+    )
+    demandes = (
+        DemandePret.objects.filter(statut='accepte', duree_remboursement__gt=0)
+        .annotate(date_acceptation=Coalesce(Subquery(acceptation), 'date_soumission'))
+        .order_by('id')
+    )
+    fuseau = timezone.get_current_timezone()
+    dernier_id = 0
+    while True:
+        lignes = list(
+            demandes.filter(id__gt=dernier_id)
+            .values_list('id', 'montant', 'type_pret__taux_annuel', 'duree_remboursement', 'date_acceptation')[:taille_bloc]
+        )
+        if not lignes:
+            return
+        dernier_id = lignes[-1][0]
+        _, montants, taux, durees, dates = zip(*lignes)
+        yield (
+            np.array(montants, dtype=float),
+            np.array([t or 0 for t in taux], dtype=float),
+            np.array(durees, dtype=np.int64),
+            np.array([_indice_mois(date.astimezone(fuseau)) for date in dates], dtype=np.int64),
+        )
+
+
+def projeter(horizon=None, mois_depart=None, taille_bloc=None):
+    """
+    Projection mois par mois sur `horizon` mois à partir de `mois_depart` (par défaut le mois courant).
+    La première échéance d'un prêt tombe le mois qui suit son acceptation.
+    """
+    horizon = min(horizon or _portfolio_setting('HORIZON'), _portfolio_setting('MAX_HORIZON'))
+    depart = _indice_mois(mois_depart or timezone.localdate())
+    totaux = {cle: np.zeros(horizon) for cle in ('interets', 'capital', 'encours')}
+    totaux['prets_actifs'] = np.zeros(horizon, dtype=np.int64)
+    nombre = 0
+    montant_total = 0.0
+    # Colonnes -1 .. horizon-1 : la colonne -1 donne le solde avant le premier mois projeté
+    mois = np.arange(-1, horizon)
+
+    for montants, taux_annuels, durees, acceptations in charger_par_blocs(taille_bloc):
+        premieres = acceptations + 1 - depart  # indice (relatif) du mois de la première échéance
+        encore_dus = premieres + durees > 0
+        if not encore_dus.any():
+            continue
+        montants, taux_annuels, durees, premieres = (
+            colonne[encore_dus] for colonne in (montants, taux_annuels, durees, premieres)
+        )
+        nombre += len(montants)
+        montant_total += montants.sum()
+
+        taux = (taux_annuels / 1200)[:, None]
+        mensuel = mensualites(montants, taux_annuels, durees)[:, None]
+        # Nombre d'échéances payées à la fin de chaque mois
+        payees = np.clip(mois[None, :] - premieres[:, None] + 1, 0, durees[:, None])
+        croissance = np.power(1 + taux, payees)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            soldes = np.where(
+                taux > 0,
+                montants[:, None] * croissance - mensuel * (croissance - 1) / taux,
+                montants[:, None] - mensuel * payees,
+            )
+        soldes = np.where(payees >= durees[:, None], 0, np.maximum(soldes, 0))
+
+        avant, apres = soldes[:, :-1], soldes[:, 1:]
+        actifs = payees[:, 1:] > payees[:, :-1]
+        totaux['interets'] += np.where(actifs, avant * taux, 0).sum(axis=0)
+        totaux['capital'] += (avant - apres).sum(axis=0)
+        totaux['encours'] += apres.sum(axis=0)
+        totaux['prets_actifs'] += actifs.sum(axis=0)
+
+    interets = np.round(totaux['interets'], PRECISION)
+    capital = np.round(totaux['capital'], PRECISION)
+    return {
+        'mois_depart': _libelle_mois(depart),
+        'horizon': horizon,
+        'nombre_prets': nombre,
+        'montant_total': round(float(montant_total), PRECISION),
+        'projection': [
+            {
+                'mois': _libelle_mois(depart + i),
+                'encaissements': round(float(interets[i] + capital[i]), PRECISION),
+                'interets': float(interets[i]),
+                'capital': float(capital[i]),
+                'encours': round(float(totaux['encours'][i]), PRECISION),
+                'prets_actifs': int(totaux['prets_actifs'][i]),
+            }
+            for i in range(horizon)
+        ],
+    }
+
+
+def empreinte():
+    """
+    Empreinte des données dont dépend la projection : agrégat des prêts acceptés, dernier
+    changement de statut et taux des types de prêt.
+    L'agrégat porte sur le montant, la durée et le type de chaque prêt accepté, pondérés par
+    l'identifiant (un échange de valeurs entre deux prêts change aussi l'empreinte) : une
+    modification faite dans l'admin ou par QuerySet.update, sans signal, invalide le cache.
+    """
+    acceptes = DemandePret.objects.filter(statut='accepte').aggregate(
+        nombre=Count('id'),
+        montant_total=Sum('montant'),
+        duree_totale=Sum('duree_remboursement'),
+        montants_ponderes=Sum(F('id') * F('montant')),
+        durees_ponderees=Sum(F('id') * F('duree_remboursement')),
+        types_ponderes=Sum(F('id') * Coalesce('type_pret_id', 0)),
+    )
+    dernier_changement = HistoriqueStatut.objects.order_by('-id').values_list('id', flat=True).first()
+    taux = list(TypePret.objects.order_by('id').values_list('id', 'taux_annuel'))
+    return hashlib.sha256(repr((sorted(acceptes.items()), dernier_changement, taux)).encode()).hexdigest()
+
+
+def projection(horizon=None, mois_depart=None):
+    """projeter() mise en cache jusqu'au prochain changement des prêts acceptés (ou des taux)."""
+    horizon = min(horizon or _portfolio_setting('HORIZON'), _portfolio_setting('MAX_HORIZON'))
+    depart = _libelle_mois(_indice_mois(mois_depart or timezone.localdate()))
+    cle = f"portefeuille:projection:{empreinte()}:{depart}:{horizon}"
+    resultat = cache.get(cle)
+    if resultat is None:
+        resultat = projeter(horizon, mois_depart)
+        cache.set(cle, resultat, _portfolio_setting('CACHE_TIMEOUT'))
+    return resultat
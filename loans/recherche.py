@@ -0,0 +1,206 @@
+"""
+Index de recherche des demandes (numéro de dossier, adresse du bien, e-mail et CIN du fonctionnaire).
+
+Sous SQLite, table virtuelle FTS5 (classement bm25, recherche par préfixe) ; sur les autres bases,
+ou si FTS5 n'est pas disponible, index inversé TermeRecherche (un terme normalisé par demande,
+recherches par intervalle sur l'index unique). Dans les deux cas une recherche lit l'index, jamais
+la table des demandes en LIKE '%terme%'. L'index est tenu à jour par les signaux (loans.signals).
+"""
+import functools
+import re
+import unicodedata
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.expressions import RawSQL
+
+from .models import DemandePret, TermeRecherche
+
+TABLE_FTS = 'loans_demande_fts'
+CHAMPS = ('numero_dossier', 'adresse_bien', 'fonctionnaire__email', 'fonctionnaire__cin_number')
+# termes() suit les règles de découpage de ce tokenizer : lettres et chiffres, sans accents ni casse
+TOKENIZER_FTS = 'unicode61 remove_diacritics 2'
+PREFIXES_FTS = '2 3'  # index de préfixes : « lo* », « lom* » sans parcourir tout le vocabulaire
+_MOT = re.compile(r'[^\W_]+')
+
+
+def _search_setting(nom):
+    defauts = {
+        'BACKEND': 'auto',     # 'auto', 'fts5' ou 'table'
+        'MAX_RESULTS': 1000,
+        'RANK_WINDOW': 2000,
+        'MAX_TERMS': 8,
+    }
+    return getattr(settings, 'SEARCH_INDEX', {}).get(nom, defauts[nom])
+
+
+def termes(texte):
+    """Termes normalisés (minuscules, sans accents) d'un texte."""
+    sans_accents = ''.join(
+        caractere for caractere in unicodedata.normalize('NFKD', texte or '') if not unicodedata.combining(caractere)
+    )
+    return [mot[:100] for mot in _MOT.findall(sans_accents.lower())]
+
+
+def termes_indexes(texte):
+    """
+    Termes d'un texte pour l'index de repli : chaque terme, plus la forme complète des mots
+    en plusieurs termes (« kofi@mail.tg » -> kofi, mail, tg et « kofi mail tg »), qui tient lieu
+    de recherche de phrase en l'absence de positions.
+    """
+    for mot in (texte or '').split():
+        parties = termes(mot)
+        yield from parties
+        if len(parties) > 1:
+            yield ' '.join(parties)[:100]
+
+
+@functools.lru_cache
+def _fts5_installe(nom_base):
+    with connection.cursor() as curseur:
+        curseur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [TABLE_FTS])
+        return curseur.fetchone() is not None
+
+
+def backend():
+    choix = _search_setting('BACKEND')
+    if choix != 'auto':
+        return choix
+    if connection.vendor == 'sqlite' and _fts5_installe(connection.settings_dict['NAME']):
+        return 'fts5'
+    return 'table'
+
+
+def _documents(ids):
+    return DemandePret.objects.filter(pk__in=ids).values_list('pk', *CHAMPS).iterator(chunk_size=2000)
+
+
+def indexer(ids):
+    """(Ré)indexe les demandes données ; celles qui n'existent plus sont retirées de l'index."""
+    ids = list(ids)
+    if not ids:
+        return
+    if backend() == 'fts5':
+        with connection.cursor() as curseur:
+            curseur.execute(f"DELETE FROM {TABLE_FTS} WHERE rowid IN ({', '.join(['%s'] * len(ids))})", ids)
+            curseur.executemany(
+                f"INSERT INTO {TABLE_FTS} (rowid, numero_dossier, adresse_bien, email, cin) VALUES (%s, %s, %s, %s, %s)",
+                [(pk, *(valeur or '' for valeur in valeurs)) for pk, *valeurs in _documents(ids)],
+            )
+        return
+    TermeRecherche.objects.filter(demande_id__in=ids).delete()
+    TermeRecherche.objects.bulk_create([
+        TermeRecherche(demande_id=pk, terme=terme, occurrences=min(nombre, 32767))
+        for pk, *valeurs in _documents(ids)
+        for terme, nombre in Counter(t for valeur in valeurs for t in termes_indexes(valeur)).items()
+    ], batch_size=1000)
+
+
+def retirer(ids):
+    ids = list(ids)
+    if ids and backend() == 'fts5':
+        with connection.cursor() as curseur:
+            curseur.execute(f"DELETE FROM {TABLE_FTS} WHERE rowid IN ({', '.join(['%s'] * len(ids))})", ids)
+    # Index de repli : lignes supprimées en cascade avec la demande
+
+
+def reindexer(taille_lot=2000):
+    """Reconstruit entièrement l'index actif (après un import en masse, par exemple)."""
+    if backend() == 'fts5':
+        with connection.cursor() as curseur:
+            curseur.execute(f"DELETE FROM {TABLE_FTS}")
+    else:
+        TermeRecherche.objects.all().delete()
+    dernier_id = 0
+    total = 0
+    while True:
+        ids = list(DemandePret.objects.filter(pk__gt=dernier_id).order_by('pk').values_list('pk', flat=True)[:taille_lot])
+        if not ids:
+            return total
+        indexer(ids)
+        total += len(ids)
+        dernier_id = ids[-1]
+
+
+def _mots_requete(texte):
+    # Un mot de la requête (séparé par des espaces) = une suite de termes : « kofi@mail.tg » -> kofi, mail, tg
+    mots = [tuple(termes(mot)) for mot in texte.split()]
+    return list(dict.fromkeys(mot for mot in mots if mot))[:_search_setting('MAX_TERMS')]
+
+
+def _expression_fts(mots):
+    # Chaque mot est une phrase (termes consécutifs, très sélective pour un e-mail ou un numéro) ;
+    # seul le dernier est un préfixe (saisie en cours) ; tous doivent être présents
+    phrases = [f'"{" ".join(mot)}"' for mot in mots]
+    phrases[-1] += '*'
+    return ' AND '.join(phrases)
+
+
+def _criteres_table(mots):
+    # Index de repli : un mot en plusieurs termes est cherché sous sa forme complète (termes_indexes),
+    # le dernier par préfixe ; le critère le plus long (a priori le plus sélectif) en premier
+    criteres = [(' '.join(mot), Q(terme=' '.join(mot))) for mot in mots[:-1]]
+    criteres.append((' '.join(mots[-1]), _intervalle(' '.join(mots[-1]))))
+    return [critere for _, critere in sorted(criteres, key=lambda c: -len(c[0]))]
+
+
+def _intervalle(terme):
+    return Q(terme__gte=terme, terme__lt=terme + '\uffff')
+
+
+def sous_requete(texte):
+    """Ids des demandes qui contiennent tous les termes, utilisable dans filter(pk__in=...) ; None si aucun terme."""
+    mots = _mots_requete(texte)
+    if not mots:
+        return None
+    if backend() == 'fts5':
+        return RawSQL(f"SELECT rowid FROM {TABLE_FTS} WHERE {TABLE_FTS} MATCH %s", [_expression_fts(mots)])
+    return _correspondances_table(mots).values('demande_id')
+
+
+def _correspondances_table(mots):
+    # Lignes du critère le plus sélectif ; les autres critères sont vérifiés par demande (index unique terme, demande)
+    premier, *autres = _criteres_table(mots)
+    correspondances = TermeRecherche.objects.filter(premier)
+    for critere in autres:
+        correspondances = correspondances.filter(
+            Exists(TermeRecherche.objects.filter(critere, demande_id=OuterRef('demande_id')))
+        )
+    return correspondances
+
+
+def rechercher(texte, fonctionnaire=None, limite=None):
+    """
+    Ids des demandes correspondantes, les plus pertinentes d'abord (au plus `limite`).
+    Le classement (bm25 avec FTS5, occurrences sinon) porte sur les RANK_WINDOW correspondances
+    les plus récentes : exact tant qu'il y a moins de correspondances que la fenêtre ; au-delà
+    (terme présent dans une grande partie des demandes), la requête reste bornée et privilégie les
+    demandes récentes. Classer toutes les correspondances coûte 1 à 2,5 s sur un million de demandes.
+    """
+    mots = _mots_requete(texte)
+    if not mots:
+        return []
+    limite = limite or _search_setting('MAX_RESULTS')
+    if backend() == 'fts5':
+        requete = f"SELECT rowid, rank FROM {TABLE_FTS} WHERE {TABLE_FTS} MATCH %s"
+        parametres = [_expression_fts(mots)]
+        if fonctionnaire is not None:
+            requete += f" AND rowid IN (SELECT id FROM {DemandePret._meta.db_table} WHERE fonctionnaire_id = %s)"
+            parametres.append(fonctionnaire.pk)
+        with connection.cursor() as curseur:
+            curseur.execute(
+                f"SELECT rowid FROM ({requete} ORDER BY rowid DESC LIMIT %s) ORDER BY rank, rowid DESC LIMIT %s",
+                [*parametres, max(_search_setting('RANK_WINDOW'), limite), limite],
+            )
+            return [ligne[0] for ligne in curseur.fetchall()]
+    correspondances = _correspondances_table(mots)
+    if fonctionnaire is not None:
+        correspondances = correspondances.filter(demande__fonctionnaire=fonctionnaire)
+    # Classement par occurrences du critère principal, sur une fenêtre bornée comme pour FTS5
+    scores = Counter()
+    fenetre = correspondances.order_by('-demande_id').values_list('demande_id', 'occurrences')
+    for demande_id, occurrences in fenetre[:max(_search_setting('RANK_WINDOW'), limite)]:
+        scores[demande_id] += occurrences
+    return sorted(scores, key=lambda demande_id: (-scores[demande_id], -demande_id))[:limite]
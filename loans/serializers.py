@@ -5,18 +5,29 @@ from .models import DemandePret, TypePret, HistoriqueStatut
 
 class DemandePretSerializer(serializers.ModelSerializer):
     fonctionnaire_nom = serializers.SerializerMethodField()
+    messages_non_lus = serializers.SerializerMethodField()
     class Meta:
         model = DemandePret
         fields = [
             'id', 'fonctionnaire', 'fonctionnaire_nom','type_pret', 'montant', 'duree_remboursement',
             'adresse_bien', 'statut', 'numero_dossier', 'date_soumission',
-            'pieces_jointes'
+            'pieces_jointes', 'messages_non_lus'
         ]
         read_only_fields = ['statut', 'numero_dossier', 'date_soumission', 'fonctionnaire']
 
     def get_fonctionnaire_nom(self, obj):
         return obj.fonctionnaire.last_name if obj.fonctionnaire else None
 
+    def get_messages_non_lus(self, obj):
+        # Compteur dénormalisé (messagerie.CompteurNonLus), chargé par DemandePret.objects.avec_relations()
+        compteur = getattr(obj, 'compteur_non_lus', None)
+        request = self.context.get('request')
+        if compteur is None or request is None:
+            return 0
+        if obj.fonctionnaire_id == request.user.pk:
+            return compteur.pour_fonctionnaire
+        return compteur.pour_administration if request.user.is_staff else 0
+
 
 class DemandePretCreateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -30,3 +41,9 @@ class HistoriqueStatutSerializer(serializers.ModelSerializer):
     class Meta:
         model = HistoriqueStatut
         fields = ['id', 'statut', 'commentaire', 'date_modification']
+
+
+class DecisionStatutSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    statut = serializers.ChoiceField(choices=DemandePret.STATUT_CHOICES)
+    commentaire = serializers.CharField(required=False, allow_blank=True, default='')
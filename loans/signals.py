@@ -0,0 +1,67 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from users.models import User
+
+from . import recherche, statistiques
+from .models import DemandePret, TypePret
+
+CHAMPS_RECHERCHE_UTILISATEUR = {'email', 'cin_number'}
+
+
+@receiver(pre_save, sender=DemandePret)
+def memoriser_etat_initial(sender, instance, raw, **kwargs):
+    # Instance non chargée depuis la base (ex. construite avec un pk) : on relit l'état enregistré
+    if raw or instance.pk is None or hasattr(instance, '_etat_statistiques'):
+        return
+    ancien = DemandePret.objects.filter(pk=instance.pk).values_list(*DemandePret.CHAMPS_STATISTIQUES).first()
+    instance._etat_statistiques = ancien
+
+
+@receiver(post_save, sender=DemandePret)
+def maj_statistiques(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    avant = None if created else getattr(instance, '_etat_statistiques', None)
+    apres = instance.etat_statistiques()
+    statistiques.enregistrer_changements([(avant, apres)])
+    instance._etat_statistiques = apres
+
+
+@receiver(pre_delete, sender=DemandePret)
+def memoriser_etat_avant_suppression(sender, instance, **kwargs):
+    # L'instance peut être périmée (ex. suppression en cascade) : on retire l'état réellement enregistré
+    instance._etat_statistiques = (
+        DemandePret.objects.filter(pk=instance.pk).values_list(*DemandePret.CHAMPS_STATISTIQUES).first()
+    )
+
+
+@receiver(post_delete, sender=DemandePret)
+def retirer_des_statistiques(sender, instance, **kwargs):
+    statistiques.enregistrer_changements([(instance._etat_statistiques, None)])
+
+
+@receiver(pre_delete, sender=TypePret)
+def reporter_statistiques_type(sender, instance, **kwargs):
+    # Exécuté dans la transaction de la suppression, avant le SET_NULL des demandes
+    statistiques.reporter_sur_sans_type(instance.pk)
+
+
+@receiver(post_save, sender=DemandePret)
+def indexer_demande(sender, instance, raw, update_fields, **kwargs):
+    if raw or (update_fields and not {'numero_dossier', 'adresse_bien', 'fonctionnaire'} & set(update_fields)):
+        return
+    recherche.indexer([instance.pk])
+
+
+@receiver(post_delete, sender=DemandePret)
+def desindexer_demande(sender, instance, **kwargs):
+    recherche.retirer([instance.pk])
+
+
+@receiver(post_save, sender=User)
+def reindexer_demandes_utilisateur(sender, instance, created, raw, update_fields, **kwargs):
+    # L'e-mail et le CIN du fonctionnaire font partie des documents indexés
+    if raw or created or (update_fields and not CHAMPS_RECHERCHE_UTILISATEUR & set(update_fields)):
+        return
+    recherche.indexer(DemandePret.objects.filter(fonctionnaire=instance).values_list('pk', flat=True))
@@ -0,0 +1,97 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import DemandePret, StatistiqueDemande
+
+SANS_TYPE = 'aucun'
+
+
+def _cle_mois(date_soumission):
+    return timezone.localtime(date_soumission).strftime('%Y-%m')
+
+
+def contributions(etat):
+    """Lignes de statistiques auxquelles contribue une demande, pour un état (statut, type_pret_id, montant, date)."""
+    statut, type_pret_id, montant, date_soumission = etat
+    return [
+        ('statut', statut),
+        ('type_pret', str(type_pret_id) if type_pret_id else SANS_TYPE),
+        ('mois', _cle_mois(date_soumission)),
+    ], Decimal(montant)
+
+
+def ajuster(deltas):
+    # deltas : {(dimension, cle): [nombre, montant]}
+    for (dimension, cle), (nombre, montant) in deltas.items():
+        if not nombre and not montant:
+            continue
+        ligne = StatistiqueDemande.objects.filter(dimension=dimension, cle=cle)
+        if ligne.update(nombre=F('nombre') + nombre, montant_total=F('montant_total') + montant):
+            continue
+        try:
+            with transaction.atomic():
+                StatistiqueDemande.objects.create(dimension=dimension, cle=cle, nombre=nombre, montant_total=montant)
+        except IntegrityError:
+            # Ligne créée entre-temps par une autre requête
+            ligne.update(nombre=F('nombre') + nombre, montant_total=F('montant_total') + montant)
+
+
+def enregistrer_changements(changements):
+    """
+    Répercute des passages d'état (avant, apres) de demandes ; None pour une création ou une suppression.
+    Les écarts sont cumulés pour n'écrire qu'une fois par ligne de statistiques.
+    """
+    deltas = defaultdict(lambda: [0, Decimal(0)])
+    for avant, apres in changements:
+        if avant == apres:
+            continue
+        for etat, signe in ((avant, -1), (apres, 1)):
+            if etat is None:
+                continue
+            cles, montant = contributions(etat)
+            for cle in cles:
+                deltas[cle][0] += signe
+                deltas[cle][1] += signe * montant
+    ajuster(deltas)
+
+
+def reporter_sur_sans_type(type_pret_id):
+    """
+    Reporte sur la ligne SANS_TYPE les demandes d'un type de prêt sur le point d'être supprimé :
+    le SET_NULL est un UPDATE en masse qui n'émet aucun signal de demande.
+    """
+    agregat = DemandePret.objects.filter(type_pret_id=type_pret_id).aggregate(nombre=Count('id'), montant=Sum('montant'))
+    nombre, montant = agregat['nombre'], agregat['montant'] or Decimal(0)
+    ajuster({
+        ('type_pret', str(type_pret_id)): [-nombre, -montant],
+        ('type_pret', SANS_TYPE): [nombre, montant],
+    })
+
+
+def calculer_lignes(demandes):
+    """Agrégats complets (GROUP BY) à partir d'un queryset de demandes ; utilisé pour la reconstruction."""
+    lignes = []
+    agregats = {'nombre': Count('id'), 'montant_total': Sum('montant')}
+    for ligne in demandes.order_by().values('statut').annotate(**agregats):
+        lignes.append(('statut', ligne['statut'], ligne['nombre'], ligne['montant_total']))
+    for ligne in demandes.order_by().values('type_pret_id').annotate(**agregats):
+        cle = str(ligne['type_pret_id']) if ligne['type_pret_id'] else SANS_TYPE
+        lignes.append(('type_pret', cle, ligne['nombre'], ligne['montant_total']))
+    for ligne in demandes.order_by().annotate(mois=TruncMonth('date_soumission')).values('mois').annotate(**agregats):
+        lignes.append(('mois', ligne['mois'].strftime('%Y-%m'), ligne['nombre'], ligne['montant_total']))
+    return lignes
+
+
+@transaction.atomic
+def recalculer():
+    StatistiqueDemande.objects.all().delete()
+    StatistiqueDemande.objects.bulk_create([
+        StatistiqueDemande(dimension=dimension, cle=cle, nombre=nombre, montant_total=montant or 0)
+        for dimension, cle, nombre, montant in calculer_lignes(DemandePret.objects.all())
+    ])
+
@@ -1,2 +1,721 @@
-from django.test import TestCase
+import base64
+import datetime
+import csv
+import io
+import json
+import tempfile
+import unittest
 
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.contrib.admin.sites import site
+from django.contrib.admin.templatetags.admin_list import date_hierarchy
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from Pret.templatetags.admin_grandes_tables import date_hierarchy_indexee
+from Pret.database import configurer_base
+from Pret.pagination import EstimatedCountPaginator
+from pieces.models import PieceJointe
+from users.models import User
+from . import portefeuille, recherche, statistiques
+from .admin import DemandePretAdmin
+from .amortissement import echeancier, mensualites, synthese
+from .models import (
+    DUREE_MAX_MOIS, CompteurDossier, DemandePret, HistoriqueStatut, StatistiqueDemande, TypePret, attribuer_numeros_dossier
+)
+from .utils import appliquer_changements_statut
+
+
+def creer_utilisateur(username, **kwargs):
+    return User.objects.create_user(
+        username=username, email=f"{username}@example.com", password="motdepasse-test", **kwargs
+    )
+
+
+def creer_demande(fonctionnaire, type_pret=None, **kwargs):
+    valeurs = {'montant': 1000000, 'duree_remboursement': 24, 'adresse_bien': 'Lomé'}
+    valeurs.update(kwargs)
+    return DemandePret.objects.create(fonctionnaire=fonctionnaire, type_pret=type_pret, **valeurs)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class BudgetRequetesDemandesTests(TestCase):
+    """Le nombre de requêtes ne doit pas dépendre du nombre de demandes listées."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = creer_utilisateur('admin', is_staff=True)
+        type_pret = TypePret.objects.create(nom='Immobilier')
+        for i in range(5):
+            fonctionnaire = creer_utilisateur(f'agent{i}', last_name=f'Agent {i}')
+            demande = creer_demande(fonctionnaire, type_pret)
+            PieceJointe.objects.create(demande=demande, nom='cni', fichier=ContentFile(b'x', name='cni.txt'))
+        cls.fonctionnaire = fonctionnaire
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_liste_admin(self):
+        self.client.force_authenticate(self.admin)
+        # COUNT + demandes (jointures) + pièces jointes
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('mes-demandes'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 5)
+
+    def test_liste_fonctionnaire(self):
+        self.client.force_authenticate(self.fonctionnaire)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('mes-demandes'))
+        self.assertEqual(response.data['count'], 1)
+
+    def test_detail(self):
+        self.client.force_authenticate(self.admin)
+        demande = DemandePret.objects.first()
+        # validateurs (ETag) + demande (jointures) + pièces jointes
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('detail-pret', args=[demande.pk]))
+        self.assertEqual(response.data['fonctionnaire_nom'], demande.fonctionnaire.last_name)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class GetConditionnelDemandeTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = creer_utilisateur('admin', is_staff=True)
+        cls.fonctionnaire = creer_utilisateur('agent')
+        cls.demande = creer_demande(cls.fonctionnaire)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.fonctionnaire)
+        self.url = reverse('detail-pret', args=[self.demande.pk])
+
+    def test_304_sans_serialisation(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_if_modified_since(self):
+        derniere_modification = self.client.get(self.url)['Last-Modified']
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=derniere_modification)
+        self.assertEqual(response.status_code, 304)
+        # Last-Modified est à la seconde : le changement de statut est daté plus tard
+        historique = HistoriqueStatut.objects.create(demande=self.demande, statut='en_cours')
+        HistoriqueStatut.objects.filter(pk=historique.pk).update(date_modification=timezone.now() + datetime.timedelta(seconds=5))
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=derniere_modification)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_suit_le_contenu(self):
+        etag = self.client.get(self.url)['ETag']
+        PieceJointe.objects.create(demande=self.demande, nom='bulletin.pdf', fichier=ContentFile(b'x', name='bulletin.pdf'))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['pieces_jointes']), 1)
+
+        etag = response['ETag']
+        DemandePret.objects.filter(pk=self.demande.pk).update(montant=1)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_propre_a_l_utilisateur(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_demande_inexistante(self):
+        response = self.client.get(reverse('detail-pret', args=[self.demande.pk + 1]), HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 404)
+
+
+class PaginationCurseurDemandesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = creer_utilisateur('admin', is_staff=True)
+        fonctionnaire = creer_utilisateur('agent')
+        cls.demandes = [creer_demande(fonctionnaire) for _ in range(7)]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_parcours_complet_sans_count(self):
+        url = reverse('mes-demandes') + '?pagination=curseur&page_size=3'
+        vus = []
+        while url:
+            with self.assertNumQueries(2):  # demandes + pièces jointes, pas de COUNT
+                response = self.client.get(url)
+            self.assertNotIn('count', response.data)
+            vus.extend(d['id'] for d in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(vus, [d.pk for d in self.demandes])
+
+    def test_dates_egales_departagees_par_l_id(self):
+        DemandePret.objects.update(date_soumission=self.demandes[0].date_soumission)
+        url = reverse('mes-demandes') + '?pagination=curseur&page_size=3'
+        pages = []
+        while url:
+            response = self.client.get(url)
+            pages.append([d['id'] for d in response.data['results']])
+            url = response.data['next']
+        self.assertEqual(sum(pages, []), [d.pk for d in self.demandes])
+
+        # Retour en arrière depuis la dernière page : mêmes pages, sans décalage
+        url = response.data['previous']
+        for attendue in reversed(pages[:-1]):
+            with CaptureQueriesContext(connection) as contexte:
+                response = self.client.get(url)
+            self.assertEqual([d['id'] for d in response.data['results']], attendue)
+            self.assertNotIn('OFFSET', contexte.captured_queries[0]['sql'])
+            url = response.data['previous']
+        self.assertIsNone(url)
+
+    def test_curseur_invalide(self):
+        curseur = base64.b64encode(b'p=%5B%22x%22%5D').decode()
+        response = self.client.get(reverse('mes-demandes') + f'?cursor={curseur}')
+        self.assertEqual(response.status_code, 404)
+
+    def test_pagination_par_page_par_defaut(self):
+        response = self.client.get(reverse('mes-demandes'))
+        self.assertEqual(response.data['count'], 7)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN est propre à SQLite")
+class PlanRequetesMixin:
+    # Tables de référence de quelques lignes, qu'un parcours complet ne pénalise pas, et table dérivée
+    # bornée par LIMIT du comptage de l'admin (EstimatedCountPaginator)
+    tables_autorisees = ('loans_typepret', 'subquery')
+
+    def assertPlansIndexes(self, requetes):
+        for requete in requetes:
+            sql = requete['sql']
+            if not sql.startswith('SELECT'):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                etapes = [ligne[-1] for ligne in cursor.fetchall()]
+            for etape in etapes:
+                parcours_complet = etape.startswith('SCAN') and 'INDEX' not in etape
+                if parcours_complet and etape.split()[1] in self.tables_autorisees:
+                    continue
+                self.assertFalse(parcours_complet, f"Parcours complet : {etape}\n{sql}")
+                self.assertNotIn('TEMP B-TREE', etape, f"Tri temporaire : {etape}\n{sql}")
+
+    def capturer(self, url):
+        with CaptureQueriesContext(connection) as contexte:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return contexte.captured_queries
+
+
+class PlanRequetesDemandesTests(PlanRequetesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = creer_utilisateur('admin', is_staff=True, is_superuser=True)
+        cls.fonctionnaire = creer_utilisateur('agent')
+        cls.type_pret = TypePret.objects.create(nom='Immobilier')
+        demande = creer_demande(cls.fonctionnaire, cls.type_pret)
+        demande.historiques.create(statut='en_cours')
+
+    def test_vues_api(self):
+        self.client = APIClient()
+        for utilisateur in (self.admin, self.fonctionnaire):
+            self.client.force_authenticate(utilisateur)
+            self.assertPlansIndexes(self.capturer(reverse('mes-demandes')))
+            self.assertPlansIndexes(self.capturer(reverse('mes-demandes') + '?pagination=curseur'))
+
+    def test_filtres_admin(self):
+        self.client.force_login(self.admin)
+        url = reverse('admin:loans_demandepret_changelist')
+        aujourd_hui = timezone.localdate()
+        filtres = (
+            '', '?statut__exact=soumis', f'?type_pret__id__exact={self.type_pret.pk}',
+            f'?date_soumission__year={aujourd_hui.year}',
+            f'?date_soumission__year={aujourd_hui.year}&date_soumission__month={aujourd_hui.month}',
+        )
+        for filtre in filtres:
+            self.assertPlansIndexes(self.capturer(url + filtre))
+
+    def test_historique_par_demande(self):
+        demande = DemandePret.objects.get()
+        queryset = demande.historiques.order_by('date_modification', 'id')
+        with CaptureQueriesContext(connection) as contexte:
+            list(queryset)
+        self.assertPlansIndexes(contexte.captured_queries)
+
+
+class ExportDemandesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = creer_utilisateur('admin', is_staff=True)
+        cls.fonctionnaire = creer_utilisateur('agent', last_name='Agbeko')
+        type_pret = TypePret.objects.create(nom='Immobilier')
+        cls.demandes = [creer_demande(cls.fonctionnaire, type_pret) for _ in range(3)]
+        cls.demandes[0].historiques.create(statut='en_cours', commentaire='Dossier complet')
+        cls.demandes[0].historiques.create(statut='accepte', commentaire='Validé en commission')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def lire(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('export-demandes'))
+            lignes = list(csv.DictReader(io.StringIO(self.lire(response))))
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual([l['numero_dossier'] for l in lignes], [d.numero_dossier for d in self.demandes])
+        self.assertEqual(lignes[0]['dernier_statut'], 'accepte')
+        self.assertEqual(lignes[0]['dernier_statut_commentaire'], 'Validé en commission')
+        self.assertEqual(lignes[0]['fonctionnaire_nom'], 'Agbeko')
+        self.assertEqual(lignes[1]['dernier_statut'], '')
+
+    def test_jsonl(self):
+        response = self.client.get(reverse('export-demandes') + '?type_fichier=jsonl')
+        lignes = [json.loads(l) for l in self.lire(response).splitlines()]
+        self.assertEqual(len(lignes), 3)
+        self.assertEqual(lignes[0]['type_pret'], 'Immobilier')
+        self.assertEqual(lignes[0]['montant'], '1000000.00')
+
+    def test_reserve_aux_administrateurs(self):
+        self.client.force_authenticate(self.fonctionnaire)
+        self.assertEqual(self.client.get(reverse('export-demandes')).status_code, 403)
+
+
+class ChangerStatutLotTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = creer_utilisateur('admin', is_staff=True)
+        fonctionnaire = creer_utilisateur('agent')
+        cls.demandes = [creer_demande(fonctionnaire) for _ in range(6)]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_lot_applique_en_requetes_constantes(self):
+        decisions = [
+            {'id': d.pk, 'statut': 'accepte' if i % 2 else 'refuse', 'commentaire': f'Décision {i}'}
+            for i, d in enumerate(self.demandes)
+        ]
+        # Indépendant de la taille du lot : contrôle des ids, historique, un UPDATE par statut, statistiques
+        with self.assertNumQueries(16):
+            response = self.client.post(reverse('changer-statut-lot'), {'decisions': decisions}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'modifiees': 6, 'par_statut': {'refuse': 3, 'accepte': 3}})
+        self.assertEqual(DemandePret.objects.filter(statut='accepte').count(), 3)
+        self.assertEqual(HistoriqueStatut.objects.filter(commentaire='Décision 1', statut='accepte').count(), 1)
+
+    def test_erreurs_par_element_et_rien_applique(self):
+        decisions = [
+            {'id': self.demandes[0].pk, 'statut': 'accepte'},
+            {'id': self.demandes[1].pk, 'statut': 'inconnu'},
+            {'id': 999999, 'statut': 'refuse'},
+            {'id': self.demandes[0].pk, 'statut': 'refuse'},
+        ]
+        response = self.client.post(reverse('changer-statut-lot'), {'decisions': decisions}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([e['index'] for e in response.data['erreurs']], [1, 2, 3])
+        self.assertFalse(HistoriqueStatut.objects.exists())
+        self.assertFalse(DemandePret.objects.exclude(statut='soumis').exists())
+
+
+class StatistiquesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = creer_utilisateur('admin', is_staff=True)
+        cls.fonctionnaire = creer_utilisateur('agent')
+        cls.immobilier = TypePret.objects.create(nom='Immobilier')
+        cls.auto = TypePret.objects.create(nom='Automobile')
+
+    maxDiff = None
+
+    def assertCoherentAvecRecalcul(self):
+        incremental = {
+            (l.dimension, l.cle): (l.nombre, l.montant_total)
+            for l in StatistiqueDemande.objects.exclude(nombre=0)
+        }
+        attendu = {
+            (dimension, cle): (nombre, montant)
+            for dimension, cle, nombre, montant in statistiques.calculer_lignes(DemandePret.objects.all())
+        }
+        self.assertEqual(incremental, attendu)
+
+    def test_maintenu_par_l_orm_les_vues_et_le_lot(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        demandes = [creer_demande(self.fonctionnaire, self.immobilier, montant=100 * (i + 1)) for i in range(4)]
+        creer_demande(self.fonctionnaire, None, montant=50)
+        self.assertCoherentAvecRecalcul()
+
+        client.put(reverse('changer-statut', args=[demandes[0].pk]), {'statut': 'en_cours'}, format='json')
+        self.assertCoherentAvecRecalcul()
+
+        decisions = [{'id': d.pk, 'statut': 'accepte'} for d in demandes[1:3]]
+        client.post(reverse('changer-statut-lot'), {'decisions': decisions}, format='json')
+        self.assertCoherentAvecRecalcul()
+
+        # modification façon admin : type et montant
+        demande = DemandePret.objects.get(pk=demandes[3].pk)
+        demande.type_pret = self.auto
+        demande.montant = 999
+        demande.save()
+        # instance construite sans passer par la base
+        DemandePret(pk=demandes[2].pk, fonctionnaire=self.fonctionnaire, montant=1, duree_remboursement=12,
+                    numero_dossier=demandes[2].numero_dossier, date_soumission=demandes[2].date_soumission,
+                    statut='refuse').save()
+        self.assertCoherentAvecRecalcul()
+
+        demandes[0].delete()
+        self.assertCoherentAvecRecalcul()
+
+    def test_suppression_d_un_type_de_pret(self):
+        creer_demande(self.fonctionnaire, self.immobilier, montant=100)
+        creer_demande(self.fonctionnaire, self.immobilier, montant=300)
+        creer_demande(self.fonctionnaire, None, montant=50)
+        cle = str(self.immobilier.pk)
+
+        self.immobilier.delete()
+
+        self.assertCoherentAvecRecalcul()
+        self.assertFalse(StatistiqueDemande.objects.filter(dimension='type_pret', cle=cle).exclude(nombre=0).exists())
+        sans_type = StatistiqueDemande.objects.get(dimension='type_pret', cle=statistiques.SANS_TYPE)
+        self.assertEqual((sans_type.nombre, sans_type.montant_total), (3, 450))
+
+    def test_endpoint_et_recalcul(self):
+        creer_demande(self.fonctionnaire, self.immobilier, montant=100)
+        creer_demande(self.fonctionnaire, self.immobilier, montant=300)
+        StatistiqueDemande.objects.update(nombre=42)  # dérive volontaire
+        statistiques.recalculer()
+
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        with self.assertNumQueries(2):
+            response = client.get(reverse('statistiques-demandes'))
+        self.assertEqual(response.data['total'], {'nombre': 2, 'montant_total': 400})
+        self.assertEqual(response.data['par_type_pret'][0]['nom'], 'Immobilier')
+        self.assertEqual(response.data['par_statut'][0]['statut'], 'soumis')
+
+
+class ProfilSQLiteTests(TestCase):
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', "profil propre à SQLite")
+    def test_pragmas_appliques_a_la_connexion(self):
+        with connection.cursor() as curseur:
+            curseur.execute("PRAGMA synchronous")
+            self.assertEqual(curseur.fetchone()[0], 1)  # NORMAL
+            curseur.execute("PRAGMA busy_timeout")
+            self.assertEqual(curseur.fetchone()[0], 20000)
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+    def test_ni_wal_ni_connexions_persistantes_par_defaut(self):
+        # WAL réécrirait toute base ouverte (manage.py check, test) ; les connexions persistantes
+        # s'accumulent sous ASGI
+        base = configurer_base({'ENGINE': 'django.db.backends.sqlite3', 'NAME': 'base.sqlite3'})
+        self.assertEqual(base['CONN_MAX_AGE'], 0)
+        self.assertNotIn('journal_mode', base['OPTIONS']['init_command'])
+        base = configurer_base({'ENGINE': 'django.db.backends.sqlite3', 'NAME': 'base.sqlite3'}, wal=True)
+        self.assertIn('PRAGMA journal_mode=WAL;', base['OPTIONS']['init_command'])
+
+
+class NumeroDossierTests(TestCase):
+
+    def test_numeros_denses_et_ordonnes(self):
+        fonctionnaire = creer_utilisateur('agent')
+        demandes = [creer_demande(fonctionnaire) for _ in range(3)]
+        jour = demandes[0].date_soumission.astimezone(timezone.get_current_timezone()).strftime('%Y%m%d')
+        self.assertEqual([d.numero_dossier for d in demandes], [f'PRT-{jour}-0000{i}' for i in (1, 2, 3)])
+        self.assertEqual(CompteurDossier.objects.get().dernier, 3)
+
+    def test_reservation_par_bloc(self):
+        jour = datetime.date(2025, 3, 1)
+        self.assertEqual(CompteurDossier.objects.reserver(1, jour), range(1, 2))
+        self.assertEqual(CompteurDossier.objects.reserver(500, jour), range(2, 502))
+        self.assertEqual(CompteurDossier.objects.reserver(1, jour), range(502, 503))
+        self.assertEqual(CompteurDossier.objects.reserver(1, jour + datetime.timedelta(days=1)), range(1, 2))
+
+    def test_import_en_masse(self):
+        fonctionnaire = creer_utilisateur('agent')
+        demandes = [
+            DemandePret(fonctionnaire=fonctionnaire, montant=1000, duree_remboursement=12, adresse_bien='Lomé')
+            for _ in range(4)
+        ]
+        demandes[1].numero_dossier = 'ANCIEN-1'
+        CompteurDossier.objects.reserver(0, datetime.date(2025, 3, 1))
+        with CaptureQueriesContext(connection) as requetes:
+            attribuer_numeros_dossier(demandes, datetime.date(2025, 3, 1))
+        # un bloc : un incrément et une lecture pour toutes les demandes
+        self.assertEqual(len([r for r in requetes if 'SAVEPOINT' not in r['sql']]), 2)
+        DemandePret.objects.bulk_create(demandes)
+        self.assertEqual(
+            sorted(DemandePret.objects.values_list('numero_dossier', flat=True)),
+            ['ANCIEN-1', 'PRT-20250301-00001', 'PRT-20250301-00002', 'PRT-20250301-00003'],
+        )
+
+
+class AmortissementTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = creer_utilisateur('admin', is_staff=True)
+        cls.fonctionnaire = creer_utilisateur('agent')
+        cls.type_pret = TypePret.objects.create(nom='Immobilier', taux_annuel=8)
+        cls.demande = creer_demande(cls.fonctionnaire, cls.type_pret)
+
+    def test_mensualites_vectorisees(self):
+        self.assertEqual(mensualites([1000000, 120000, 1000000], [8, 0, 12], [24, 12, 360]).tolist(), [45227.29, 10000.0, 10286.13])
+
+    def test_echeancier_rembourse_exactement_le_capital(self):
+        colonnes = echeancier(1000000, 8, 24)
+        self.assertEqual(len(colonnes['numero']), 24)
+        self.assertAlmostEqual(colonnes['capital'].sum(), 1000000, places=2)
+        self.assertEqual(colonnes['capital_restant'][-1], 0)
+        self.assertEqual(colonnes['interets'][0], 6666.67)
+        self.assertTrue((abs(colonnes['echeance'] - 45227.29) < 0.05).all())
+        self.assertEqual(synthese([1000000], [8], [24])['interets_totaux'].tolist(), [85454.96])
+
+    def test_endpoint_echeancier(self):
+        client = APIClient()
+        url = reverse('echeancier-pret', args=[self.demande.pk])
+        client.force_authenticate(creer_utilisateur('autre'))
+        self.assertEqual(client.get(url).status_code, 403)
+
+        client.force_authenticate(self.fonctionnaire)
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['mensualite'], 45227.29)
+        self.assertEqual(len(response.data['echeances']), 24)
+        self.assertEqual(response.data['echeances'][0]['numero'], 1)
+
+    def test_duree_bornee(self):
+        client = APIClient()
+        client.force_authenticate(self.fonctionnaire)
+        demande = {'type_pret': self.type_pret.pk, 'montant': '500000', 'adresse_bien': 'Lomé'}
+        for duree, attendu in ((DUREE_MAX_MOIS, 201), (DUREE_MAX_MOIS + 1, 400), (2_000_000_000, 400), (0, 400)):
+            response = client.post(reverse('soumettre-pret'), {**demande, 'duree_remboursement': duree}, format='json')
+            self.assertEqual(response.status_code, attendu, duree)
+
+        # Demande enregistrée avant la validation : refusée sans calculer l'échéancier
+        DemandePret.objects.filter(pk=self.demande.pk).update(duree_remboursement=2_000_000_000)
+        self.assertEqual(client.get(reverse('echeancier-pret', args=[self.demande.pk])).status_code, 400)
+
+    def test_tarification_par_lot(self):
+        sans_type = creer_demande(self.fonctionnaire, montant=120000, duree_remboursement=12)
+        client = APIClient()
+        client.force_authenticate(self.fonctionnaire)
+        self.assertEqual(client.post(reverse('tarification-lot'), {'statut': 'soumis'}, format='json').status_code, 403)
+
+        client.force_authenticate(self.admin)
+        with self.assertNumQueries(1):
+            response = client.post(reverse('tarification-lot'), {'demandes': [self.demande.pk, sans_type.pk]}, format='json')
+        self.assertEqual(response.data['nombre'], 2)
+        self.assertEqual([r['mensualite'] for r in response.data['resultats']], [45227.29, 10000.0])
+        self.assertEqual(response.data['resultats'][1]['interets_totaux'], 0)
+        self.assertEqual(client.post(reverse('tarification-lot'), {}, format='json').status_code, 400)
+
+
+class ProjectionPortefeuilleTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = creer_utilisateur('admin', is_staff=True)
+        fonctionnaire = creer_utilisateur('agent')
+        type_pret = TypePret.objects.create(nom='Immobilier', taux_annuel=8)
+        cls.immobilier = creer_demande(fonctionnaire, type_pret, statut='accepte')
+        cls.sans_type = creer_demande(fonctionnaire, montant=120000, duree_remboursement=12, statut='accepte')
+        cls.soumise = creer_demande(fonctionnaire, montant=50000, duree_remboursement=10)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_projection_par_blocs(self):
+        resultat = portefeuille.projeter(36, taille_bloc=1)
+        self.assertEqual(resultat['nombre_prets'], 2)
+        mois = resultat['projection']
+        # première échéance le mois suivant l'acceptation
+        self.assertEqual((mois[0]['encaissements'], mois[0]['encours']), (0, 1120000))
+        self.assertEqual(mois[1]['prets_actifs'], 2)
+        self.assertEqual(mois[1]['interets'], 6666.67)
+        self.assertEqual(mois[13]['prets_actifs'], 1)
+        self.assertEqual((mois[24]['encours'], mois[25]['prets_actifs']), (0, 0))
+        self.assertAlmostEqual(sum(m['capital'] for m in mois), 1120000, places=1)
+        self.assertAlmostEqual(sum(m['interets'] for m in mois), echeancier(1000000, 8, 24)['interets'].sum(), delta=0.5)
+
+    def test_date_d_acceptation_lue_dans_l_historique(self):
+        HistoriqueStatut.objects.create(demande=self.sans_type, statut='accepte')
+        HistoriqueStatut.objects.filter(demande=self.sans_type).update(date_modification=timezone.now() - datetime.timedelta(days=400))
+        # remboursé avant le mois courant : hors projection
+        self.assertEqual(portefeuille.projeter(36)['nombre_prets'], 1)
+
+    def test_cache_jusqu_au_prochain_changement_de_statut(self):
+        self.assertEqual(portefeuille.projection(24)['nombre_prets'], 2)
+        with self.assertNumQueries(3):  # empreinte seulement
+            self.assertEqual(portefeuille.projection(24)['nombre_prets'], 2)
+        appliquer_changements_statut([{'id': self.soumise.pk, 'statut': 'accepte'}])
+        self.assertEqual(portefeuille.projection(24)['nombre_prets'], 3)
+
+    def test_cache_invalide_par_une_modification_sans_signal(self):
+        avant = portefeuille.projection(24)
+        # modifications en masse (admin, QuerySet.update) : ni historique ni statistiques
+        DemandePret.objects.filter(pk=self.sans_type.pk).update(montant=240000)
+        apres = portefeuille.projection(24)
+        self.assertEqual(apres['montant_total'], avant['montant_total'] + 120000)
+
+        DemandePret.objects.filter(pk=self.sans_type.pk).update(duree_remboursement=6)
+        self.assertEqual(portefeuille.projection(24)['projection'][7]['prets_actifs'], 1)
+
+        # échange des valeurs entre deux prêts acceptés : totaux inchangés, projection différente
+        empreinte = portefeuille.empreinte()
+        DemandePret.objects.filter(pk=self.sans_type.pk).update(duree_remboursement=24)
+        DemandePret.objects.filter(pk=self.immobilier.pk).update(duree_remboursement=6)
+        self.assertNotEqual(portefeuille.empreinte(), empreinte)
+
+    def test_endpoint_reserve_aux_administrateurs(self):
+        client = APIClient()
+        client.force_authenticate(self.immobilier.fonctionnaire)
+        self.assertEqual(client.get(reverse('projection-portefeuille')).status_code, 403)
+        client.force_authenticate(self.admin)
+        self.assertEqual(client.get(reverse('projection-portefeuille'), {'horizon': 'x'}).status_code, 400)
+        response = client.get(reverse('projection-portefeuille'), {'horizon': 12})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['projection']), 12)
+
+
+class RechercheMixin:
+    backend = None
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = creer_utilisateur('admin', is_staff=True)
+        cls.kofi = creer_utilisateur('kofi', cin_number='TG-1234567')
+        cls.ama = creer_utilisateur('ama')
+        cls.lome = creer_demande(cls.kofi, adresse_bien='Lomé, quartier Bè, rue 12')
+        cls.kara = creer_demande(cls.kofi, adresse_bien='Kara centre')
+        cls.ama_lome = creer_demande(cls.ama, adresse_bien='Lomé Tokoin, Lomé')
+
+    def ids(self, texte, **kwargs):
+        return recherche.rechercher(texte, **kwargs)
+
+    def test_backend(self):
+        self.assertEqual(recherche.backend(), self.backend)
+
+    def test_termes_prefixes_sans_accents(self):
+        self.assertEqual(self.ids('LOME'), [self.ama_lome.pk, self.lome.pk])  # deux occurrences d'abord
+        self.assertEqual(self.ids('lomé be'), [self.lome.pk])
+        self.assertEqual(self.ids(self.kara.numero_dossier), [self.kara.pk])
+        self.assertEqual(sorted(self.ids('tg-12345')), [self.lome.pk, self.kara.pk])
+        self.assertEqual(self.ids('lome', fonctionnaire=self.ama), [self.ama_lome.pk])
+        self.assertEqual(self.ids('  @@ '), [])
+
+    def test_fenetre_de_classement_sur_les_plus_recentes(self):
+        recentes = [creer_demande(self.ama, adresse_bien=adresse) for adresse in ('Lomé', 'Lomé, Lomé', 'Lomé')]
+        with self.settings(SEARCH_INDEX={**getattr(settings, 'SEARCH_INDEX', {}), 'RANK_WINDOW': 2}):
+            self.assertEqual(self.ids('lome', limite=2), [recentes[1].pk, recentes[2].pk])
+
+    def test_index_tenu_a_jour(self):
+        self.kofi.email = 'kofi.mensah@exemple.tg'
+        self.kofi.save()
+        self.assertEqual(sorted(self.ids('mensah')), [self.lome.pk, self.kara.pk])
+        self.kara.adresse_bien = 'Sokodé'
+        self.kara.save()
+        self.assertEqual(self.ids('sokode'), [self.kara.pk])
+        self.assertEqual(self.ids('kara'), [])
+        self.lome.delete()
+        self.assertEqual(sorted(self.ids('mensah')), [self.kara.pk])
+
+    def test_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.ama)
+        response = client.get(reverse('recherche-demandes'), {'q': 'lome'})
+        self.assertEqual([d['id'] for d in response.data['results']], [self.ama_lome.pk])
+        self.assertEqual(client.get(reverse('recherche-demandes')).status_code, 400)
+
+        client.force_authenticate(self.admin)
+        response = client.get(reverse('recherche-demandes'), {'q': 'lome'})
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual([d['id'] for d in response.data['results']], [self.ama_lome.pk, self.lome.pk])
+
+    def test_recherche_de_l_admin(self):
+        admin = DemandePretAdmin(DemandePret, site)
+        requete = RequestFactory().get('/')
+        queryset, doublons = admin.get_search_results(requete, DemandePret.objects.all(), 'kofi lome')
+        self.assertEqual((list(queryset), doublons), ([self.lome], False))
+
+
+class RechercheFTS5Tests(RechercheMixin, TestCase):
+    backend = 'fts5'
+
+
+@override_settings(SEARCH_INDEX={'BACKEND': 'table'})
+class RechercheIndexInverseTests(RechercheMixin, TestCase):
+    backend = 'table'
+
+
+class AdminListesTests(TestCase):
+    """Listes de l'admin : nombre de requêtes indépendant du nombre de lignes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.superuser = creer_utilisateur('superadmin', is_staff=True, is_superuser=True)
+        cls.type_pret = TypePret.objects.create(nom='Immobilier')
+
+    def ajouter(self, nombre):
+        for i in range(nombre):
+            demande = creer_demande(creer_utilisateur(f'agent{DemandePret.objects.count()}'), self.type_pret)
+            HistoriqueStatut.objects.create(demande=demande, statut='en_cours')
+
+    def nombre_requetes(self, url):
+        with CaptureQueriesContext(connection) as requetes:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(requetes)
+
+    def test_requetes_constantes(self):
+        self.client.force_login(self.superuser)
+        for nom in ('admin:loans_demandepret_changelist', 'admin:loans_historiquestatut_changelist'):
+            self.ajouter(2)
+            avant = self.nombre_requetes(reverse(nom))
+            self.ajouter(8)
+            self.assertEqual(self.nombre_requetes(reverse(nom)), avant, nom)
+
+    def test_hierarchie_dates_identique_a_django(self):
+        fonctionnaire = creer_utilisateur('agent')
+        for jours in (0, 1, 40, 400):
+            demande = creer_demande(fonctionnaire)
+            DemandePret.objects.filter(pk=demande.pk).update(date_soumission=timezone.now() - datetime.timedelta(days=jours))
+        aujourd_hui = timezone.localdate()
+        modele_admin = site._registry[DemandePret]
+        for parametres in ({}, {'date_soumission__year': aujourd_hui.year},
+                           {'date_soumission__year': aujourd_hui.year, 'date_soumission__month': aujourd_hui.month}):
+            request = RequestFactory().get('/', parametres)
+            request.user = self.superuser
+            cl = modele_admin.get_changelist_instance(request)
+            self.assertEqual(date_hierarchy_indexee(cl), date_hierarchy(cl), parametres)
+
+    def test_comptage_estime_au_dela_du_seuil(self):
+        class Paginateur(EstimatedCountPaginator):
+            exact_count_threshold = 3
+
+        fonctionnaire = creer_utilisateur('agent')
+        demandes = [creer_demande(fonctionnaire) for _ in range(6)]
+        demandes[2].delete()
+        demandes_par_id = DemandePret.objects.order_by('-id')  # ordre des listes de l'admin
+        self.assertEqual(Paginateur(demandes_par_id.filter(statut='accepte'), 2).count, 0)
+        self.assertEqual(Paginateur(demandes_par_id, 2).count, demandes[-1].pk)  # estimation : plus grande clé
+        self.assertEqual(Paginateur(demandes_par_id.filter(fonctionnaire=fonctionnaire), 2).count, 5)
@@ -1,12 +1,21 @@
 from django.urls import path
 from .views import (
     DemandePretCreateView, MesDemandesView, DemandePretDetailView,
-    ChangerStatutView
+    ChangerStatutView, ChangerStatutLotView, ExportDemandesView,
+    StatistiquesView, EcheancierView, TarificationLotView, ProjectionPortefeuilleView,
+    RechercheDemandesView
 )
 
 urlpatterns = [
     path('soumettre/', DemandePretCreateView.as_view(), name='soumettre-pret'),
     path('mes-demandes/', MesDemandesView.as_view(), name='mes-demandes'),
+    path('recherche/', RechercheDemandesView.as_view(), name='recherche-demandes'),
     path('detail/<int:pk>/', DemandePretDetailView.as_view(), name='detail-pret'),
     path('changer-statut/<int:pk>/', ChangerStatutView.as_view(), name='changer-statut'),
+    path('changer-statut/lot/', ChangerStatutLotView.as_view(), name='changer-statut-lot'),
+    path('export/', ExportDemandesView.as_view(), name='export-demandes'),
+    path('echeancier/<int:pk>/', EcheancierView.as_view(), name='echeancier-pret'),
+    path('echeancier/lot/', TarificationLotView.as_view(), name='tarification-lot'),
+    path('portefeuille/projection/', ProjectionPortefeuilleView.as_view(), name='projection-portefeuille'),
+    path('statistiques/', StatistiquesView.as_view(), name='statistiques-demandes'),
 ]
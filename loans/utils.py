@@ -0,0 +1,36 @@
+from collections import defaultdict
+
+from django.db import transaction
+
+from . import statistiques
+from .models import DemandePret, HistoriqueStatut
+
+
+@transaction.atomic
+def appliquer_changements_statut(decisions):
+    """
+    Applique une liste de décisions déjà validées, chacune un dict {'id', 'statut', 'commentaire'} :
+    un seul INSERT pour l'historique et un UPDATE par statut cible.
+    """
+    # Les UPDATE groupés ne déclenchent pas les signaux : les statistiques sont ajustées ici
+    etats = {
+        pk: etat for pk, *etat in DemandePret.objects.select_for_update()
+        .filter(pk__in=[d['id'] for d in decisions])
+        .values_list('pk', *DemandePret.CHAMPS_STATISTIQUES)
+    }
+    HistoriqueStatut.objects.bulk_create([
+        HistoriqueStatut(demande_id=d['id'], statut=d['statut'], commentaire=d.get('commentaire', ''))
+        for d in decisions
+    ])
+
+    ids_par_statut = defaultdict(list)
+    for decision in decisions:
+        ids_par_statut[decision['statut']].append(decision['id'])
+    for statut, ids in ids_par_statut.items():
+        DemandePret.objects.filter(pk__in=ids).update(statut=statut)
+
+    statistiques.enregistrer_changements(
+        (tuple(etats[d['id']]), (d['statut'], *etats[d['id']][1:])) for d in decisions
+    )
+
+    return {statut: len(ids) for statut, ids in ids_par_statut.items()}
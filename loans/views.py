@@ -1,10 +1,27 @@
-from rest_framework import generics, permissions
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import generics, permissions, status
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from .models import DemandePret, HistoriqueStatut
+from Pret.conditionnel import ConditionalGetMixin
+from Pret.pagination import CursorPaginationMixin
+from pieces.models import PieceJointe
+from .amortissement import echeancier, synthese
+from .export import FORMATS, lignes_export
+from .portefeuille import projection
+from . import recherche
+from .statistiques import SANS_TYPE
+
+from .models import DUREE_MAX_MOIS, DemandePret, HistoriqueStatut, StatistiqueDemande, TypePret
 from .serializers import (
     DemandePretSerializer, DemandePretCreateSerializer,
-    HistoriqueStatutSerializer
+    HistoriqueStatutSerializer, DecisionStatutSerializer
 )
+from .utils import appliquer_changements_statut
 
 # ✅ Soumission de demande (fonctionnaire)
 class DemandePretCreateView(generics.CreateAPIView):
@@ -15,27 +32,59 @@ class DemandePretCreateView(generics.CreateAPIView):
         serializer.save(fonctionnaire=self.request.user)
 
 # ✅ Liste des demandes de l'utilisateur connecté
-class MesDemandesView(generics.ListAPIView):
+class MesDemandesView(CursorPaginationMixin, generics.ListAPIView):
     serializer_class = DemandePretSerializer
     permission_classes = [permissions.IsAuthenticated]
+    cursor_ordering = ('date_soumission', 'id')
 
     def get_queryset(self):
         user = self.request.user
+        queryset = DemandePret.objects.avec_relations().order_by(*self.cursor_ordering)
         if user.is_staff:  # ou user.role == 'administrateur'
-            return DemandePret.objects.all()
-        return DemandePret.objects.filter(fonctionnaire=user)
+            return queryset
+        return queryset.filter(fonctionnaire=user)
 
 # ✅ Détail d’une demande
-class DemandePretDetailView(generics.RetrieveAPIView):
-    queryset = DemandePret.objects.all()
+class DemandePretDetailView(ConditionalGetMixin, generics.RetrieveAPIView):
+    queryset = DemandePret.objects.avec_relations()
     serializer_class = DemandePretSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def validateurs(self):
+        # Une ligne : les colonnes sérialisées, les pièces jointes (leurs ids sont dans la réponse),
+        # le compteur de non-lus, et pour Last-Modified le dernier changement de statut ou ajout de pièce
+        dernier_statut = (
+            HistoriqueStatut.objects.filter(demande=OuterRef('pk'))
+            .order_by('-date_modification', '-id').values('date_modification')[:1]
+        )
+        pieces = PieceJointe.objects.filter(demande=OuterRef('pk')).order_by().values('demande')
+        ligne = (
+            self.filter_queryset(self.get_queryset()).prefetch_related(None).filter(pk=self.kwargs['pk'])
+            .annotate(
+                nombre_pieces=Subquery(pieces.annotate(nombre=Count('id')).values('nombre')),
+                derniere_piece=Subquery(pieces.annotate(dernier=Max('id')).values('dernier')),
+                derniere_modification=Greatest(
+                    Coalesce(Subquery(dernier_statut), 'date_soumission'),
+                    Coalesce(Subquery(pieces.annotate(ajout=Max('date_ajout')).values('ajout')), 'date_soumission'),
+                ),
+            )
+            .values_list(
+                'fonctionnaire_id', 'fonctionnaire__last_name', 'type_pret_id', 'montant', 'duree_remboursement',
+                'adresse_bien', 'statut', 'numero_dossier', 'date_soumission', 'nombre_pieces', 'derniere_piece',
+                'compteur_non_lus__pour_fonctionnaire', 'compteur_non_lus__pour_administration', 'derniere_modification',
+            )
+            .first()
+        )
+        if ligne is None:
+            return None
+        return ligne, ligne[-1]
+
 # ✅ Mise à jour du statut (admin)
 class ChangerStatutView(generics.UpdateAPIView):
     queryset = DemandePret.objects.all()
     serializer_class = HistoriqueStatutSerializer
     permission_classes = [permissions.IsAdminUser]
+    authentification_stricte = True  # is_staff relu en base (users.authentication)
 
     def perform_update(self, serializer):
         demande = self.get_object()
@@ -52,3 +101,187 @@ class ChangerStatutView(generics.UpdateAPIView):
         # mettre à jour la demande
         demande.statut = nouveau_statut
         demande.save()
+
+# ✅ Mise à jour du statut par lot, ex. décisions d'une commission (admin)
+class ChangerStatutLotView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+    authentification_stricte = True
+    taille_max = 500
+
+    def post(self, request):
+        decisions = request.data.get('decisions') if isinstance(request.data, dict) else None
+        if not isinstance(decisions, list) or not decisions:
+            return Response({"detail": "Le champ 'decisions' doit être une liste non vide."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(decisions) > self.taille_max:
+            return Response({"detail": f"Un lot ne peut pas dépasser {self.taille_max} décisions."}, status=status.HTTP_400_BAD_REQUEST)
+
+        erreurs = {}
+        valides = []
+        for index, decision in enumerate(decisions):
+            serializer = DecisionStatutSerializer(data=decision)
+            if serializer.is_valid():
+                valides.append((index, serializer.validated_data))
+            else:
+                erreurs[index] = serializer.errors
+
+        existantes = set(DemandePret.objects.filter(pk__in=[d['id'] for _, d in valides]).values_list('pk', flat=True))
+        vues = set()
+        for index, decision in valides:
+            if decision['id'] not in existantes:
+                erreurs[index] = {"id": ["Demande introuvable."]}
+            elif decision['id'] in vues:
+                erreurs[index] = {"id": ["Cette demande figure plusieurs fois dans le lot."]}
+            vues.add(decision['id'])
+
+        # Tout ou rien : aucune décision n'est appliquée si l'une d'elles est invalide
+        if erreurs:
+            return Response({
+                "detail": "Aucune décision n'a été appliquée.",
+                "erreurs": [
+                    {"index": index, "id": decisions[index].get('id') if isinstance(decisions[index], dict) else None, "erreurs": erreurs[index]}
+                    for index in sorted(erreurs)
+                ],
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        par_statut = appliquer_changements_statut([decision for _, decision in valides])
+        return Response({"modifiees": len(valides), "par_statut": par_statut}, status=status.HTTP_200_OK)
+
+
+# ✅ Export complet des demandes en flux (admin)
+class ExportDemandesView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+    authentification_stricte = True
+
+    def get(self, request):
+        format_export = request.query_params.get('type_fichier', 'csv')
+        if format_export not in FORMATS:
+            return Response({"detail": f"Format inconnu, choix possibles : {', '.join(sorted(FORMATS))}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = DemandePret.objects.all()
+        statut = request.query_params.get('statut')
+        if statut:
+            queryset = queryset.filter(statut=statut)
+
+        response = StreamingHttpResponse(lignes_export(format_export, queryset), content_type=FORMATS[format_export])
+        nom_fichier = f"demandes-{timezone.localdate():%Y%m%d}.{format_export}"
+        response['Content-Disposition'] = f'attachment; filename="{nom_fichier}"'
+        return response
+
+
+# ✅ Tableau de bord : lit uniquement les lignes de synthèse (admin)
+class StatistiquesView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        lignes = {'statut': [], 'type_pret': [], 'mois': []}
+        for ligne in StatistiqueDemande.objects.filter(nombre__gt=0).order_by('dimension', 'cle'):
+            lignes[ligne.dimension].append(ligne)
+
+        libelles_statut = dict(DemandePret.STATUT_CHOICES)
+        noms_types = dict(TypePret.objects.values_list('id', 'nom'))
+
+        def donnees(ligne, **extra):
+            return {'nombre': ligne.nombre, 'montant_total': ligne.montant_total, **extra}
+
+        return Response({
+            'total': {
+                'nombre': sum(l.nombre for l in lignes['statut']),
+                'montant_total': sum(l.montant_total for l in lignes['statut']),
+            },
+            'par_statut': [donnees(l, statut=l.cle, libelle=libelles_statut.get(l.cle, l.cle)) for l in lignes['statut']],
+            'par_type_pret': [
+                donnees(l, type_pret=None if l.cle == SANS_TYPE else int(l.cle), nom=noms_types.get(int(l.cle)) if l.cle != SANS_TYPE else None)
+                for l in lignes['type_pret']
+            ],
+            'par_mois': [donnees(l, mois=l.cle) for l in lignes['mois']],
+        })
+
+
+# ✅ Tableau d'amortissement d'une demande (taux du type de prêt)
+class EcheancierView(generics.GenericAPIView):
+    queryset = DemandePret.objects.select_related('type_pret')
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        demande = self.get_object()
+        if not request.user.is_staff and demande.fonctionnaire_id != request.user.id:
+            raise PermissionDenied("Vous n'avez pas accès à l'échéancier de cette demande.")
+        # Bornée aussi pour les demandes enregistrées avant la validation du modèle : l'échéancier
+        # alloue des tableaux proportionnels à la durée
+        if not 0 < demande.duree_remboursement <= DUREE_MAX_MOIS:
+            return Response({"detail": "La durée de remboursement de cette demande est invalide."}, status=status.HTTP_400_BAD_REQUEST)
+
+        taux = demande.type_pret.taux_annuel if demande.type_pret else 0
+        resume = synthese([demande.montant], [taux], [demande.duree_remboursement])
+        colonnes = echeancier(demande.montant, taux, demande.duree_remboursement)
+        return Response({
+            'demande': demande.id,
+            'taux_annuel': float(taux),
+            **{cle: valeurs.item() for cle, valeurs in resume.items()},
+            'echeances': [dict(zip(colonnes, ligne)) for ligne in zip(*(valeurs.tolist() for valeurs in colonnes.values()))],
+        })
+
+
+# ✅ Tarification de nombreuses demandes en un seul calcul vectorisé (admin)
+class TarificationLotView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+    taille_max = 10000
+
+    def post(self, request):
+        donnees = request.data if isinstance(request.data, dict) else {}
+        ids = donnees.get('demandes')
+        statut = donnees.get('statut')
+        queryset = DemandePret.objects.filter(duree_remboursement__gt=0)
+        if ids is not None:
+            if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+                return Response({"detail": "Le champ 'demandes' doit être une liste d'identifiants."}, status=status.HTTP_400_BAD_REQUEST)
+            if len(ids) > self.taille_max:
+                return Response({"detail": f"Un lot ne peut pas dépasser {self.taille_max} demandes."}, status=status.HTTP_400_BAD_REQUEST)
+            queryset = queryset.filter(pk__in=ids)
+        elif statut:
+            queryset = queryset.filter(statut=statut)
+        else:
+            return Response({"detail": "Indiquer 'demandes' (liste d'identifiants) ou 'statut'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Une seule requête, puis un seul calcul NumPy pour tout le lot
+        lignes = list(queryset.order_by('id').values_list('id', 'montant', 'duree_remboursement', 'type_pret__taux_annuel'))
+        if not lignes:
+            return Response({"nombre": 0, "resultats": []})
+        identifiants, montants, durees, taux = zip(*lignes)
+        resultat = synthese(montants, [t or 0 for t in taux], durees)
+        colonnes = {cle: valeurs.tolist() for cle, valeurs in resultat.items()}
+        return Response({
+            "nombre": len(identifiants),
+            "resultats": [
+                {'demande': identifiant, **{cle: valeurs[i] for cle, valeurs in colonnes.items()}}
+                for i, identifiant in enumerate(identifiants)
+            ],
+        })
+
+
+# ✅ Projection du portefeuille accepté : encaissements mensuels et encours (admin, en cache)
+class ProjectionPortefeuilleView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        horizon = request.query_params.get('horizon')
+        if horizon is not None and (not horizon.isdigit() or int(horizon) == 0):
+            return Response({"detail": "Le paramètre 'horizon' doit être un nombre de mois positif."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(projection(int(horizon) if horizon else None))
+
+
+# ✅ Recherche plein texte des demandes, classée par pertinence (toutes pour l'admin, les siennes sinon)
+class RechercheDemandesView(generics.ListAPIView):
+    serializer_class = DemandePretSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    filter_backends = []  # la recherche passe par l'index (loans.recherche), pas par SearchFilter
+
+    def list(self, request, *args, **kwargs):
+        texte = request.query_params.get('q', '').strip()
+        if not texte:
+            return Response({"detail": "Le paramètre 'q' est requis."}, status=status.HTTP_400_BAD_REQUEST)
+        ids = recherche.rechercher(texte, fonctionnaire=None if request.user.is_staff else request.user)
+        page = self.paginate_queryset(ids)
+        demandes = DemandePret.objects.avec_relations().in_bulk(page)
+        serializer = self.get_serializer([demandes[pk] for pk in page if pk in demandes], many=True)
+        return self.get_paginated_response(serializer.data)
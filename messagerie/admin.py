@@ -1,13 +1,20 @@
 from django.urls import reverse
 from django.utils.html import format_html
 from django.contrib import admin
+
+from Pret.admin import GrandeTableAdminMixin
 from .models import Message
 
 
 @admin.register(Message)
-class MessageAdmin(admin.ModelAdmin):
+class MessageAdmin(GrandeTableAdminMixin, admin.ModelAdmin):
     list_display = ['demande', 'auteur', 'auteur_last_name', 'contenu', 'date_envoi', 'lu']
+    # DemandePret.__str__ lit l'e-mail du fonctionnaire, auteur_last_name celui de l'auteur
+    list_select_related = ['demande__fonctionnaire', 'auteur']
+    date_hierarchy = 'date_envoi'  # index message_date_idx
+    autocomplete_fields = ['demande', 'auteur']
     readonly_fields = ['date_envoi', 'lu']
+    ordering = ['-date_envoi']
 
     def save_model(self, request, obj, form, change):
         if not obj.pk:  # Si c'est un nouvel objet
@@ -21,7 +28,7 @@ class MessageAdmin(admin.ModelAdmin):
 
     def repondre_link(self, obj):
         # Remplace 'messagerie' par le nom réel de ton app
-        url = reverse("admin:messagerie_message_add") + f"?demande={obj.demande.id}"
+        url = reverse("admin:messagerie_message_add") + f"?demande={obj.demande_id}"
         return format_html(f'<a class="button" href="{url}">Répondre</a>')
     repondre_link.short_description = "Répondre"
 
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MessagerieConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'messagerie'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,75 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, Exists, F, OuterRef, Q, When
+
+from loans.models import DemandePret
+from .models import CompteurNonLus, Message
+
+
+def champ_destinataire(auteur_id, fonctionnaire_id):
+    # Un message du titulaire est destiné à l'administration, et inversement
+    return 'pour_administration' if auteur_id == fonctionnaire_id else 'pour_fonctionnaire'
+
+
+def champ_lecteur(user, demande):
+    if demande.fonctionnaire_id == user.pk:
+        return 'pour_fonctionnaire'
+    if user.is_staff:
+        return 'pour_administration'
+    return None
+
+
+def ajuster(demande_id, champ, delta):
+    compteur = CompteurNonLus.objects.filter(demande_id=demande_id)
+    # Sans ligne, une baisse n'a rien à décompter (et la demande peut être en cours de suppression)
+    if compteur.update(**{champ: F(champ) + delta}) or delta <= 0:
+        return
+    try:
+        with transaction.atomic():
+            CompteurNonLus.objects.create(demande_id=demande_id, **{champ: max(delta, 0)})
+    except IntegrityError:
+        compteur.update(**{champ: F(champ) + delta})
+
+
+def decompter_supprime(demande_id, auteur_id):
+    """Retire du compteur un message non lu supprimé, en une requête et sans charger la demande."""
+    du_titulaire = Exists(DemandePret.objects.filter(pk=OuterRef('demande_id'), fonctionnaire_id=auteur_id))
+    CompteurNonLus.objects.filter(demande_id=demande_id).update(
+        pour_administration=Case(When(du_titulaire, then=F('pour_administration') - 1), default=F('pour_administration')),
+        pour_fonctionnaire=Case(When(du_titulaire, then=F('pour_fonctionnaire')), default=F('pour_fonctionnaire') - 1),
+    )
+
+
+def marquer_lus(demande, user):
+    """Marque lus, en une requête, les messages de la demande destinés à `user`. Retourne leur nombre."""
+    champ = champ_lecteur(user, demande)
+    if champ is None:
+        return 0
+    messages = Message.objects.filter(demande=demande, lu=False)
+    if champ == 'pour_fonctionnaire':
+        messages = messages.exclude(auteur_id=demande.fonctionnaire_id)
+    else:
+        messages = messages.filter(auteur_id=demande.fonctionnaire_id)
+    with transaction.atomic():
+        nombre = messages.update(lu=True)
+        if nombre:
+            ajuster(demande.pk, champ, -nombre)
+    return nombre
+
+
+def calculer_compteurs(messages):
+    """(demande_id, pour_fonctionnaire, pour_administration) recalculés à partir des messages non lus."""
+    du_titulaire = Q(auteur_id=F('demande__fonctionnaire_id'))
+    lignes = (
+        messages.filter(lu=False).order_by().values('demande_id')
+        .annotate(pour_administration=Count('id', filter=du_titulaire), pour_fonctionnaire=Count('id', filter=~du_titulaire))
+    )
+    return [(l['demande_id'], l['pour_fonctionnaire'], l['pour_administration']) for l in lignes]
+
+
+@transaction.atomic
+def recalculer():
+    CompteurNonLus.objects.all().delete()
+    CompteurNonLus.objects.bulk_create([
+        CompteurNonLus(demande_id=demande_id, pour_fonctionnaire=fonctionnaire, pour_administration=administration)
+        for demande_id, fonctionnaire, administration in calculer_compteurs(Message.objects.all())
+    ])
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import secrets
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from .models import Message
+
+CHAMPS = ('id', 'demande_id', 'demande__fonctionnaire_id', 'auteur__email', 'auteur__last_name', 'contenu', 'date_envoi', 'lu')
+
+
+def _flux_setting(nom):
+    defauts = {
+        'POLL_INTERVAL': 1.0,        # secondes entre deux lectures de la base par le diffuseur
+        'HEARTBEAT_INTERVAL': 15.0,  # commentaire SSE envoyé quand rien ne se passe
+        'MAX_BACKLOG': 500,          # messages renvoyés au plus lors d'une reprise (Last-Event-ID)
+        'QUEUE_SIZE': 100,           # lots en attente par client avant déconnexion
+        'TICKET_TTL': 30,            # secondes de validité d'un ticket d'ouverture du flux
+    }
+    return getattr(settings, 'MESSAGE_STREAM', {}).get(nom, defauts[nom])
+
+
+def _cle_ticket(ticket):
+    return f"messagerie:ticket-flux:{ticket}"
+
+
+def emettre_ticket(user, expire_le=None):
+    """
+    Ticket opaque, à usage unique et de courte durée, à passer en `?ticket=` à l'ouverture du flux :
+    EventSource ne sait pas envoyer d'en-tête Authorization, et le jeton d'accès n'a rien à faire
+    dans une URL (journaux d'accès, historique). `expire_le` (timestamp) borne la durée du flux.
+    """
+    ticket = secrets.token_urlsafe(32)
+    cache.set(_cle_ticket(ticket), (user.pk, expire_le), _flux_setting('TICKET_TTL'))
+    return ticket
+
+
+def consommer_ticket(ticket):
+    """(user_id, expire_le) du ticket, ou None s'il est inconnu, expiré ou déjà utilisé."""
+    cle = _cle_ticket(ticket)
+    contenu = cache.get(cle)
+    # delete() ne renvoie True qu'à un seul des appelants concurrents
+    if contenu is None or not cache.delete(cle):
+        return None
+    return contenu
+
+
+def compte_actif(user_id):
+    return get_user_model().objects.filter(pk=user_id, is_active=True).exists()
+
+
+def messages_apres(dernier_id, limite, fonctionnaire_id=None):
+    messages = Message.objects.filter(id__gt=dernier_id).order_by('id')
+    if fonctionnaire_id is not None:
+        messages = messages.filter(demande__fonctionnaire_id=fonctionnaire_id)
+    return [dict(zip(CHAMPS, ligne)) for ligne in messages.values_list(*CHAMPS)[:limite]]
+
+
+def dernier_id_message():
+    return Message.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def visible_par(message, user):
+    return user.is_staff or message['demande__fonctionnaire_id'] == user.pk
+
+
+def evenement_sse(message):
+    donnees = {
+        'id': message['id'],
+        'demande': message['demande_id'],
+        'auteur_email': message['auteur__email'],
+        'auteur_last_name': message['auteur__last_name'],
+        'contenu': message['contenu'],
+        'date_envoi': message['date_envoi'].isoformat(),
+        'lu': message['lu'],
+    }
+    return f"id: {message['id']}\nevent: message\ndata: {json.dumps(donnees, ensure_ascii=False)}\n\n"
+
+
+class DiffuseurMessages:
+    """
+    Une seule lecture de la base par intervalle, quel que soit le nombre de clients connectés :
+    les nouveaux messages sont déposés dans la file de chaque abonné, qui filtre ce qu'il peut voir.
+    """
+
+    def __init__(self):
+        self.abonnes = set()
+        self.dernier_id = None
+        self.tache = None
+        self.reveil = asyncio.Event()
+
+    def en_diffusion(self):
+        return self.tache is not None and not self.tache.done()
+
+    async def abonner(self):
+        file = asyncio.Queue(maxsize=_flux_setting('QUEUE_SIZE'))
+        if not self.en_diffusion():
+            # Sans diffusion en cours, dernier_id date du départ du dernier abonné : on repart du
+            # dernier message, sans rejouer ce qui a été envoyé entre-temps
+            dernier_id = await sync_to_async(dernier_id_message)()
+            if not self.en_diffusion():  # un autre abonné a pu la relancer pendant la lecture
+                self.dernier_id = dernier_id
+                self.tache = asyncio.create_task(self._diffuser())
+        self.abonnes.add(file)
+        return file
+
+    def desabonner(self, file):
+        self.abonnes.discard(file)
+
+    async def _diffuser(self):
+        while self.abonnes:
+            self.reveil.clear()
+            messages = await sync_to_async(messages_apres)(self.dernier_id, _flux_setting('MAX_BACKLOG'))
+            if messages:
+                self.dernier_id = messages[-1]['id']
+                for file in list(self.abonnes):
+                    try:
+                        file.put_nowait(messages)
+                    except asyncio.QueueFull:
+                        # Client trop lent : on vide sa file et on le déconnecte, il reprendra
+                        # avec Last-Event-ID à partir du dernier message effectivement reçu.
+                        self.desabonner(file)
+                        while not file.empty():
+                            file.get_nowait()
+                        file.put_nowait(None)
+            if len(messages) < _flux_setting('MAX_BACKLOG'):
+                try:
+                    await asyncio.wait_for(self.reveil.wait(), _flux_setting('POLL_INTERVAL'))
+                except asyncio.TimeoutError:
+                    pass
+
+
+# Un diffuseur par boucle d'événements (un par processus ASGI). Le diffuseur retient sa boucle
+# (Event, tâche) : les boucles fermées sont retirées explicitement, pas par référence faible.
+_diffuseurs = {}
+
+
+def obtenir_diffuseur():
+    boucle = asyncio.get_running_loop()
+    if boucle not in _diffuseurs:
+        _diffuseurs[boucle] = DiffuseurMessages()
+    return _diffuseurs[boucle]
+
+
+def signaler_nouveau_message():
+    # Appelé depuis n'importe quel thread (on_commit d'un message) : un flux mort ne doit
+    # jamais faire échouer l'enregistrement du message
+    for boucle, diffuseur in list(_diffuseurs.items()):
+        if boucle.is_closed():
+            _diffuseurs.pop(boucle, None)
+            continue
+        try:
+            boucle.call_soon_threadsafe(diffuseur.reveil.set)
+        except RuntimeError:  # boucle fermée entre-temps
+            _diffuseurs.pop(boucle, None)
+
+
+async def flux_evenements(user, dernier_id, expire_le=None):
+    """
+    Événements SSE des messages visibles par `user`. Le flux se ferme à `expire_le` (expiration du
+    jeton qui l'a ouvert) et dès qu'un battement de cœur trouve le compte désactivé.
+    """
+    diffuseur = obtenir_diffuseur()
+    file = await diffuseur.abonner()
+    try:
+        yield "retry: 3000\n\n"
+        if dernier_id is not None:
+            # Reprise : messages manqués depuis le dernier événement reçu par le client
+            fonctionnaire_id = None if user.is_staff else user.pk
+            while True:
+                rattrapage = await sync_to_async(messages_apres)(dernier_id, _flux_setting('MAX_BACKLOG'), fonctionnaire_id)
+                for message in rattrapage:
+                    yield evenement_sse(message)
+                    dernier_id = message['id']
+                if len(rattrapage) < _flux_setting('MAX_BACKLOG'):
+                    break
+        dernier_id = dernier_id or 0
+
+        while True:
+            attente = _flux_setting('HEARTBEAT_INTERVAL')
+            if expire_le is not None:
+                attente = min(attente, expire_le - time.time())
+            try:
+                messages = await asyncio.wait_for(file.get(), attente)
+            except asyncio.TimeoutError:
+                if expire_le is not None and time.time() >= expire_le:
+                    return
+                if not await sync_to_async(compte_actif)(user.pk):
+                    return
+                yield ": ping\n\n"
+                continue
+            if messages is None:
+                return
+            for message in messages:
+                if message['id'] > dernier_id and visible_par(message, user):
+                    yield evenement_sse(message)
+                    dernier_id = message['id']
+    finally:
+        diffuseur.desabonner(file)
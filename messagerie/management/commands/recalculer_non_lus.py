@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from messagerie import compteurs
+from messagerie.models import CompteurNonLus
+
+
+class Command(BaseCommand):
+    help = "Recalcule les compteurs de messages non lus à partir de Message.lu."
+
+    def handle(self, *args, **options):
+        compteurs.recalculer()
+        self.stdout.write(f"{CompteurNonLus.objects.count()} compteur(s) recalculé(s).")
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Q
+
+
+def remplir_compteurs(apps, schema_editor):
+    # Copie figée de messagerie.compteurs.calculer_compteurs : la migration ne dépend pas du code courant
+    Message = apps.get_model('messagerie', 'Message')
+    CompteurNonLus = apps.get_model('messagerie', 'CompteurNonLus')
+    du_titulaire = Q(auteur_id=F('demande__fonctionnaire_id'))
+    lignes = (
+        Message.objects.using(schema_editor.connection.alias).filter(lu=False).order_by().values('demande_id')
+        .annotate(pour_administration=Count('id', filter=du_titulaire), pour_fonctionnaire=Count('id', filter=~du_titulaire))
+    )
+    CompteurNonLus.objects.using(schema_editor.connection.alias).bulk_create([
+        CompteurNonLus(
+            demande_id=ligne['demande_id'],
+            pour_fonctionnaire=ligne['pour_fonctionnaire'],
+            pour_administration=ligne['pour_administration'],
+        )
+        for ligne in lignes
+    ])
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0005_statistiquedemande'),
+        ('messagerie', '0002_index_acces'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompteurNonLus',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pour_fonctionnaire', models.IntegerField(default=0)),
+                ('pour_administration', models.IntegerField(default=0)),
+                ('demande', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='compteur_non_lus', to='loans.demandepret')),
+            ],
+        ),
+        migrations.RunPython(remplir_compteurs, migrations.RunPython.noop),
+    ]
@@ -9,5 +9,24 @@ class Message(models.Model):
     date_envoi = models.DateTimeField(auto_now_add=True)
     lu = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['demande', 'date_envoi', 'id'], name='message_demande_date_idx'),
+            models.Index(fields=['auteur', 'date_envoi', 'id'], name='message_auteur_date_idx'),
+            models.Index(fields=['date_envoi', 'id'], name='message_date_idx'),
+        ]
+
     def __str__(self):
         return f"{self.auteur.email} → {self.demande.numero_dossier} [{self.date_envoi}]"
+
+
+
+class CompteurNonLus(models.Model):
+    # `Message.lu` est un indicateur unique par message : un message non lu l'est soit pour
+    # le fonctionnaire titulaire de la demande, soit pour l'administration.
+    demande = models.OneToOneField(DemandePret, on_delete=models.CASCADE, related_name='compteur_non_lus')
+    pour_fonctionnaire = models.IntegerField(default=0)
+    pour_administration = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.demande_id} : {self.pour_fonctionnaire} / {self.pour_administration}"
@@ -0,0 +1,30 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from loans.models import DemandePret
+from . import compteurs, flux
+from .models import Message
+
+
+@receiver(post_save, sender=Message)
+def compter_nouveau_message(sender, instance, created, raw, **kwargs):
+    if created and not raw and not instance.lu:
+        champ = compteurs.champ_destinataire(instance.auteur_id, instance.demande.fonctionnaire_id)
+        compteurs.ajuster(instance.demande_id, champ, 1)
+
+
+@receiver(post_save, sender=Message)
+def reveiller_flux(sender, instance, created, raw, **kwargs):
+    # Diffusion immédiate aux clients SSE de ce processus ; les autres le voient au prochain intervalle
+    if created and not raw:
+        transaction.on_commit(flux.signaler_nouveau_message)
+
+
+@receiver(post_delete, sender=Message)
+def decompter_message_supprime(sender, instance, origin=None, **kwargs):
+    # Suppression en cascade d'une demande : son compteur disparaît avec elle
+    if isinstance(origin, DemandePret) or getattr(origin, 'model', None) is DemandePret:
+        return
+    if not instance.lu:
+        compteurs.decompter_supprime(instance.demande_id, instance.auteur_id)
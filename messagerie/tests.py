@@ -1,3 +1,302 @@
-from django.test import TestCase
+import asyncio
+import time
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from loans.tests import PlanRequetesMixin, creer_demande, creer_utilisateur
+from users.models import User
+from . import compteurs, flux
+from .models import CompteurNonLus, Message
+
+
+class BudgetRequetesMessagesTests(TestCase):
+    """Le nombre de requêtes ne doit pas dépendre du nombre de messages listés."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = creer_utilisateur('admin', is_staff=True)
+        cls.fonctionnaire = creer_utilisateur('agent')
+        cls.demande = creer_demande(cls.fonctionnaire)
+        for i in range(5):
+            auteur = cls.admin if i % 2 else cls.fonctionnaire
+            Message.objects.create(demande=cls.demande, auteur=auteur, contenu=f"Message {i}")
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_messages_d_une_demande(self):
+        self.client.force_authenticate(self.fonctionnaire)
+        # validateurs (ETag) + COUNT + messages
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('demande-messages', args=[self.demande.pk]))
+        self.assertEqual(response.data['count'], 5)
+
+    def test_mes_messages_admin(self):
+        self.client.force_authenticate(self.admin)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('mes-messages'))
+        self.assertEqual(response.data['count'], 5)
+
+
+class GetConditionnelMessagesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = creer_utilisateur('admin', is_staff=True)
+        cls.fonctionnaire = creer_utilisateur('agent')
+        cls.demande = creer_demande(cls.fonctionnaire)
+        Message.objects.create(demande=cls.demande, auteur=cls.admin, contenu="Pièce manquante")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.fonctionnaire)
+        self.url = reverse('demande-messages', args=[self.demande.pk])
+
+    def test_304_en_une_requete(self):
+        response = self.client.get(self.url)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+    def test_etag_change_avec_un_envoi_ou_une_lecture(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.post(reverse('marquer-messages-lus', args=[self.demande.pk]))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['results'][0]['lu'])
+
+        etag = response['ETag']
+        self.client.post(self.url, {'demande': self.demande.pk, 'contenu': "Envoyée ce matin"})
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+
+    def test_etag_propre_a_la_page(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url + '?pagination=curseur', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class PlanRequetesMessagesTests(PlanRequetesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = creer_utilisateur('admin', is_staff=True)
+        cls.fonctionnaire = creer_utilisateur('agent')
+        cls.demande = creer_demande(cls.fonctionnaire)
+        Message.objects.create(demande=cls.demande, auteur=cls.fonctionnaire, contenu="Bonjour")
+
+    def test_vues_api(self):
+        self.client = APIClient()
+        for utilisateur in (self.admin, self.fonctionnaire):
+            self.client.force_authenticate(utilisateur)
+            for url in (reverse('demande-messages', args=[self.demande.pk]), reverse('mes-messages')):
+                self.assertPlansIndexes(self.capturer(url))
+                self.assertPlansIndexes(self.capturer(url + '?pagination=curseur'))
+
+
+class CompteursNonLusTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = creer_utilisateur('admin', is_staff=True)
+        cls.fonctionnaire = creer_utilisateur('agent')
+        cls.demandes = [creer_demande(cls.fonctionnaire) for _ in range(2)]
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def envoyer(self, auteur, demande, contenu="Bonjour"):
+        self.client.force_authenticate(auteur)
+        response = self.client.post(reverse('demande-messages', args=[demande.pk]), {'demande': demande.pk, 'contenu': contenu})
+        self.assertEqual(response.status_code, 201)
+
+    def test_compteurs_et_lecture_groupee(self):
+        for _ in range(3):
+            self.envoyer(self.admin, self.demandes[0])
+        self.envoyer(self.admin, self.demandes[1])
+        self.envoyer(self.fonctionnaire, self.demandes[0])
+
+        self.client.force_authenticate(self.fonctionnaire)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('mes-non-lus'))
+        self.assertEqual(response.data['total'], 4)
+        self.assertEqual(response.data['demandes'], [
+            {'demande': self.demandes[0].pk, 'non_lus': 3},
+            {'demande': self.demandes[1].pk, 'non_lus': 1},
+        ])
+        liste = self.client.get(reverse('mes-demandes')).data['results']
+        self.assertEqual([d['messages_non_lus'] for d in liste], [3, 1])
+
+        with self.assertNumQueries(5):  # demande, SAVEPOINT, UPDATE messages, UPDATE compteur, RELEASE
+            response = self.client.post(reverse('marquer-messages-lus', args=[self.demandes[0].pk]))
+        self.assertEqual(response.data['marques_lus'], 3)
+        self.assertEqual(self.client.get(reverse('mes-non-lus')).data['total'], 1)
+        # le message du fonctionnaire reste non lu pour l'administration
+        self.assertFalse(Message.objects.get(auteur=self.fonctionnaire).lu)
+
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get(reverse('mes-non-lus')).data['total'], 1)
+        self.assertEqual(self.client.post(reverse('marquer-messages-lus', args=[self.demandes[0].pk])).data['marques_lus'], 1)
+        self.assertEqual(self.client.get(reverse('mes-non-lus')).data['total'], 0)
+
+    def test_recalcul(self):
+        self.envoyer(self.admin, self.demandes[0])
+        self.envoyer(self.fonctionnaire, self.demandes[0])
+        attendu = list(CompteurNonLus.objects.values_list('demande_id', 'pour_fonctionnaire', 'pour_administration'))
+        CompteurNonLus.objects.update(pour_fonctionnaire=7)
+        compteurs.recalculer()
+        self.assertEqual(list(CompteurNonLus.objects.values_list('demande_id', 'pour_fonctionnaire', 'pour_administration')), attendu)
+        self.assertEqual(attendu, [(self.demandes[0].pk, 1, 1)])
+
+    def test_suppression_d_un_message_non_lu(self):
+        self.envoyer(self.admin, self.demandes[0])
+        self.envoyer(self.fonctionnaire, self.demandes[0])
+        for message in Message.objects.order_by('id'):
+            with self.assertNumQueries(2):  # DELETE, UPDATE compteur (sans charger la demande)
+                message.delete()
+        self.assertEqual(
+            list(CompteurNonLus.objects.values_list('pour_fonctionnaire', 'pour_administration')), [(0, 0)]
+        )
+
+    def test_suppression_d_une_demande_avec_messages_non_lus(self):
+        for _ in range(2):
+            self.envoyer(self.admin, self.demandes[0])
+        self.envoyer(self.fonctionnaire, self.demandes[1])
+        self.demandes[0].delete()
+        self.assertFalse(CompteurNonLus.objects.filter(demande_id=self.demandes[0].pk).exists())
+        self.fonctionnaire.delete()  # ses demandes restantes, leurs messages et compteurs en cascade
+        self.assertFalse(CompteurNonLus.objects.exists())
+        self.assertFalse(Message.objects.exists())
+
+    def test_acces_refuse_aux_autres(self):
+        self.client.force_authenticate(creer_utilisateur('autre'))
+        self.assertEqual(self.client.post(reverse('marquer-messages-lus', args=[self.demandes[0].pk])).status_code, 403)
+
+
+@override_settings(MESSAGE_STREAM={'POLL_INTERVAL': 0.05, 'HEARTBEAT_INTERVAL': 5})
+class FluxMessagesTests(TransactionTestCase):
+
+    def setUp(self):
+        self.admin = creer_utilisateur('admin', is_staff=True)
+        self.fonctionnaire = creer_utilisateur('agent')
+        self.demande = creer_demande(self.fonctionnaire)
+        self.autre_demande = creer_demande(creer_utilisateur('autre'))
+        self.premier = Message.objects.create(demande=self.demande, auteur=self.admin, contenu="Ancien")
+        Message.objects.create(demande=self.demande, auteur=self.admin, contenu="Manqué")
+
+    async def lire_evenements(self, response, nombre):
+        evenements = []
+        contenu = response.streaming_content
+        while len(evenements) < nombre:
+            morceau = await asyncio.wait_for(anext(contenu), 5)
+            morceau = morceau.decode() if isinstance(morceau, bytes) else morceau
+            if morceau.startswith('id:'):
+                evenements.append(morceau)
+        await contenu.aclose()
+        return evenements
+
+    async def obtenir_ticket(self, user):
+        jeton = str(AccessToken.for_user(user))
+        response = await self.async_client.post(reverse('ticket-flux'), headers={'Authorization': f'Bearer {jeton}'})
+        self.assertEqual(response.status_code, 201)
+        return response.json()['ticket']
+
+    async def test_reprise_puis_diffusion(self):
+        ticket = await self.obtenir_ticket(self.fonctionnaire)
+        response = await self.async_client.get(
+            reverse('flux-messages') + f'?ticket={ticket}', headers={'Last-Event-ID': str(self.premier.pk)}
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        async def publier():
+            await asyncio.sleep(0.2)
+            creer = sync_to_async(Message.objects.create)
+            await creer(demande=self.autre_demande, auteur=self.admin, contenu="Invisible")
+            await creer(demande=self.demande, auteur=self.admin, contenu="Nouveau")
+
+        tache = asyncio.create_task(publier())
+        evenements = await self.lire_evenements(response, 2)
+        await tache
+        self.assertIn('"contenu": "Manqué"', evenements[0])
+        self.assertIn('"contenu": "Nouveau"', evenements[1])
+
+    async def test_reprise_sans_abonne_depuis_le_dernier_message(self):
+        diffuseur = flux.obtenir_diffuseur()
+        file = await diffuseur.abonner()
+        diffuseur.desabonner(file)
+        await diffuseur.tache  # plus d'abonné : la diffusion s'arrête
+        nouveau = await sync_to_async(Message.objects.create)(demande=self.demande, auteur=self.admin, contenu="Entre deux")
+        file = await diffuseur.abonner()
+        self.assertEqual(diffuseur.dernier_id, nouveau.pk)
+        diffuseur.desabonner(file)
+        await diffuseur.tache
+
+    def test_boucle_fermee_sans_effet_sur_les_envois(self):
+        async def ouvrir():
+            flux.obtenir_diffuseur()
+
+        asyncio.run(ouvrir())  # boucle fermée en sortie, comme après l'arrêt d'un serveur ASGI
+        Message.objects.create(demande=self.demande, auteur=self.admin, contenu="Après fermeture")
+        self.assertFalse([boucle for boucle in flux._diffuseurs if boucle.is_closed()])
+
+    async def test_jeton_requis(self):
+        response = await self.async_client.get(reverse('flux-messages'))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual((await self.async_client.post(reverse('ticket-flux'))).status_code, 401)
+
+    async def test_ticket_a_usage_unique_et_jeton_refuse_dans_l_url(self):
+        ticket = await self.obtenir_ticket(self.fonctionnaire)
+        response = await self.async_client.get(reverse('flux-messages') + f'?ticket={ticket}')
+        self.assertEqual(response.status_code, 200)
+        await response.streaming_content.aclose()
+        self.assertEqual((await self.async_client.get(reverse('flux-messages') + f'?ticket={ticket}')).status_code, 401)
+
+        jeton = str(AccessToken.for_user(self.fonctionnaire))
+        self.assertEqual((await self.async_client.get(reverse('flux-messages') + f'?token={jeton}')).status_code, 401)
+
+    async def lire_jusqu_a_la_fin(self, evenements):
+        morceaux = []
+        async for morceau in evenements:
+            morceaux.append(morceau)
+        return morceaux
+
+    async def test_flux_ferme_a_l_expiration_du_jeton(self):
+        evenements = flux.flux_evenements(self.fonctionnaire, None, expire_le=time.time() + 0.2)
+        morceaux = await asyncio.wait_for(self.lire_jusqu_a_la_fin(evenements), 2)
+        self.assertEqual(morceaux, ["retry: 3000\n\n"])
+
+    @override_settings(MESSAGE_STREAM={'POLL_INTERVAL': 0.05, 'HEARTBEAT_INTERVAL': 0.05})
+    async def test_flux_ferme_au_battement_qui_suit_la_desactivation(self):
+        evenements = flux.flux_evenements(self.fonctionnaire, None)
+        self.assertEqual(await anext(evenements), "retry: 3000\n\n")
+        self.assertEqual(await anext(evenements), ": ping\n\n")
+        await sync_to_async(User.objects.filter(pk=self.fonctionnaire.pk).update)(is_active=False)
+        self.assertEqual(await asyncio.wait_for(self.lire_jusqu_a_la_fin(evenements), 2), [])
+
+
+class AdminMessagesTests(TestCase):
+
+    def test_liste_en_requetes_constantes(self):
+        superuser = creer_utilisateur('superadmin', is_staff=True, is_superuser=True)
+        self.client.force_login(superuser)
+
+        def nombre_requetes():
+            with CaptureQueriesContext(connection) as requetes:
+                self.assertEqual(self.client.get(reverse('admin:messagerie_message_changelist')).status_code, 200)
+            return len(requetes)
+
+        def ajouter(nombre):
+            for i in range(nombre):
+                fonctionnaire = creer_utilisateur(f'agent{Message.objects.count()}', last_name='Agent')
+                Message.objects.create(demande=creer_demande(fonctionnaire), auteur=fonctionnaire, contenu='Bonjour')
+
+        ajouter(2)
+        avant = nombre_requetes()
+        ajouter(8)
+        self.assertEqual(nombre_requetes(), avant)
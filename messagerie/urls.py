@@ -1,8 +1,12 @@
 from django.urls import path
-from .views import MessageListCreateView, MesMessagesView
+from .views import MessageListCreateView, MesMessagesView, MarquerMessagesLusView, MesNonLusView, TicketFluxView, flux_messages
 
 urlpatterns = [
     path('demandes/<int:demande_id>/messages/', MessageListCreateView.as_view(), name='demande-messages'),
+    path('demandes/<int:demande_id>/messages/marquer-lus/', MarquerMessagesLusView.as_view(), name='marquer-messages-lus'),
     path('mes-messages/', MesMessagesView.as_view(), name='mes-messages'),
+    path('non-lus/', MesNonLusView.as_view(), name='mes-non-lus'),
+    path('flux/', flux_messages, name='flux-messages'),
+    path('flux/ticket/', TicketFluxView.as_view(), name='ticket-flux'),
 
 ]
@@ -1,20 +1,45 @@
-from rest_framework import generics, permissions
-from .models import Message
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Max, Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET
+from rest_framework import generics, permissions, status
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .compteurs import marquer_lus
+from .flux import consommer_ticket, emettre_ticket, flux_evenements
+from .models import CompteurNonLus, Message
 from .serializers import MessageSerializer
 from loans.models import DemandePret
+from users.models import User
 from rest_framework.exceptions import PermissionDenied
+from Pret.conditionnel import ConditionalGetMixin
+from Pret.pagination import CursorPaginationMixin
 
-class MessageListCreateView(generics.ListCreateAPIView):
+class MessageListCreateView(ConditionalGetMixin, CursorPaginationMixin, generics.ListCreateAPIView):
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    cursor_ordering = ('date_envoi', 'id')
+
+    def validateurs(self):
+        # Un agrégat sur l'index (demande, date_envoi, id) : nombre, dernier envoi, dernier id,
+        # et nombre de lus (marquer_lus change `lu` sans nouvel envoi : seul l'ETag le voit)
+        etat = self.filter_queryset(self.get_queryset()).aggregate(
+            nombre=Count('id'), dernier_envoi=Max('date_envoi'), dernier=Max('id'), lus=Count('id', filter=Q(lu=True)),
+        )
+        return tuple(etat.values()), etat['dernier_envoi']
 
     def get_queryset(self):
         demande_id = self.kwargs['demande_id']
         user = self.request.user
+        queryset = Message.objects.select_related('auteur').order_by(*self.cursor_ordering)
         if user.is_staff:
-            return Message.objects.filter(demande_id=demande_id)
+            return queryset.filter(demande_id=demande_id)
         else:
-            return Message.objects.filter(demande_id=demande_id, demande__fonctionnaire=user)
+            return queryset.filter(demande_id=demande_id, demande__fonctionnaire=user)
 
     def perform_create(self, serializer):
         demande_id = self.kwargs['demande_id']
@@ -25,13 +50,107 @@ class MessageListCreateView(generics.ListCreateAPIView):
         serializer.save(auteur=user, demande=demande)
 
 
-class MesMessagesView(generics.ListAPIView):
+class MesMessagesView(CursorPaginationMixin, generics.ListAPIView):
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    cursor_ordering = ('date_envoi', 'id')
 
     def get_queryset(self):
         user = self.request.user
+        queryset = Message.objects.select_related('auteur').order_by(*self.cursor_ordering)
         if user.is_staff:
-            return Message.objects.all()
-        return Message.objects.filter(auteur=user)
+            return queryset
+        return queryset.filter(auteur=user)
+
+
+class MarquerMessagesLusView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, demande_id):
+        demande = get_object_or_404(DemandePret, id=demande_id)
+        user = request.user
+        if not user.is_staff and demande.fonctionnaire_id != user.id:
+            raise PermissionDenied("Vous n'avez pas accès aux messages de cette demande.")
+        return Response({"marques_lus": marquer_lus(demande, user)}, status=status.HTTP_200_OK)
+
+
+class MesNonLusView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        user = request.user
+        non_lus = dict(
+            CompteurNonLus.objects.filter(demande__fonctionnaire=user, pour_fonctionnaire__gt=0)
+            .values_list('demande_id', 'pour_fonctionnaire')
+        )
+        if user.is_staff:
+            non_lus.update(
+                CompteurNonLus.objects.filter(pour_administration__gt=0)
+                .exclude(demande__fonctionnaire=user)
+                .values_list('demande_id', 'pour_administration')
+            )
+        return Response({
+            "total": sum(non_lus.values()),
+            "demandes": [{"demande": demande_id, "non_lus": nombre} for demande_id, nombre in sorted(non_lus.items())],
+        })
+
+
+class TicketFluxView(APIView):
+    """Émet le ticket d'ouverture du flux SSE (voir flux.emettre_ticket), valable pour une connexion."""
+    permission_classes = [permissions.IsAuthenticated]
+    authentification_stricte = True
+
+    def post(self, request):
+        ticket = emettre_ticket(request.user, _expiration_jeton(request.auth))
+        return Response({"ticket": ticket}, status=status.HTTP_201_CREATED)
+
+
+def _expiration_jeton(auth):
+    # JWT : revendication `exp` ; jeton opaque OAuth2 : champ `expires`
+    if auth is None:
+        return None
+    if hasattr(auth, 'expires'):
+        return auth.expires.timestamp()
+    try:
+        return auth['exp']
+    except (KeyError, TypeError):
+        return None
+
+
+def _authentifier_flux(request):
+    """(utilisateur, expiration du flux) ; utilisateur None si la requête n'est pas authentifiée."""
+    ticket = request.GET.get('ticket')
+    if ticket is not None:
+        contenu = consommer_ticket(ticket)
+        if contenu is None:
+            return None, None
+        user_id, expire_le = contenu
+        return User.objects.filter(pk=user_id, is_active=True).first(), expire_le
+    # Clients autres qu'EventSource : en-tête Authorization
+    drf_request = Request(request, authenticators=[classe() for classe in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        user = drf_request.user
+    except APIException:
+        return None, None
+    if not user.is_authenticated:
+        return None, None
+    return user, _expiration_jeton(drf_request.auth)
+
+
+# Flux Server-Sent Events des nouveaux messages visibles par l'utilisateur ; à servir en ASGI (Pret/asgi.py)
+@require_GET
+async def flux_messages(request):
+    user, expire_le = await sync_to_async(_authentifier_flux)(request)
+    if user is None:
+        return JsonResponse({"detail": "Informations d'authentification non fournies ou invalides."}, status=401)
+
+    dernier_id = request.headers.get('Last-Event-ID') or request.GET.get('dernier_id')
+    try:
+        dernier_id = int(dernier_id) if dernier_id else None
+    except ValueError:
+        dernier_id = None
 
+    response = StreamingHttpResponse(flux_evenements(user, dernier_id, expire_le), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # pas de mise en tampon par nginx
+    return response
@@ -0,0 +1,193 @@
+import functools
+import os
+import tempfile
+import time
+import uuid
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import ValidationError
+
+from .models import PieceJointe
+from .storage import TAILLE_BLOC
+from .televersement import _FichierAssemble
+
+PREFIXE_DIRECT = 'pieces_jointes/direct'
+SEL_JETON = 'pieces.direct.jeton'
+
+
+def _direct_setting(nom):
+    defauts = {
+        'BACKEND': 'pieces.direct.TeleversementLocal',
+        'URL_LIFETIME': 15 * 60,        # validité de l'URL signée (secondes)
+        'TOKEN_LIFETIME': 60 * 60,      # délai pour confirmer l'envoi
+        'MAX_FILE_SIZE': 200 * 1024 * 1024,
+        'DIR': os.path.join(settings.BASE_DIR, 'televersements_directs'),
+        'BUCKET': None,
+        'ENDPOINT_URL': None,
+        'REGION': None,
+    }
+    return getattr(settings, 'DIRECT_UPLOAD', {}).get(nom, defauts[nom])
+
+
+class TeleversementS3:
+    """
+    Envoi direct vers un stockage compatible S3 : le client dépose l'objet avec une URL PUT présignée,
+    la confirmation vérifie sa présence et sa taille (HEAD) puis enregistre la clé telle quelle.
+    PIECES_JOINTES_STORAGE doit alors désigner un stockage sur le même bucket (ex. django-storages).
+    """
+
+    def __init__(self):
+        try:
+            import boto3
+        except ImportError:
+            raise ImproperlyConfigured("boto3 est requis pour DIRECT_UPLOAD['BACKEND'] = 'pieces.direct.TeleversementS3'.")
+        self.bucket = _direct_setting('BUCKET')
+        if not self.bucket:
+            raise ImproperlyConfigured("DIRECT_UPLOAD['BUCKET'] doit être renseigné.")
+        self.client = boto3.client('s3', endpoint_url=_direct_setting('ENDPOINT_URL'), region_name=_direct_setting('REGION'))
+
+    def url_signee(self, cle, type_contenu, taille):
+        url = self.client.generate_presigned_url(
+            'put_object',
+            Params={'Bucket': self.bucket, 'Key': cle, 'ContentType': type_contenu, 'ContentLength': taille},
+            ExpiresIn=_direct_setting('URL_LIFETIME'),
+        )
+        return {'methode': 'PUT', 'url': url, 'entetes': {'Content-Type': type_contenu}}
+
+    def taille_objet(self, cle):
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=cle)['ContentLength']
+        except ClientError as erreur:
+            if erreur.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def enregistrer(self, piece, cle, nom_fichier):
+        piece.fichier.name = cle
+        piece.save()
+
+
+class TeleversementLocal:
+    """
+    Équivalent local du contrat S3, sans réseau : URL PUT signée par HMAC (clé, type, taille, expiration)
+    servie par TeleversementDirectLocalView. L'objet est déposé hors de MEDIA_ROOT puis déplacé,
+    à la confirmation, dans le stockage des pièces jointes.
+    """
+
+    def url_signee(self, cle, type_contenu, taille):
+        expire = int(time.time()) + _direct_setting('URL_LIFETIME')
+        parametres = {'cle': cle, 'taille': taille, 'expire': expire, 'signature': self.signature(cle, type_contenu, taille, expire)}
+        url = f"{reverse('televersement-direct-local')}?{urlencode(parametres)}"
+        return {'methode': 'PUT', 'url': url, 'entetes': {'Content-Type': type_contenu}}
+
+    @staticmethod
+    def signature(cle, type_contenu, taille, expire):
+        return salted_hmac('pieces.direct.url', f"PUT\n{cle}\n{type_contenu}\n{taille}\n{expire}", algorithm='sha256').hexdigest()
+
+    def verifier(self, cle, type_contenu, taille, expire, signature):
+        try:
+            if int(expire) < time.time():
+                return False
+        except (TypeError, ValueError):
+            return False
+        return constant_time_compare(signature or '', self.signature(cle, type_contenu, taille, expire))
+
+    def chemin(self, cle):
+        return os.path.join(_direct_setting('DIR'), os.path.basename(cle))
+
+    def recevoir(self, cle, flux, taille):
+        """Copie le corps de la requête sur disque par blocs ; l'objet n'apparaît qu'une fois complet."""
+        chemin = self.chemin(cle)
+        os.makedirs(os.path.dirname(chemin), exist_ok=True)
+        # mkstemp plutôt qu'un nom par processus : le même PUT rejoué sur un autre thread
+        descripteur, temporaire = tempfile.mkstemp(
+            dir=os.path.dirname(chemin), prefix=os.path.basename(chemin) + '.', suffix='.tmp'
+        )
+        recu = 0
+        try:
+            with os.fdopen(descripteur, 'wb') as destination:
+                while recu <= taille:
+                    bloc = flux.read(min(TAILLE_BLOC, taille + 1 - recu))
+                    if not bloc:
+                        break
+                    recu += len(bloc)
+                    destination.write(bloc)
+            if recu != taille:
+                raise ValidationError({"detail": f"{taille} octets attendus."})
+            os.replace(temporaire, chemin)
+        finally:
+            if os.path.exists(temporaire):
+                os.remove(temporaire)
+
+    def taille_objet(self, cle):
+        try:
+            return os.path.getsize(self.chemin(cle))
+        except FileNotFoundError:
+            return None
+
+    def enregistrer(self, piece, cle, nom_fichier):
+        chemin = self.chemin(cle)
+        with open(chemin, 'rb') as fichier:
+            piece.fichier.save(nom_fichier, _FichierAssemble(fichier, name=nom_fichier), save=True)
+        if os.path.exists(chemin):
+            os.remove(chemin)
+
+
+@functools.lru_cache(maxsize=None)
+def _backend(chemin):
+    return import_string(chemin)()
+
+
+def obtenir_backend():
+    return _backend(_direct_setting('BACKEND'))
+
+
+def preparer(demande, user, nom, nom_fichier, taille, type_contenu):
+    """Réserve une clé et renvoie l'URL signée d'envoi avec le jeton à présenter à la confirmation."""
+    cle = f"{PREFIXE_DIRECT}/{uuid.uuid4().hex}{os.path.splitext(nom_fichier)[1].lower()}"
+    jeton = signing.dumps({
+        'cle': cle, 'demande': demande.pk, 'user': user.pk, 'nom': nom,
+        'nom_fichier': nom_fichier, 'taille': taille,
+    }, salt=SEL_JETON)
+    return {'cle': cle, 'jeton': jeton, **obtenir_backend().url_signee(cle, type_contenu, taille)}
+
+
+def confirmer(jeton, user):
+    """Vérifie que l'objet annoncé est présent avec la bonne taille et crée la pièce jointe."""
+    try:
+        donnees = signing.loads(jeton, salt=SEL_JETON, max_age=_direct_setting('TOKEN_LIFETIME'))
+    except signing.BadSignature:
+        raise ValidationError({"jeton": "Jeton invalide ou expiré."})
+    if donnees['user'] != user.pk:
+        raise ValidationError({"jeton": "Ce jeton n'a pas été émis pour vous."})
+
+    # Confirmation répétée : en local le fichier a été renommé (stockage par empreinte), la pièce
+    # est retrouvée par la clé d'envoi
+    existante = PieceJointe.objects.filter(cle_televersement=donnees['cle']).first()
+    if existante is not None:
+        return existante
+
+    backend = obtenir_backend()
+    taille = backend.taille_objet(donnees['cle'])
+    if taille is None:
+        raise ValidationError({"detail": "Le fichier n'a pas encore été déposé."})
+    if taille != donnees['taille']:
+        raise ValidationError({"detail": f"Taille reçue ({taille}) différente de la taille annoncée ({donnees['taille']})."})
+
+    try:
+        with transaction.atomic():
+            piece = PieceJointe(demande_id=donnees['demande'], nom=donnees['nom'], cle_televersement=donnees['cle'])
+            backend.enregistrer(piece, donnees['cle'], donnees['nom_fichier'])
+    except IntegrityError:
+        # Confirmation concurrente enregistrée entre-temps
+        return PieceJointe.objects.get(cle_televersement=donnees['cle'])
+    return piece
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from pieces.models import BlobPiece, PieceJointe
+from pieces.references import recompter
+from pieces.storage import PREFIXE_CAS, stockage_pieces_jointes
+
+
+class Command(BaseCommand):
+    help = "Migre les pièces jointes existantes vers le stockage par empreinte en fusionnant les contenus identiques."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conserver-originaux', action='store_true', help="Ne supprime pas les anciens fichiers.")
+
+    def handle(self, *args, **options):
+        stockage = stockage_pieces_jointes
+        anciens = set()
+        migrees = introuvables = 0
+
+        a_migrer = PieceJointe.objects.exclude(fichier__startswith=PREFIXE_CAS + '/').exclude(fichier='')
+        for pk, ancien in a_migrer.values_list('pk', 'fichier').iterator():
+            if not stockage.exists(ancien):
+                self.stderr.write(f"Fichier introuvable pour la pièce {pk} : {ancien}")
+                introuvables += 1
+                continue
+            with stockage.open(ancien, 'rb') as fichier:
+                nouveau = stockage.save(ancien, fichier)
+            # update() : pas de signaux, les références sont recomptées en fin de migration
+            PieceJointe.objects.filter(pk=pk).update(fichier=nouveau)
+            anciens.add(ancien)
+            migrees += 1
+
+        liberes = 0
+        if not options['conserver_originaux']:
+            for ancien in anciens:
+                if stockage.exists(ancien) and not PieceJointe.objects.filter(fichier=ancien).exists():
+                    liberes += stockage.size(ancien)
+                    stockage.delete(ancien)
+
+        recompter()
+        self.stdout.write(
+            f"{migrees} pièce(s) migrée(s) ({introuvables} introuvable(s)) vers {BlobPiece.objects.count()} blob(s) ; "
+            f"{liberes} octet(s) libéré(s)."
+        )
@@ -0,0 +1,23 @@
+from concurrent.futures import Future
+
+from django.core.management.base import BaseCommand
+
+from pieces import miniatures
+from pieces.models import PieceJointe
+from pieces.storage import stockage_pieces_jointes
+
+
+class Command(BaseCommand):
+    help = "Génère les miniatures manquantes des pièces jointes existantes et enregistre les tailles disponibles."
+
+    def handle(self, *args, **options):
+        noms = PieceJointe.objects.exclude(fichier='').order_by().values_list('fichier', flat=True).distinct()
+        taches = [(nom, miniatures.planifier(nom, stockage_pieces_jointes)) for nom in noms.iterator()]
+        generees = 0
+        for nom, tache in taches:
+            if isinstance(tache, Future):
+                tache = tache.result()
+                # Sans attendre le rappel de fin de tâche, qui peut s'exécuter après la fin de la commande
+                miniatures.enregistrer_tailles(nom, stockage_pieces_jointes)
+            generees += len(tache or ())
+        self.stdout.write(f"{generees} miniature(s) générée(s).")
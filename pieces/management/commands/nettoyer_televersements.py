@@ -0,0 +1,54 @@
+import datetime
+import os
+import shutil
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from pieces.direct import _direct_setting
+from pieces.models import SessionTeleversement, _upload_setting
+from pieces.televersement import supprimer_morceaux
+
+
+class Command(BaseCommand):
+    help = "Supprime les sessions de téléversement abandonnées et leurs morceaux sur disque."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--heures', type=float, default=None, help="Inactivité au-delà de laquelle une session est abandonnée.")
+
+    def handle(self, *args, **options):
+        heures = options['heures'] if options['heures'] is not None else _upload_setting('EXPIRATION_HOURS')
+        limite = timezone.now() - datetime.timedelta(hours=heures)
+
+        abandonnees = SessionTeleversement.objects.exclude(statut='termine').filter(date_maj__lt=limite)
+        nombre = 0
+        for session in abandonnees.iterator():
+            supprimer_morceaux(session)
+            session.delete()
+            nombre += 1
+
+        # Dossiers sans session (ex. session supprimée en base pendant une écriture)
+        racine = _upload_setting('DIR')
+        orphelins = 0
+        if os.path.isdir(racine):
+            connues = {str(pk) for pk in SessionTeleversement.objects.values_list('pk', flat=True)}
+            for nom in os.listdir(racine):
+                chemin = os.path.join(racine, nom)
+                if nom not in connues and os.path.getmtime(chemin) < limite.timestamp():
+                    shutil.rmtree(chemin, ignore_errors=True)
+                    orphelins += 1
+
+        # Envois directs déposés en local mais jamais confirmés
+        depots = 0
+        dossier_direct = _direct_setting('DIR')
+        if os.path.isdir(dossier_direct):
+            for nom in os.listdir(dossier_direct):
+                chemin = os.path.join(dossier_direct, nom)
+                if os.path.getmtime(chemin) < limite.timestamp():
+                    os.remove(chemin)
+                    depots += 1
+
+        self.stdout.write(
+            f"{nombre} session(s) abandonnée(s), {orphelins} dossier(s) orphelin(s) "
+            f"et {depots} envoi(s) direct(s) non confirmé(s) supprimé(s)."
+        )
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:12
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0005_statistiquedemande'),
+        ('pieces', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionTeleversement',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('nom', models.CharField(max_length=255)),
+                ('nom_fichier', models.CharField(max_length=255)),
+                ('taille', models.BigIntegerField()),
+                ('taille_morceau', models.PositiveIntegerField()),
+                ('sha256', models.CharField(max_length=64)),
+                ('statut', models.CharField(choices=[('en_cours', 'En cours'), ('assemblage', 'Assemblage'), ('termine', 'Terminé')], default='en_cours', max_length=20)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('date_maj', models.DateTimeField(auto_now=True)),
+                ('demande', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='televersements', to='loans.demandepret')),
+                ('piece_jointe', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='pieces.piecejointe')),
+                ('proprietaire', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['statut', 'date_maj'], name='televersement_statut_maj_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:14
+
+import pieces.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pieces', '0002_sessionteleversement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlobPiece',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chemin', models.CharField(max_length=255, unique=True)),
+                ('taille', models.BigIntegerField(default=0)),
+                ('references', models.IntegerField(default=0)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='piecejointe',
+            name='fichier',
+            field=models.FileField(max_length=255, storage=pieces.storage.obtenir_stockage, upload_to='pieces_jointes/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pieces', '0003_stockage_par_empreinte'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='piecejointe',
+            name='cle_televersement',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True, unique=True),
+        ),
+    ]
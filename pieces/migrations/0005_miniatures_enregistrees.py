@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:16
+
+import os
+
+from django.db import migrations, models
+
+# Copie figée de pieces.miniatures au moment de la migration
+TAILLES = ('petite', 'moyenne')
+
+
+def remplir_miniatures(apps, schema_editor):
+    """Tailles déjà générées (fichiers « <nom>.<taille>.jpg » à côté de l'original), par fichier distinct."""
+    PieceJointe = apps.get_model('pieces', 'PieceJointe')
+    stockage = PieceJointe._meta.get_field('fichier').storage
+    pieces = PieceJointe.objects.using(schema_editor.connection.alias).exclude(fichier='')
+    for nom in list(pieces.order_by().values_list('fichier', flat=True).distinct()):
+        try:
+            chemin = stockage.path(nom)
+        except NotImplementedError:
+            return  # stockage distant : pas de miniatures
+        tailles = [taille for taille in TAILLES if os.path.exists(f"{chemin}.{taille}.jpg")]
+        if tailles:
+            pieces.filter(fichier=nom).update(miniatures=tailles)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0010_duree_remboursement_bornee'),
+        ('pieces', '0004_cle_televersement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='piecejointe',
+            name='miniatures',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='piecejointe',
+            index=models.Index(fields=['fichier'], name='piece_fichier_idx'),
+        ),
+        migrations.RunPython(remplir_miniatures, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,156 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from django import db
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Taille maximale (px) de chaque dérivé ; fichiers JPEG écrits à côté de l'original
+TAILLES = {
+    'petite': 160,
+    'moyenne': 640,
+}
+EXTENSIONS_IMAGES = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tif', '.tiff'}
+
+
+def _miniatures_setting(nom):
+    defauts = {'WORKERS': 2, 'SYNC': False}
+    return getattr(settings, 'THUMBNAILS', {}).get(nom, defauts[nom])
+
+
+def nom_miniature(nom, taille):
+    return f"{nom}.{taille}.jpg"
+
+
+def est_apercu_possible(nom):
+    extension = os.path.splitext(nom)[1].lower()
+    return extension in EXTENSIONS_IMAGES or extension == '.pdf'
+
+
+def _ecrire_atomiquement(chemin, ecrire):
+    fd, temporaire = tempfile.mkstemp(dir=os.path.dirname(chemin), suffix='.jpg')
+    os.close(fd)
+    try:
+        ecrire(temporaire)
+        os.replace(temporaire, chemin)
+    finally:
+        if os.path.exists(temporaire):
+            os.remove(temporaire)
+
+
+def _reduire_image(source, destination, taille):
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((taille, taille))
+        image.convert('RGB').save(destination, 'JPEG', quality=80, optimize=True)
+
+
+def _rendre_premiere_page(source, destination, taille):
+    prefixe = destination[:-len('.jpg')]
+    subprocess.run(
+        ['pdftoppm', '-jpeg', '-f', '1', '-l', '1', '-scale-to', str(taille), '-singlefile', source, prefixe],
+        check=True, capture_output=True, timeout=60,
+    )
+
+
+def generer(chemin):
+    """
+    Produit les dérivés d'un fichier (chemin absolu). Exécuté dans un processus du pool :
+    n'utilise ni l'ORM ni les réglages Django. Retourne les tailles générées.
+    """
+    extension = os.path.splitext(chemin)[1].lower()
+    if extension in EXTENSIONS_IMAGES:
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            return []
+        produire = _reduire_image
+    elif extension == '.pdf' and shutil.which('pdftoppm'):
+        produire = _rendre_premiere_page
+    else:
+        return []
+
+    generees = []
+    for taille, pixels in TAILLES.items():
+        destination = nom_miniature(chemin, taille)
+        if os.path.exists(destination):
+            continue
+        try:
+            _ecrire_atomiquement(destination, lambda temporaire: produire(chemin, temporaire, pixels))
+        except Exception:
+            logger.exception("Impossible de générer la miniature %s de %s", taille, chemin)
+            break
+        generees.append(taille)
+    return generees
+
+
+_executeur = None
+
+
+def _pool():
+    global _executeur
+    if _executeur is None:
+        # spawn : les processus fils ne partagent ni connexions à la base ni threads du serveur
+        _executeur = ProcessPoolExecutor(
+            max_workers=_miniatures_setting('WORKERS'), mp_context=multiprocessing.get_context('spawn')
+        )
+    return _executeur
+
+
+def enregistrer_tailles(nom, stockage):
+    """Enregistre sur les pièces jointes du fichier les dérivés disponibles (PieceJointe.miniatures)."""
+    from .models import PieceJointe
+
+    PieceJointe.objects.filter(fichier=nom).update(miniatures=tailles_disponibles(nom, stockage))
+
+
+def _apres_generation(nom, stockage, tache):
+    # Exécuté dans un thread du processus parent, à la fin de la tâche du pool
+    try:
+        enregistrer_tailles(nom, stockage)
+    except Exception:
+        logger.exception("Impossible d'enregistrer les miniatures de %s", nom)
+    finally:
+        db.connection.close()
+
+
+def planifier(nom, stockage):
+    """Met en file la génération des dérivés d'un fichier du stockage, hors de la requête."""
+    if not est_apercu_possible(nom):
+        return None
+    try:
+        chemin = stockage.path(nom)
+    except NotImplementedError:
+        return None  # stockage distant : pas de rendu local
+    if all(os.path.exists(nom_miniature(chemin, taille)) for taille in TAILLES):
+        # Déjà générés (contenu partagé avec une autre pièce jointe)
+        enregistrer_tailles(nom, stockage)
+        return None
+    if _miniatures_setting('SYNC'):
+        generees = generer(chemin)
+        enregistrer_tailles(nom, stockage)
+        return generees
+    tache = _pool().submit(generer, chemin)
+    tache.add_done_callback(lambda tache: _apres_generation(nom, stockage, tache))
+    return tache
+
+
+def tailles_disponibles(nom, stockage):
+    try:
+        chemin = stockage.path(nom)
+    except NotImplementedError:
+        return []
+    return [taille for taille in TAILLES if os.path.exists(nom_miniature(chemin, taille))]
+
+
+def supprimer(nom, stockage):
+    for taille in TAILLES:
+        stockage.delete(nom_miniature(nom, taille))
@@ -1,11 +1,105 @@
+import math
+import os
+import uuid
+
+from django.conf import settings
 from django.db import models
 from loans.models import DemandePret
 
+from .storage import obtenir_stockage
+
 class PieceJointe(models.Model):
     demande = models.ForeignKey(DemandePret, on_delete=models.CASCADE, related_name='pieces_jointes')
     nom = models.CharField(max_length=255)
-    fichier = models.FileField(upload_to='pieces_jointes/')
+    fichier = models.FileField(upload_to='pieces_jointes/', storage=obtenir_stockage, max_length=255)
     date_ajout = models.DateTimeField(auto_now_add=True)
+    # Clé de l'envoi direct (pieces.direct) : une confirmation répétée retrouve la pièce déjà créée
+    cle_televersement = models.CharField(max_length=255, unique=True, null=True, blank=True, editable=False)
+    # Dérivés disponibles (pieces.miniatures.TAILLES), enregistrés à la fin de leur génération :
+    # la sérialisation n'interroge pas le stockage
+    miniatures = models.JSONField(default=list, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['fichier'], name='piece_fichier_idx'),
+        ]
 
     def __str__(self):
         return f"{self.nom} pour {self.demande.numero_dossier}"
+
+
+class BlobPiece(models.Model):
+    """Fichier du stockage par empreinte, partagé par toutes les pièces jointes de même contenu."""
+    chemin = models.CharField(max_length=255, unique=True)
+    taille = models.BigIntegerField(default=0)
+    references = models.IntegerField(default=0)
+    date_creation = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.chemin} ({self.references} référence(s))"
+
+
+
+def _upload_setting(nom):
+    defauts = {
+        'DIR': os.path.join(settings.BASE_DIR, 'televersements'),
+        'CHUNK_SIZE': 5 * 1024 * 1024,
+        'MAX_CHUNK_SIZE': 16 * 1024 * 1024,
+        'MAX_FILE_SIZE': 200 * 1024 * 1024,
+        'EXPIRATION_HOURS': 24,
+    }
+    return getattr(settings, 'CHUNKED_UPLOAD', {}).get(nom, defauts[nom])
+
+
+class SessionTeleversement(models.Model):
+    """Téléversement d'une pièce jointe en morceaux numérotés, reprenable après une coupure."""
+    STATUT_CHOICES = [
+        ('en_cours', 'En cours'),
+        ('assemblage', 'Assemblage'),
+        ('termine', 'Terminé'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    demande = models.ForeignKey(DemandePret, on_delete=models.CASCADE, related_name='televersements')
+    proprietaire = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    nom = models.CharField(max_length=255)
+    nom_fichier = models.CharField(max_length=255)
+    taille = models.BigIntegerField()
+    taille_morceau = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64)
+    statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='en_cours')
+    piece_jointe = models.OneToOneField(PieceJointe, on_delete=models.SET_NULL, null=True, blank=True)
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_maj = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['statut', 'date_maj'], name='televersement_statut_maj_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.nom_fichier} ({self.statut})"
+
+    @property
+    def nombre_morceaux(self):
+        return max(1, math.ceil(self.taille / self.taille_morceau))
+
+    @property
+    def dossier(self):
+        return os.path.join(_upload_setting('DIR'), str(self.id))
+
+    def taille_attendue(self, numero):
+        if numero == self.nombre_morceaux - 1:
+            return self.taille - numero * self.taille_morceau
+        return self.taille_morceau
+
+    def chemin_morceau(self, numero):
+        return os.path.join(self.dossier, f"{numero:06d}.part")
+
+    def morceaux_recus(self):
+        if not os.path.isdir(self.dossier):
+            return []
+        return sorted(int(nom[:-5]) for nom in os.listdir(self.dossier) if nom.endswith('.part'))
+
+    def morceaux_manquants(self):
+        return sorted(set(range(self.nombre_morceaux)) - set(self.morceaux_recus()))
@@ -0,0 +1,108 @@
+import threading
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from . import miniatures
+from .models import BlobPiece, PieceJointe
+from .storage import PREFIXE_CAS, est_blob, stockage_pieces_jointes
+
+# Références prises par le stockage pendant l'écriture d'un blob, pas encore attribuées à une pièce jointe
+_locales = threading.local()
+
+
+def _reservations():
+    if not hasattr(_locales, 'reservations'):
+        _locales.reservations = Counter()
+    return _locales.reservations
+
+
+def _prendre_reference(nom, stockage, ecrire=None):
+    """
+    Incrémente (ou crée) la ligne BlobPiece sous son verrou, après avoir vérifié la présence du fichier :
+    un nettoyage concurrent (supprimer_si_orphelin) prend le même verrou avant de supprimer la ligne et
+    le fichier. Un fichier manquant est réécrit par `ecrire` quand le contenu est disponible.
+    """
+    with transaction.atomic():
+        blob = BlobPiece.objects.select_for_update().filter(chemin=nom).first()
+        if ecrire is not None and not stockage.exists(nom):
+            ecrire()
+        if blob is not None:
+            BlobPiece.objects.filter(pk=blob.pk).update(references=F('references') + 1)
+            return
+        try:
+            with transaction.atomic():
+                BlobPiece.objects.create(chemin=nom, taille=stockage.size(nom), references=1)
+        except IntegrityError:
+            # Ligne créée entre-temps par une autre requête
+            BlobPiece.objects.filter(chemin=nom).update(references=F('references') + 1)
+
+
+def reserver(nom, stockage, ecrire):
+    """Appelé par StockageParEmpreinte._save : le blob est référencé avant que son nom soit renvoyé."""
+    _prendre_reference(nom, stockage, ecrire)
+    _reservations()[nom] += 1
+
+
+def ajouter_reference(nom):
+    if not est_blob(nom):
+        return
+    reservations = _reservations()
+    if reservations[nom] > 0:
+        # Référence déjà prise par le stockage à l'écriture
+        reservations[nom] -= 1
+        return
+    _prendre_reference(nom, stockage_pieces_jointes)
+
+
+def rendre_reservation(nom):
+    """Pièce réenregistrée avec un contenu identique : la référence prise par le stockage est rendue."""
+    reservations = _reservations()
+    if est_blob(nom) and reservations[nom] > 0:
+        reservations[nom] -= 1
+        BlobPiece.objects.filter(chemin=nom).update(references=F('references') - 1)
+
+
+def retirer_reference(nom):
+    if not est_blob(nom):
+        return
+    BlobPiece.objects.filter(chemin=nom).update(references=F('references') - 1)
+    transaction.on_commit(lambda: supprimer_si_orphelin(nom))
+
+
+def supprimer_si_orphelin(nom):
+    with transaction.atomic():
+        blob = BlobPiece.objects.select_for_update().filter(chemin=nom, references__lte=0).first()
+        # Contrôle direct sur les pièces jointes : le compteur a pu dériver
+        if blob is None or PieceJointe.objects.filter(fichier=nom).exists():
+            return
+        blob.delete()
+        # Sous le verrou : une écriture concurrente du même contenu attend, ne trouve plus la ligne
+        # et réécrit le fichier
+        stockage_pieces_jointes.delete(nom)
+        miniatures.supprimer(nom, stockage_pieces_jointes)
+
+
+@transaction.atomic
+def recompter():
+    """Recalcule les références de chaque blob à partir des pièces jointes et supprime les blobs orphelins."""
+    _reservations().clear()
+    comptes = dict(
+        PieceJointe.objects.filter(fichier__startswith=PREFIXE_CAS + '/').order_by()
+        .values('fichier').annotate(nombre=Count('id')).values_list('fichier', 'nombre')
+    )
+    for blob in BlobPiece.objects.all().iterator():
+        nombre = comptes.pop(blob.chemin, 0)
+        if nombre:
+            if blob.references != nombre:
+                BlobPiece.objects.filter(pk=blob.pk).update(references=nombre)
+        else:
+            blob.delete()
+            stockage_pieces_jointes.delete(blob.chemin)
+            miniatures.supprimer(blob.chemin, stockage_pieces_jointes)
+    BlobPiece.objects.bulk_create([
+        BlobPiece(chemin=nom, taille=stockage_pieces_jointes.size(nom), references=nombre)
+        for nom, nombre in comptes.items()
+        if stockage_pieces_jointes.exists(nom)
+    ])
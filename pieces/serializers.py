@@ -1,7 +1,77 @@
+from django.urls import reverse
 from rest_framework import serializers
-from .models import PieceJointe
+from loans.models import DemandePret
+from .direct import _direct_setting
+from .models import PieceJointe, SessionTeleversement, _upload_setting
 
 class PieceJointeSerializer(serializers.ModelSerializer):
+    telechargement = serializers.SerializerMethodField()
+    miniatures = serializers.SerializerMethodField()
+
     class Meta:
         model = PieceJointe
-        fields = ['id', 'demande', 'nom', 'fichier', 'date_ajout']
+        fields = ['id', 'demande', 'nom', 'fichier', 'telechargement', 'miniatures', 'date_ajout']
+
+    def _url(self, url):
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def get_telechargement(self, obj):
+        # Le fichier n'est servi qu'après contrôle d'accès (pieces.views.PieceJointeTelechargementView)
+        return self._url(reverse('telecharger-piece-jointe', args=[obj.pk]))
+
+    def get_miniatures(self, obj):
+        # Dérivés déjà générés (PieceJointe.miniatures), ex. {'petite': url, 'moyenne': url}
+        if not obj.fichier:
+            return {}
+        url = reverse('telecharger-piece-jointe', args=[obj.pk])
+        return {taille: self._url(f"{url}?variante={taille}") for taille in obj.miniatures}
+
+
+
+class SessionTeleversementSerializer(serializers.ModelSerializer):
+    taille_morceau = serializers.IntegerField(required=False, min_value=64 * 1024)
+    nombre_morceaux = serializers.IntegerField(read_only=True)
+    morceaux_recus = serializers.SerializerMethodField()
+
+    class Meta:
+        model = SessionTeleversement
+        fields = [
+            'id', 'demande', 'nom', 'nom_fichier', 'taille', 'taille_morceau', 'sha256',
+            'statut', 'nombre_morceaux', 'morceaux_recus', 'piece_jointe', 'date_creation'
+        ]
+        read_only_fields = ['statut', 'piece_jointe', 'date_creation']
+
+    def get_morceaux_recus(self, obj):
+        return obj.morceaux_recus()
+
+    def validate_taille(self, value):
+        if not 0 < value <= _upload_setting('MAX_FILE_SIZE'):
+            raise serializers.ValidationError(f"La taille doit être comprise entre 1 et {_upload_setting('MAX_FILE_SIZE')} octets.")
+        return value
+
+    def validate_taille_morceau(self, value):
+        return min(value, _upload_setting('MAX_CHUNK_SIZE'))
+
+    def validate_sha256(self, value):
+        value = value.lower()
+        if len(value) != 64 or any(c not in '0123456789abcdef' for c in value):
+            raise serializers.ValidationError("Empreinte SHA-256 hexadécimale attendue.")
+        return value
+
+
+class TeleversementDirectSerializer(serializers.Serializer):
+    demande = serializers.PrimaryKeyRelatedField(queryset=DemandePret.objects.all())
+    nom = serializers.CharField(max_length=255)
+    nom_fichier = serializers.CharField(max_length=255)
+    taille = serializers.IntegerField()
+    type_contenu = serializers.CharField(max_length=255, default='application/octet-stream')
+
+    def validate_taille(self, value):
+        if not 0 < value <= _direct_setting('MAX_FILE_SIZE'):
+            raise serializers.ValidationError(f"La taille doit être comprise entre 1 et {_direct_setting('MAX_FILE_SIZE')} octets.")
+        return value
+
+
+class ConfirmationDirecteSerializer(serializers.Serializer):
+    jeton = serializers.CharField()
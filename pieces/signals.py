@@ -0,0 +1,38 @@
+from django.db import transaction
+from django.db.models.fields.files import FieldFile
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import miniatures, references
+from .models import PieceJointe
+
+
+def _nom_fichier(instance):
+    # Lu dans __dict__ pour ne pas déclencher de requête si le champ est différé
+    valeur = instance.__dict__.get('fichier')
+    return valeur.name if isinstance(valeur, FieldFile) else valeur
+
+
+@receiver(post_init, sender=PieceJointe)
+def memoriser_fichier(sender, instance, **kwargs):
+    instance._fichier_initial = _nom_fichier(instance) if instance.pk else None
+
+
+@receiver(post_save, sender=PieceJointe)
+def compter_references(sender, instance, created, raw, **kwargs):
+    nom = instance.fichier.name
+    initial = None if created else instance._fichier_initial
+    if nom != initial:
+        references.ajouter_reference(nom)
+        references.retirer_reference(initial)
+        if nom:
+            stockage = instance.fichier.storage
+            transaction.on_commit(lambda: miniatures.planifier(nom, stockage))
+    else:
+        references.rendre_reservation(nom)
+    instance._fichier_initial = nom
+
+
+@receiver(post_delete, sender=PieceJointe)
+def liberer_reference(sender, instance, **kwargs):
+    references.retirer_reference(instance.fichier.name)
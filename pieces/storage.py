@@ -0,0 +1,96 @@
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils.functional import LazyObject
+from django.utils.module_loading import import_string
+
+PREFIXE_CAS = 'pieces_jointes/cas'
+TAILLE_BLOC = 64 * 1024
+
+
+def nom_blob(sha256, extension):
+    return f"{PREFIXE_CAS}/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}"
+
+
+def est_blob(nom):
+    return bool(nom) and nom.startswith(PREFIXE_CAS + '/')
+
+
+class StockageParEmpreinte(FileSystemStorage):
+    """
+    Stockage adressé par contenu : chaque fichier est enregistré sous son empreinte SHA-256,
+    calculée pendant l'écriture. Un contenu déjà présent n'est pas réécrit ; le nom renvoyé est
+    celui du fichier existant. Le comptage des références est tenu par pieces.BlobPiece : la référence
+    est prise à l'écriture, avant que le nom soit renvoyé.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Le nom définitif dépend du contenu et il est choisi dans _save()
+        return name
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1].lower()
+        if hasattr(content, 'temporary_file_path'):
+            return self._deplacer(content.temporary_file_path(), extension)
+
+        dossier_temporaire = self.path(os.path.join(PREFIXE_CAS, 'tmp'))
+        os.makedirs(dossier_temporaire, exist_ok=True)
+        fd, temporaire = tempfile.mkstemp(dir=dossier_temporaire)
+        empreinte = hashlib.sha256()
+        try:
+            with os.fdopen(fd, 'wb') as destination:
+                for morceau in content.chunks(TAILLE_BLOC):
+                    if isinstance(morceau, str):
+                        morceau = morceau.encode()
+                    empreinte.update(morceau)
+                    destination.write(morceau)
+            nom = nom_blob(empreinte.hexdigest(), extension)
+            self._referencer(nom, lambda chemin: os.replace(temporaire, chemin))
+        finally:
+            if os.path.exists(temporaire):
+                os.remove(temporaire)
+        return nom
+
+    def _deplacer(self, source, extension):
+        # Fichier déjà sur disque (téléversement temporaire) : on le hache puis on le déplace sans copie
+        empreinte = hashlib.sha256()
+        with open(source, 'rb') as fichier:
+            for bloc in iter(lambda: fichier.read(TAILLE_BLOC), b''):
+                empreinte.update(bloc)
+        nom = nom_blob(empreinte.hexdigest(), extension)
+        self._referencer(nom, lambda chemin: file_move_safe(source, chemin, allow_overwrite=True))
+        return nom
+
+    def _referencer(self, nom, deposer):
+        # Contrôle d'existence et prise de référence sous le verrou du blob (pieces.references.reserver) :
+        # un nettoyage concurrent ne peut pas supprimer le fichier entre les deux
+        from .references import reserver
+
+        def ecrire():
+            chemin = self.path(nom)
+            os.makedirs(os.path.dirname(chemin), exist_ok=True)
+            deposer(chemin)
+            self._appliquer_permissions(chemin)
+
+        reserver(nom, self, ecrire)
+
+    def _appliquer_permissions(self, chemin):
+        if self.file_permissions_mode is not None:
+            os.chmod(chemin, self.file_permissions_mode)
+
+
+class _StockagePiecesJointes(LazyObject):
+    def _setup(self):
+        self._wrapped = import_string(getattr(settings, 'PIECES_JOINTES_STORAGE', 'pieces.storage.StockageParEmpreinte'))()
+
+
+stockage_pieces_jointes = _StockagePiecesJointes()
+
+
+def obtenir_stockage():
+    # Référencé par PieceJointe.fichier : le backend est choisi par settings.PIECES_JOINTES_STORAGE
+    return stockage_pieces_jointes
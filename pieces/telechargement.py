@@ -0,0 +1,137 @@
+import hashlib
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import content_disposition_header, parse_etags, quote_etag
+
+from .miniatures import nom_miniature
+from .storage import est_blob
+
+PLAGE_OCTETS = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _download_setting(nom):
+    defauts = {
+        'BACKEND': None,              # None, 'x-accel' (nginx) ou 'x-sendfile' (Apache, lighttpd)
+        'INTERNAL_PREFIX': '/media-protege/',
+        'CHUNK_SIZE': 64 * 1024,
+    }
+    return getattr(settings, 'PROTECTED_DOWNLOADS', {}).get(nom, defauts[nom])
+
+
+def _chemin_local(nom, stockage):
+    try:
+        return stockage.path(nom)
+    except NotImplementedError:
+        return None  # stockage distant (S3...) : ni chemin ni os.stat
+
+
+def etag_fichier(nom, stockage, variante=None):
+    # Un blob est nommé par son SHA-256 : l'empreinte est un ETag fort sans relire le fichier
+    if est_blob(nom):
+        etag = os.path.basename(nom).split('.')[0]
+    else:
+        chemin = _chemin_local(nom, stockage)
+        if chemin is not None:
+            infos = os.stat(chemin)
+            taille, modification = infos.st_size, int(infos.st_mtime)
+        else:
+            taille = stockage.size(nom)
+            try:
+                modification = int(stockage.get_modified_time(nom).timestamp())
+            except NotImplementedError:
+                # Objet déposé sous une clé unique (envoi direct) et jamais réécrit : la clé suffit
+                modification = int(hashlib.sha256(nom.encode()).hexdigest()[:8], 16)
+        etag = f"{taille:x}-{modification:x}"
+    return quote_etag(f"{etag}-{variante}" if variante else etag)
+
+
+def _plage_demandee(request, taille, etag):
+    """Renvoie (debut, fin) inclusifs, None pour le fichier entier, ou False si la plage est insatisfiable."""
+    entete = request.headers.get('Range')
+    if not entete or request.method not in ('GET', 'HEAD'):
+        return None
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range != etag:
+        return None
+    correspondance = PLAGE_OCTETS.match(entete.strip())
+    if not correspondance:
+        return None  # plusieurs plages ou unité inconnue : on renvoie tout le fichier
+    debut, fin = correspondance.groups()
+    if not debut:
+        if not fin or int(fin) == 0:
+            return False
+        return max(taille - int(fin), 0), taille - 1
+    debut = int(debut)
+    fin = min(int(fin), taille - 1) if fin else taille - 1
+    if debut >= taille or debut > fin:
+        return False
+    return debut, fin
+
+
+def _lire_par_blocs(nom, stockage, debut, longueur):
+    taille_bloc = _download_setting('CHUNK_SIZE')
+    with stockage.open(nom, 'rb') as fichier:
+        fichier.seek(debut)
+        while longueur > 0:
+            bloc = fichier.read(min(taille_bloc, longueur))
+            if not bloc:
+                break
+            longueur -= len(bloc)
+            yield bloc
+
+
+def reponse_fichier(request, nom, stockage, nom_telechargement, variante=None, en_ligne=False):
+    """
+    Réponse de téléchargement d'un fichier du stockage, après contrôle d'accès par la vue.
+    Avec un serveur frontal configuré, le transfert lui est délégué ; sinon le fichier est
+    diffusé par blocs (stockage.open(), local ou distant), avec prise en charge de Range, ETag
+    et If-None-Match. X-Sendfile exige un chemin local : pour un stockage distant, le fichier est diffusé.
+    """
+    if variante:
+        nom = nom_miniature(nom, variante)
+    chemin = _chemin_local(nom, stockage)
+    etag = etag_fichier(nom, stockage, variante)
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+        reponse = HttpResponseNotModified()
+        reponse['ETag'] = etag
+        return reponse
+
+    type_contenu = mimetypes.guess_type(nom_telechargement)[0] or 'application/octet-stream'
+    backend = _download_setting('BACKEND')
+    if backend == 'x-sendfile' and chemin is None:
+        backend = None
+    if backend:
+        reponse = HttpResponse(content_type=type_contenu)
+        if backend == 'x-accel':
+            # URI que nginx décode : accents, espaces, « ? » et « % » du nom encodés
+            reponse['X-Accel-Redirect'] = _download_setting('INTERNAL_PREFIX').rstrip('/') + '/' + quote(nom)
+        else:
+            # Chemin lu tel quel par le module : les octets du système de fichiers, que Django
+            # transmet inchangés en latin-1
+            reponse['X-Sendfile'] = os.fsencode(chemin).decode('latin-1')
+    else:
+        taille = stockage.size(nom)
+        plage = _plage_demandee(request, taille, etag)
+        if plage is False:
+            reponse = HttpResponse(status=416)
+            reponse['Content-Range'] = f"bytes */{taille}"
+            return reponse
+        debut, fin = plage or (0, taille - 1)
+        longueur = fin - debut + 1 if taille else 0
+        corps = _lire_par_blocs(nom, stockage, debut, longueur) if request.method != 'HEAD' else iter(())
+        reponse = StreamingHttpResponse(corps, content_type=type_contenu, status=206 if plage else 200)
+        reponse['Content-Length'] = str(longueur)
+        reponse['Accept-Ranges'] = 'bytes'
+        if plage:
+            reponse['Content-Range'] = f"bytes {debut}-{fin}/{taille}"
+
+    reponse['ETag'] = etag
+    reponse['Cache-Control'] = 'private, no-cache'
+    reponse['Content-Disposition'] = content_disposition_header(not en_ligne, nom_telechargement)
+    return reponse
@@ -0,0 +1,93 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.core.files import File
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .models import PieceJointe, SessionTeleversement
+
+TAILLE_BLOC = 64 * 1024
+
+
+class _FichierAssemble(File):
+    # FileSystemStorage déplace (rename) un fichier qui expose temporary_file_path() au lieu de le recopier
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def ecrire_morceau(session, numero, flux, sha256_attendu):
+    """Écrit un morceau sur disque au fil de la lecture, en vérifiant sa taille et son empreinte SHA-256."""
+    if not 0 <= numero < session.nombre_morceaux:
+        raise ValidationError({"numero": f"Le morceau doit être compris entre 0 et {session.nombre_morceaux - 1}."})
+    taille_attendue = session.taille_attendue(numero)
+
+    os.makedirs(session.dossier, exist_ok=True)
+    chemin = session.chemin_morceau(numero)
+    # Fichier temporaire propre à cette écriture : deux threads d'un même processus peuvent
+    # recevoir le même morceau (nouvel essai du client)
+    descripteur, temporaire = tempfile.mkstemp(dir=session.dossier, prefix=os.path.basename(chemin) + '.', suffix='.tmp')
+    empreinte = hashlib.sha256()
+    taille = 0
+    try:
+        with os.fdopen(descripteur, 'wb') as destination:
+            while taille <= taille_attendue:
+                bloc = flux.read(min(TAILLE_BLOC, taille_attendue + 1 - taille))
+                if not bloc:
+                    break
+                empreinte.update(bloc)
+                destination.write(bloc)
+                taille += len(bloc)
+        if taille != taille_attendue:
+            raise ValidationError({"morceau": f"Taille reçue {taille} octets, {taille_attendue} attendus."})
+        if sha256_attendu and empreinte.hexdigest() != sha256_attendu.lower():
+            raise ValidationError({"morceau": "L'empreinte SHA-256 du morceau ne correspond pas."})
+        os.replace(temporaire, chemin)
+    finally:
+        if os.path.exists(temporaire):
+            os.remove(temporaire)
+    session.save(update_fields=['date_maj'])
+    return taille
+
+
+def assembler(session):
+    """Concatène les morceaux, vérifie l'empreinte du fichier complet et crée la pièce jointe."""
+    if session.morceaux_manquants():
+        raise ValidationError({"detail": "Tous les morceaux n'ont pas été reçus."})
+
+    # Une seule finalisation à la fois pour une session donnée
+    if not SessionTeleversement.objects.filter(pk=session.pk, statut='en_cours').update(statut='assemblage'):
+        raise ValidationError({"detail": "Cette session est déjà en cours de finalisation ou terminée."})
+
+    chemin = os.path.join(session.dossier, 'assemblage')
+    empreinte = hashlib.sha256()
+    try:
+        with open(chemin, 'wb') as destination:
+            for numero in range(session.nombre_morceaux):
+                with open(session.chemin_morceau(numero), 'rb') as morceau:
+                    for bloc in iter(lambda: morceau.read(TAILLE_BLOC), b''):
+                        empreinte.update(bloc)
+                        destination.write(bloc)
+        if empreinte.hexdigest() != session.sha256.lower():
+            raise ValidationError({"sha256": "L'empreinte du fichier assemblé ne correspond pas à celle annoncée."})
+
+        with transaction.atomic():
+            piece = PieceJointe(demande_id=session.demande_id, nom=session.nom)
+            with open(chemin, 'rb') as fichier:
+                piece.fichier.save(session.nom_fichier, _FichierAssemble(fichier, name=session.nom_fichier), save=True)
+            session.statut = 'termine'
+            session.piece_jointe = piece
+            session.save(update_fields=['statut', 'piece_jointe', 'date_maj'])
+    except Exception:
+        SessionTeleversement.objects.filter(pk=session.pk).update(statut='en_cours')
+        if os.path.exists(chemin):
+            os.remove(chemin)
+        raise
+    supprimer_morceaux(session)
+    return piece
+
+
+def supprimer_morceaux(session):
+    shutil.rmtree(session.dossier, ignore_errors=True)
@@ -1,3 +1,405 @@
-from django.test import TestCase
+import hashlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import InMemoryStorage, Storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from loans.tests import creer_demande, creer_utilisateur
+from . import miniatures
+from .models import BlobPiece, PieceJointe, SessionTeleversement
+from .serializers import PieceJointeSerializer
+from .storage import StockageParEmpreinte, stockage_pieces_jointes
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), CHUNKED_UPLOAD={'DIR': tempfile.mkdtemp(), 'CHUNK_SIZE': 64 * 1024})
+class TeleversementMorceauxTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fonctionnaire = creer_utilisateur('agent')
+        cls.demande = creer_demande(cls.fonctionnaire)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.fonctionnaire)
+        self.contenu = bytes(range(256)) * 1000  # 256 000 octets -> 4 morceaux de 64 Kio
+        self.session = self.client.post(reverse('televersement-creer'), {
+            'demande': self.demande.pk, 'nom': 'Bulletin de paie', 'nom_fichier': 'bulletin.pdf',
+            'taille': len(self.contenu), 'sha256': hashlib.sha256(self.contenu).hexdigest(),
+        }).data
+
+    def envoyer(self, numero, morceau=None):
+        taille = 64 * 1024
+        if morceau is None:
+            morceau = self.contenu[numero * taille:(numero + 1) * taille]
+        return self.client.put(
+            reverse('televersement-morceau', args=[self.session['id'], numero]), morceau,
+            content_type='application/octet-stream', HTTP_X_CHECKSUM_SHA256=hashlib.sha256(morceau).hexdigest(),
+        )
+
+    def test_reprise_et_finalisation(self):
+        self.assertEqual(self.session['nombre_morceaux'], 4)
+        for numero in (2, 0, 3):
+            self.assertEqual(self.envoyer(numero).status_code, 200)
+
+        finaliser = reverse('televersement-finaliser', args=[self.session['id']])
+        response = self.client.post(finaliser)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['morceaux_manquants'], [1])
+
+        etat = self.client.get(reverse('televersement-detail', args=[self.session['id']])).data
+        self.assertEqual(etat['morceaux_recus'], [0, 2, 3])
+        self.envoyer(1)
+
+        response = self.client.post(finaliser)
+        self.assertEqual(response.status_code, 201)
+        piece = PieceJointe.objects.get()
+        with piece.fichier.open('rb') as fichier:
+            self.assertEqual(fichier.read(), self.contenu)
+        self.assertEqual(SessionTeleversement.objects.get().statut, 'termine')
+
+    def test_morceau_corrompu_refuse(self):
+        morceau = self.contenu[:64 * 1024]
+        response = self.client.put(
+            reverse('televersement-morceau', args=[self.session['id'], 0]), morceau,
+            content_type='application/octet-stream', HTTP_X_CHECKSUM_SHA256=hashlib.sha256(b'autre').hexdigest(),
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.envoyer(1, b'trop court').status_code, 400)
+        self.assertEqual(self.client.get(reverse('televersement-detail', args=[self.session['id']])).data['morceaux_recus'], [])
+
+    def test_session_reservee_a_son_proprietaire(self):
+        self.client.force_authenticate(creer_utilisateur('autre'))
+        self.assertEqual(self.envoyer(0).status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class StockageParEmpreinteTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fonctionnaire = creer_utilisateur('agent')
+        cls.demandes = [creer_demande(cls.fonctionnaire) for _ in range(2)]
+
+    def televerser(self, demande, contenu, nom='cni.jpeg'):
+        client = APIClient()
+        client.force_authenticate(self.fonctionnaire)
+        fichier = io.BytesIO(contenu)
+        fichier.name = nom
+        response = client.post(reverse('upload-piece-jointe'), {'demande': demande.pk, 'nom': 'CNI', 'fichier': fichier})
+        self.assertEqual(response.status_code, 201)
+        return PieceJointe.objects.get(pk=response.data['id'])
+
+    def test_un_blob_par_contenu_avec_comptage(self):
+        premiere = self.televerser(self.demandes[0], b'meme contenu', 'cni.jpeg')
+        seconde = self.televerser(self.demandes[1], b'meme contenu', 'cni_J5gYaro.jpeg')
+        autre = self.televerser(self.demandes[1], b'autre contenu')
+
+        self.assertEqual(premiere.fichier.name, seconde.fichier.name)
+        self.assertIn(hashlib.sha256(b'meme contenu').hexdigest(), premiere.fichier.name)
+        self.assertEqual(BlobPiece.objects.get(chemin=premiere.fichier.name).references, 2)
+        self.assertEqual(BlobPiece.objects.count(), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            premiere.delete()
+        self.assertTrue(stockage_pieces_jointes.exists(seconde.fichier.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            seconde.delete()
+        self.assertFalse(stockage_pieces_jointes.exists(seconde.fichier.name))
+        self.assertEqual(list(BlobPiece.objects.values_list('chemin', flat=True)), [autre.fichier.name])
+
+    def test_nettoyage_concurrent_d_un_contenu_reteleverse(self):
+        premiere = self.televerser(self.demandes[0], b'meme contenu')
+        nom = premiere.fichier.name
+        with self.captureOnCommitCallbacks() as nettoyages:
+            premiere.delete()
+
+        # Le nettoyage du blob orphelin s'exécute pendant l'envoi du même contenu, après l'écriture
+        ecrire = StockageParEmpreinte._save
+
+        def ecrire_puis_nettoyer(stockage, name, content):
+            resultat = ecrire(stockage, name, content)
+            for nettoyage in nettoyages:
+                nettoyage()
+            return resultat
+
+        with mock.patch.object(StockageParEmpreinte, '_save', ecrire_puis_nettoyer):
+            seconde = self.televerser(self.demandes[1], b'meme contenu')
+        self.assertEqual(seconde.fichier.name, nom)
+        self.assertTrue(stockage_pieces_jointes.exists(nom))
+        self.assertEqual(BlobPiece.objects.get(chemin=nom).references, 1)
+
+    def test_fichier_manquant_reecrit(self):
+        premiere = self.televerser(self.demandes[0], b'meme contenu')
+        os.remove(premiere.fichier.path)
+        seconde = self.televerser(self.demandes[1], b'meme contenu')
+        with seconde.fichier.open('rb') as fichier:
+            self.assertEqual(fichier.read(), b'meme contenu')
+        self.assertEqual(BlobPiece.objects.get(chemin=seconde.fichier.name).references, 2)
+
+    def test_meme_contenu_reenregistre_sur_la_meme_piece(self):
+        piece = self.televerser(self.demandes[0], b'meme contenu')
+        piece.fichier.save('cni.jpeg', ContentFile(b'meme contenu'), save=True)
+        self.assertEqual(BlobPiece.objects.get(chemin=piece.fichier.name).references, 1)
+
+    def test_migration_des_fichiers_existants(self):
+        for i, demande in enumerate(self.demandes):
+            ancien = f'pieces_jointes/WhatsApp_Image_{i}.jpeg'
+            chemin = os.path.join(settings.MEDIA_ROOT, ancien)
+            os.makedirs(os.path.dirname(chemin), exist_ok=True)
+            with open(chemin, 'wb') as fichier:
+                fichier.write(b'photo identique')
+            piece = PieceJointe.objects.create(demande=demande, nom='Photo', fichier=ContentFile(b'x', name='x.jpeg'))
+            PieceJointe.objects.filter(pk=piece.pk).update(fichier=ancien)
+
+        call_command('dedoublonner_pieces', stdout=io.StringIO())
+
+        noms = set(PieceJointe.objects.values_list('fichier', flat=True))
+        nom_blob = next(n for n in noms if hashlib.sha256(b'photo identique').hexdigest() in n)
+        self.assertEqual(BlobPiece.objects.get(chemin=nom_blob).references, 2)
+        self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, 'pieces_jointes/WhatsApp_Image_0.jpeg')))
+        # le blob de l'ancien contenu « x », plus référencé, a été supprimé
+        self.assertEqual(BlobPiece.objects.count(), 1)
+
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow est optionnel
+    Image = None
+
+
+@unittest.skipUnless(Image, "Pillow n'est pas installé")
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), THUMBNAILS={'SYNC': True})
+class MiniaturesTests(TestCase):
+
+    def test_miniatures_generees_et_exposees(self):
+        fonctionnaire = creer_utilisateur('agent')
+        demande = creer_demande(fonctionnaire)
+        image = io.BytesIO()
+        Image.new('RGB', (1200, 800), 'navy').save(image, 'PNG')
+        image.seek(0)
+        image.name = 'bulletin.png'
+        client = APIClient()
+        client.force_authenticate(fonctionnaire)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(reverse('upload-piece-jointe'), {'demande': demande.pk, 'nom': 'Bulletin', 'fichier': image})
+        self.assertEqual(response.status_code, 201)
+
+        piece = PieceJointe.objects.get(pk=response.data['id'])
+        chemin = piece.fichier.path
+        with Image.open(miniatures.nom_miniature(chemin, 'petite')) as petite:
+            self.assertEqual(max(petite.size), miniatures.TAILLES['petite'])
+        self.assertTrue(os.path.exists(miniatures.nom_miniature(chemin, 'moyenne')))
+
+        self.assertEqual(piece.miniatures, list(miniatures.TAILLES))
+        # Liste des pièces : les tailles sont lues sur la ligne, sans accès au stockage
+        with mock.patch.object(StockageParEmpreinte, 'exists', side_effect=AssertionError), \
+                mock.patch.object(StockageParEmpreinte, 'path', side_effect=AssertionError):
+            urls = PieceJointeSerializer(piece).data['miniatures']
+        self.assertEqual(set(urls), set(miniatures.TAILLES))
+        self.assertTrue(urls['petite'].endswith('?variante=petite'))
+        response = client.get(urls['petite'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+
+        # Même contenu sur une autre pièce : dérivés existants, tailles enregistrées sans nouvelle génération
+        image.seek(0)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(reverse('upload-piece-jointe'), {'demande': demande.pk, 'nom': 'Copie', 'fichier': image})
+        self.assertEqual(PieceJointe.objects.get(pk=response.data['id']).miniatures, list(miniatures.TAILLES))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PieceJointe.objects.all().delete()
+        self.assertFalse(os.path.exists(miniatures.nom_miniature(chemin, 'petite')))
+
+
+class StockageDistant(Storage):
+    """Comme un stockage S3 : pas de path(), donc ni chemin local ni os.stat (contenu en mémoire)."""
+
+    def __init__(self):
+        self.memoire = InMemoryStorage()
+
+    def _open(self, name, mode='rb'):
+        return self.memoire.open(name, mode)
+
+    def _save(self, name, content):
+        return self.memoire.save(name, content)
+
+    def exists(self, name):
+        return self.memoire.exists(name)
+
+    def size(self, name):
+        return self.memoire.size(name)
+
+    def delete(self, name):
+        self.memoire.delete(name)
+
+    def get_modified_time(self, name):
+        return self.memoire.get_modified_time(name)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class TelechargementTests(TestCase):
+    contenu = bytes(range(256)) * 1024
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fonctionnaire = creer_utilisateur('agent')
+        cls.autre = creer_utilisateur('autre')
+        demande = creer_demande(cls.fonctionnaire)
+        cls.piece = PieceJointe.objects.create(demande=demande, nom='Relevé', fichier=ContentFile(cls.contenu, name='releve.pdf'))
+        cls.url = reverse('telecharger-piece-jointe', args=[cls.piece.pk])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.fonctionnaire)
+
+    def test_acces_reserve_au_proprietaire_et_au_personnel(self):
+        self.client.force_authenticate(self.autre)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.force_authenticate(creer_utilisateur('gestionnaire', is_staff=True))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_diffusion_complete_et_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content), self.contenu)
+        self.assertEqual(response['Content-Length'], str(len(self.contenu)))
+        self.assertIn(hashlib.sha256(self.contenu).hexdigest(), response['ETag'])
+        self.assertEqual(response['Content-Disposition'], "attachment; filename*=utf-8''Relev%C3%A9.pdf")
+
+        response = self.client.get(self.url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_reprise_avec_range(self):
+        response = self.client.get(self.url, headers={'Range': 'bytes=1000-1999'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 1000-1999/{len(self.contenu)}')
+        self.assertEqual(b''.join(response.streaming_content), self.contenu[1000:2000])
+
+        response = self.client.get(self.url, headers={'Range': 'bytes=-10'})
+        self.assertEqual(b''.join(response.streaming_content), self.contenu[-10:])
+
+        response = self.client.get(self.url, headers={'Range': f'bytes={len(self.contenu)}-'})
+        self.assertEqual(response.status_code, 416)
+
+        # If-Range périmé : le fichier entier est renvoyé
+        response = self.client.get(self.url, headers={'Range': 'bytes=0-9', 'If-Range': '"ancien"'})
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(PROTECTED_DOWNLOADS={'BACKEND': 'x-accel'})
+    def test_transfert_delegue_au_serveur_frontal(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/media-protege/' + self.piece.fichier.name)
+        self.assertEqual(response.content, b'')
+
+    def test_transfert_delegue_nom_accentue(self):
+        # Fichier antérieur au stockage par empreinte, nommé d'après le fichier envoyé
+        nom = "pieces_jointes/Capture_décran 50%?.png"
+        chemin = self.piece.fichier.storage.path(nom)
+        os.makedirs(os.path.dirname(chemin), exist_ok=True)
+        with open(chemin, 'wb') as fichier:
+            fichier.write(self.contenu)
+        PieceJointe.objects.filter(pk=self.piece.pk).update(fichier=nom)
+
+        with override_settings(PROTECTED_DOWNLOADS={'BACKEND': 'x-accel'}):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/media-protege/pieces_jointes/Capture_d%C3%A9cran%2050%25%3F.png')
+        with override_settings(PROTECTED_DOWNLOADS={'BACKEND': 'x-sendfile'}):
+            response = self.client.get(self.url)
+        self.assertIn(b'X-Sendfile: ' + os.fsencode(chemin) + b'\r\n', response.serialize_headers() + b'\r\n')
+
+    def test_stockage_sans_chemin_local(self):
+        # Stockage distant (S3) : path() n'existe pas ; pièce confirmée par envoi direct, hors empreinte
+        stockage = StockageDistant()
+        nom = stockage.save('pieces_jointes/direct/0123abcd.pdf', ContentFile(self.contenu))
+        with mock.patch.object(stockage_pieces_jointes, '_wrapped', stockage):
+            PieceJointe.objects.filter(pk=self.piece.pk).update(fichier=nom)
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(b''.join(response.streaming_content), self.contenu)
+            self.assertEqual(self.client.get(self.url, headers={'If-None-Match': response['ETag']}).status_code, 304)
+
+            response = self.client.get(self.url, headers={'Range': 'bytes=1000-1999'})
+            self.assertEqual(b''.join(response.streaming_content), self.contenu[1000:2000])
+            with override_settings(PROTECTED_DOWNLOADS={'BACKEND': 'x-sendfile'}):
+                response = self.client.get(self.url)
+            self.assertTrue(response.streaming)
+            self.assertFalse(response.has_header('X-Sendfile'))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), DIRECT_UPLOAD={'DIR': tempfile.mkdtemp()})
+class TeleversementDirectTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fonctionnaire = creer_utilisateur('agent')
+        cls.demande = creer_demande(cls.fonctionnaire)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.fonctionnaire)
+
+    def preparer(self, contenu, type_contenu='application/pdf'):
+        response = self.client.post(reverse('televersement-direct'), {
+            'demande': self.demande.pk, 'nom': 'Contrat', 'nom_fichier': 'contrat.pdf',
+            'taille': len(contenu), 'type_contenu': type_contenu,
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def test_envoi_signe_puis_confirmation(self):
+        contenu = b'%PDF-1.4 contrat' * 1000
+        envoi = self.preparer(contenu)
+        self.assertEqual(envoi['methode'], 'PUT')
+
+        # le dépôt n'est authentifié que par la signature de l'URL
+        depot = APIClient().generic('PUT', envoi['url'], contenu, content_type=envoi['entetes']['Content-Type'])
+        self.assertEqual(depot.status_code, 200)
+
+        response = self.client.post(reverse('televersement-direct-confirmer'), {'jeton': envoi['jeton']})
+        self.assertEqual(response.status_code, 201)
+        piece = PieceJointe.objects.get(pk=response.data['id'])
+        self.assertEqual(piece.demande, self.demande)
+        with piece.fichier.open('rb') as fichier:
+            self.assertEqual(fichier.read(), contenu)
+        self.assertEqual(BlobPiece.objects.get(chemin=piece.fichier.name).references, 1)
+
+    def test_confirmation_repetee(self):
+        envoi = self.preparer(b'%PDF-1.4 avenant')
+        APIClient().generic('PUT', envoi['url'], b'%PDF-1.4 avenant', content_type='application/pdf')
+        premiere = self.client.post(reverse('televersement-direct-confirmer'), {'jeton': envoi['jeton']})
+        seconde = self.client.post(reverse('televersement-direct-confirmer'), {'jeton': envoi['jeton']})
+        self.assertEqual(premiere.status_code, 201)
+        self.assertEqual(seconde.data['id'], premiere.data['id'])
+        self.assertEqual(PieceJointe.objects.count(), 1)
+
+    def test_signature_et_taille_verifiees(self):
+        envoi = self.preparer(b'0123456789')
+        falsifiee = envoi['url'].replace('taille=10', 'taille=99')
+        self.assertEqual(APIClient().generic('PUT', falsifiee, b'0' * 99, content_type='application/pdf').status_code, 403)
+        self.assertEqual(APIClient().generic('PUT', envoi['url'], b'0123456789', content_type='text/plain').status_code, 403)
+
+        response = self.client.post(reverse('televersement-direct-confirmer'), {'jeton': envoi['jeton']})
+        self.assertEqual(response.status_code, 400)
+
+        self.assertEqual(APIClient().generic('PUT', envoi['url'], b'0123', content_type='application/pdf').status_code, 400)
+        self.assertFalse(PieceJointe.objects.exists())
+
+    def test_jeton_reserve_a_son_destinataire(self):
+        envoi = self.preparer(b'abc')
+        self.client.force_authenticate(creer_utilisateur('autre'))
+        response = self.client.post(reverse('televersement-direct-confirmer'), {'jeton': envoi['jeton']})
+        self.assertEqual(response.status_code, 400)
@@ -1,6 +1,18 @@
 from django.urls import path
-from .views import PieceJointeUploadView
+from .views import (
+    PieceJointeUploadView, PieceJointeTelechargementView, SessionTeleversementCreateView, SessionTeleversementDetailView,
+    MorceauTeleversementView, FinaliserTeleversementView, TeleversementDirectView, ConfirmationDirecteView,
+    TeleversementDirectLocalView
+)
 
 urlpatterns = [
     path('upload/', PieceJointeUploadView.as_view(), name='upload-piece-jointe'),
+    path('<int:pk>/telecharger/', PieceJointeTelechargementView.as_view(), name='telecharger-piece-jointe'),
+    path('televersements/', SessionTeleversementCreateView.as_view(), name='televersement-creer'),
+    path('televersements/<uuid:pk>/', SessionTeleversementDetailView.as_view(), name='televersement-detail'),
+    path('televersements/<uuid:pk>/morceaux/<int:numero>/', MorceauTeleversementView.as_view(), name='televersement-morceau'),
+    path('televersements/<uuid:pk>/finaliser/', FinaliserTeleversementView.as_view(), name='televersement-finaliser'),
+    path('direct/', TeleversementDirectView.as_view(), name='televersement-direct'),
+    path('direct/confirmer/', ConfirmationDirecteView.as_view(), name='televersement-direct-confirmer'),
+    path('direct/depot/', TeleversementDirectLocalView.as_view(), name='televersement-direct-local'),
 ]
@@ -1,7 +1,148 @@
-from rest_framework import generics, permissions
-from .models import PieceJointe
-from .serializers import PieceJointeSerializer
+import io
+import os
+
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from rest_framework import generics, permissions, status
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import direct
+from .miniatures import TAILLES
+from .models import PieceJointe, SessionTeleversement, _upload_setting
+from .serializers import (
+    ConfirmationDirecteSerializer, PieceJointeSerializer, SessionTeleversementSerializer, TeleversementDirectSerializer
+)
+from .telechargement import reponse_fichier
+from .televersement import assembler, ecrire_morceau, supprimer_morceaux
+
 
 class PieceJointeUploadView(generics.CreateAPIView):
     serializer_class = PieceJointeSerializer
     permission_classes = [permissions.IsAuthenticated]
+
+
+# ✅ Téléchargement d'une pièce jointe (ou d'une miniature avec ?variante=petite|moyenne)
+class PieceJointeTelechargementView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        piece = get_object_or_404(PieceJointe.objects.select_related('demande'), pk=pk)
+        user = request.user
+        if not user.is_staff and piece.demande.fonctionnaire_id != user.id:
+            raise PermissionDenied("Vous n'avez pas accès aux pièces jointes de cette demande.")
+
+        nom, stockage = piece.fichier.name, piece.fichier.storage
+        variante = request.query_params.get('variante')
+        if variante:
+            if variante not in TAILLES or variante not in piece.miniatures:
+                raise Http404("Aperçu indisponible.")
+            return reponse_fichier(request, nom, stockage, f"{piece.nom}-{variante}.jpg", variante=variante, en_ligne=True)
+        if not stockage.exists(nom):
+            raise Http404("Fichier introuvable.")
+        extension = os.path.splitext(nom)[1].lower()
+        return reponse_fichier(request, nom, stockage, f"{piece.nom}{extension}")
+
+
+# ✅ Téléversement en morceaux : création de la session
+class SessionTeleversementCreateView(generics.CreateAPIView):
+    serializer_class = SessionTeleversementSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def perform_create(self, serializer):
+        demande = serializer.validated_data['demande']
+        user = self.request.user
+        if not user.is_staff and demande.fonctionnaire_id != user.id:
+            raise PermissionDenied("Vous ne pouvez pas joindre de pièce à une demande qui ne vous appartient pas.")
+        taille_morceau = serializer.validated_data.get('taille_morceau', _upload_setting('CHUNK_SIZE'))
+        serializer.save(proprietaire=user, taille_morceau=taille_morceau)
+
+
+class SessionTeleversementMixin:
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_session(self):
+        return get_object_or_404(SessionTeleversement, pk=self.kwargs['pk'], proprietaire=self.request.user)
+
+
+# ✅ État de la session (morceaux déjà reçus, pour reprendre) et abandon
+class SessionTeleversementDetailView(SessionTeleversementMixin, APIView):
+
+    def get(self, request, pk):
+        return Response(SessionTeleversementSerializer(self.get_session()).data)
+
+    def delete(self, request, pk):
+        session = self.get_session()
+        if session.statut == 'en_cours':
+            supprimer_morceaux(session)
+            session.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+# ✅ Envoi d'un morceau : corps brut, empreinte dans l'en-tête X-Checksum-Sha256
+class MorceauTeleversementView(SessionTeleversementMixin, APIView):
+
+    def put(self, request, pk, numero):
+        session = self.get_session()
+        if session.statut != 'en_cours':
+            return Response({"detail": "Cette session n'accepte plus de morceaux."}, status=status.HTTP_409_CONFLICT)
+        # request.data n'est jamais lu : le corps est copié sur disque par blocs
+        taille = ecrire_morceau(session, numero, request.stream or io.BytesIO(), request.headers.get('X-Checksum-Sha256'))
+        return Response({"numero": numero, "taille": taille}, status=status.HTTP_200_OK)
+
+
+# ✅ Finalisation : assemblage, vérification de l'empreinte complète, création de la pièce jointe
+class FinaliserTeleversementView(SessionTeleversementMixin, APIView):
+
+    def post(self, request, pk):
+        session = self.get_session()
+        manquants = session.morceaux_manquants()
+        if manquants:
+            return Response({"detail": "Tous les morceaux n'ont pas été reçus.", "morceaux_manquants": manquants[:100]}, status=status.HTTP_400_BAD_REQUEST)
+        piece = assembler(session)
+        return Response(PieceJointeSerializer(piece, context={'request': request}).data, status=status.HTTP_201_CREATED)
+
+
+# ✅ Envoi direct vers le stockage : URL signée, le fichier ne passe pas par les workers Django
+class TeleversementDirectView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = TeleversementDirectSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        donnees = serializer.validated_data
+        demande = donnees['demande']
+        if not request.user.is_staff and demande.fonctionnaire_id != request.user.id:
+            raise PermissionDenied("Vous ne pouvez pas joindre de pièce à une demande qui ne vous appartient pas.")
+        envoi = direct.preparer(demande, request.user, donnees['nom'], donnees['nom_fichier'], donnees['taille'], donnees['type_contenu'])
+        return Response(envoi, status=status.HTTP_201_CREATED)
+
+
+# ✅ Confirmation de l'envoi direct : vérification de l'objet déposé puis création de la pièce jointe
+class ConfirmationDirecteView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = ConfirmationDirecteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        piece = direct.confirmer(serializer.validated_data['jeton'], request.user)
+        return Response(PieceJointeSerializer(piece, context={'request': request}).data, status=status.HTTP_201_CREATED)
+
+
+# ✅ Réception locale d'un envoi direct (équivalent de l'URL présignée S3, authentifiée par sa signature)
+class TeleversementDirectLocalView(APIView):
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def put(self, request):
+        backend = direct.obtenir_backend()
+        if not isinstance(backend, direct.TeleversementLocal):
+            raise Http404
+        parametres = request.query_params
+        cle, taille = parametres.get('cle', ''), parametres.get('taille', '')
+        type_contenu = request.headers.get('Content-Type', '')
+        if not cle.startswith(direct.PREFIXE_DIRECT + '/') or not backend.verifier(cle, type_contenu, taille, parametres.get('expire'), parametres.get('signature')):
+            return Response({"detail": "Signature invalide ou expirée."}, status=status.HTTP_403_FORBIDDEN)
+        backend.recevoir(cle, request.stream or io.BytesIO(), int(taille))
+        return Response(status=status.HTTP_200_OK)
@@ -1,11 +1,14 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User
 
-class UserAdmin(BaseUserAdmin):
+from Pret.admin import GrandeTableAdminMixin
+from .models import EmailSortant, User
+
+class UserAdmin(GrandeTableAdminMixin, BaseUserAdmin):
     list_display = ('email', 'username', 'first_name', 'last_name', 'role', 'is_staff', 'is_active', 'is_verified')
     list_filter = ('role', 'is_staff', 'is_active', 'is_verified')
     search_fields = ('email', 'username', 'first_name', 'last_name', 'cin_number')
+    date_hierarchy = 'date_joined'  # index utilisateur_inscription_idx
     ordering = ('email',)
 
     fieldsets = (
@@ -24,4 +27,14 @@ class UserAdmin(BaseUserAdmin):
         ('Permissions', {'fields': ('is_active', 'is_staff', 'is_superuser', 'is_verified', 'groups', 'user_permissions')}),
     )
 
-admin.site.register(User, UserAdmin)
\ No newline at end of file
+admin.site.register(User, UserAdmin)
+
+
+@admin.register(EmailSortant)
+class EmailSortantAdmin(GrandeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('destinataire', 'sujet', 'statut', 'tentatives', 'prochain_essai', 'date_envoi')
+    list_filter = ('statut',)
+    search_fields = ('destinataire',)
+    date_hierarchy = 'date_creation'  # index email_sortant_creation_idx
+    readonly_fields = ('date_creation', 'date_envoi', 'derniere_erreur')
+    ordering = ('-date_creation',)
@@ -0,0 +1,131 @@
+import base64
+import binascii
+import copy
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from oauth2_provider.contrib.rest_framework import OAuth2Authentication
+from rest_framework.authentication import BaseAuthentication
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+def _user_cache_setting(nom):
+    defauts = {'MAX_SIZE': 10000, 'TTL': 60}
+    return getattr(settings, 'AUTH_USER_CACHE', {}).get(nom, defauts[nom])
+
+
+class CacheUtilisateurs:
+    """
+    Cache LRU borné, avec durée de vie, des utilisateurs authentifiés par JWT (un par processus).
+    Les entrées sont invalidées à l'enregistrement ou à la suppression d'un utilisateur (users.signals) ;
+    la durée de vie borne le délai de prise en compte des changements faits par un autre processus
+    ou par un QuerySet.update().
+    """
+
+    def __init__(self):
+        self._entrees = OrderedDict()
+        self._verrou = threading.Lock()
+
+    def obtenir(self, user_id):
+        user_id = str(user_id)  # simplejwt encode user_id en chaîne dans le jeton
+        with self._verrou:
+            entree = self._entrees.get(user_id)
+            if entree is None:
+                return None
+            expire, user = entree
+            if expire < time.monotonic():
+                del self._entrees[user_id]
+                return None
+            self._entrees.move_to_end(user_id)
+        # Copie : une vue qui modifie request.user ne doit pas altérer l'instance partagée
+        return copy.copy(user)
+
+    def placer(self, user_id, user):
+        user_id = str(user_id)
+        taille_max = _user_cache_setting('MAX_SIZE')
+        with self._verrou:
+            self._entrees[user_id] = (time.monotonic() + _user_cache_setting('TTL'), copy.copy(user))
+            self._entrees.move_to_end(user_id)
+            while len(self._entrees) > taille_max:
+                self._entrees.popitem(last=False)
+
+    def invalider(self, user_id):
+        with self._verrou:
+            self._entrees.pop(str(user_id), None)
+
+    def vider(self):
+        with self._verrou:
+            self._entrees.clear()
+
+    def __len__(self):
+        return len(self._entrees)
+
+
+cache_utilisateurs = CacheUtilisateurs()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication sans requête sur users_user tant que l'utilisateur est en cache.
+    Les vues sensibles déclarent `authentification_stricte = True` pour relire l'utilisateur en base.
+    """
+
+    def authenticate(self, request):
+        vue = (getattr(request, 'parser_context', None) or {}).get('view')
+        self.stricte = getattr(vue, 'authentification_stricte', False)
+        return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if getattr(self, 'stricte', False) or user_id is None:
+            return super().get_user(validated_token)
+
+        user = cache_utilisateurs.obtenir(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            cache_utilisateurs.placer(user_id, user)
+            return user
+
+        # Mêmes contrôles que JWTAuthentication.get_user sur l'instance en cache
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
+
+
+def est_jwt(jeton):
+    """Reconnaît un JWT à sa forme (trois segments base64url, en-tête JSON avec « alg ») sans vérifier sa signature."""
+    segments = jeton.split(b'.')
+    if len(segments) != 3 or not segments[0] or not segments[1]:
+        return False
+    try:
+        entete = json.loads(base64.urlsafe_b64decode(segments[0] + b'=' * (-len(segments[0]) % 4)))
+    except (ValueError, binascii.Error):
+        return False
+    return isinstance(entete, dict) and 'alg' in entete
+
+
+class AuthentificationParTypeDeJeton(BaseAuthentication):
+    """
+    Aiguillage selon le jeton Bearer : un JWT va directement à CachedJWTAuthentication, un jeton opaque
+    à OAuth2Authentication. Évite, pour chaque requête JWT, la recherche vaine dans oauth2_provider_accesstoken.
+    """
+
+    def authenticate(self, request):
+        jwt = CachedJWTAuthentication()
+        entete = jwt.get_header(request)
+        jeton = jwt.get_raw_token(entete) if entete is not None else None
+        if jeton is not None and est_jwt(jeton):
+            return jwt.authenticate(request)
+        return OAuth2Authentication().authenticate(request)
+
+    def authenticate_header(self, request):
+        return CachedJWTAuthentication().authenticate_header(request)
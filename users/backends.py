@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import AllowAllUsersModelBackend, ModelBackend
+from django.db.models import Q
+
+UserModel = get_user_model()
+
+
+class EmailOuNomUtilisateurBackend(AllowAllUsersModelBackend):
+    """
+    Authentification par nom d'utilisateur ou par e-mail : une seule requête (deux index uniques)
+    et un seul calcul de hachage, y compris pour un identifiant inconnu.
+    Les comptes inactifs sont renvoyés par authenticate() pour que UserLoginView puisse expliquer
+    le refus ; get_user() les refuse, comme ModelBackend, pour qu'une session ouverte ne survive pas
+    à la désactivation du compte.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        candidats = list(UserModel._default_manager.filter(Q(**{UserModel.USERNAME_FIELD: username}) | Q(email=username))[:2])
+        # Un nom d'utilisateur identique à l'e-mail d'un autre compte reste prioritaire, comme avec ModelBackend
+        user = next((u for u in candidats if u.get_username() == username), candidats[0] if candidats else None)
+        if user is None:
+            # Même coût de hachage que pour un compte existant (cf. ModelBackend)
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+    def get_user(self, user_id):
+        user = super().get_user(user_id)
+        return user if user is not None and ModelBackend.user_can_authenticate(self, user) else None
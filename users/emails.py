@@ -0,0 +1,102 @@
+import datetime
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import EmailSortant
+
+
+def _outbox_setting(nom):
+    defauts = {
+        'BATCH_SIZE': 50,
+        'MAX_ATTEMPTS': 5,
+        'RETRY_DELAY': 60,          # secondes, doublé à chaque échec
+        'MAX_RETRY_DELAY': 3600,
+        'LEASE': 300,               # secondes pendant lesquelles un lot réservé n'est pas repris
+    }
+    return getattr(settings, 'EMAIL_OUTBOX', {}).get(nom, defauts[nom])
+
+
+def mettre_en_file(sujet, corps, destinataires, expediteur=None):
+    # À appeler dans la transaction qui crée l'objet concerné : l'e-mail n'existe
+    # que si la transaction est validée, et rien n'est envoyé pendant la requête.
+    expediteur = expediteur or getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@votreapp.com')
+    return EmailSortant.objects.bulk_create([
+        EmailSortant(destinataire=destinataire, sujet=sujet, corps=corps, expediteur=expediteur)
+        for destinataire in destinataires
+    ])
+
+
+def _programmer_nouvel_essai(email, erreur, maintenant):
+    email.tentatives += 1
+    email.derniere_erreur = str(erreur)
+    if email.tentatives >= _outbox_setting('MAX_ATTEMPTS'):
+        email.statut = 'abandonne'
+    else:
+        email.statut = 'en_attente'
+        delai = min(_outbox_setting('RETRY_DELAY') * 2 ** (email.tentatives - 1), _outbox_setting('MAX_RETRY_DELAY'))
+        email.prochain_essai = maintenant + datetime.timedelta(seconds=delai)
+    email.save(update_fields=['tentatives', 'derniere_erreur', 'statut', 'prochain_essai'])
+
+
+def reserver_lot(taille, maintenant):
+    """
+    Réserve des e-mails échus pour ce processus : chacun passe « en cours » par un UPDATE conditionnel,
+    qui échoue si un autre processus l'a réservé entre-temps. La réservation est un bail : un e-mail
+    resté « en cours » (processus interrompu) redevient éligible à son expiration.
+    """
+    bail = maintenant + datetime.timedelta(seconds=_outbox_setting('LEASE'))
+    candidats = list(
+        EmailSortant.objects
+        .filter(statut__in=('en_attente', 'en_cours'), prochain_essai__lte=maintenant)
+        .order_by('prochain_essai', 'id')[:taille]
+    )
+    lot = []
+    with transaction.atomic():
+        for email in candidats:
+            reserve = EmailSortant.objects.filter(
+                pk=email.pk, statut=email.statut, prochain_essai=email.prochain_essai,
+            ).update(statut='en_cours', prochain_essai=bail)
+            if reserve:
+                email.statut, email.prochain_essai = 'en_cours', bail
+                lot.append(email)
+    return lot
+
+
+def envoyer_lot(taille=None):
+    """
+    Envoie un lot d'e-mails échus sur une seule connexion au serveur de messagerie.
+    Plusieurs processus peuvent vider la file en parallèle : chacun n'envoie que les e-mails
+    qu'il a réservés, et chaque e-mail est marqué envoyé dès son envoi.
+    Retourne le couple (envoyés, en échec).
+    """
+    maintenant = timezone.now()
+    lot = reserver_lot(taille or _outbox_setting('BATCH_SIZE'), maintenant)
+    if not lot:
+        return 0, 0
+
+    connexion = get_connection(fail_silently=False)
+    try:
+        connexion.open()
+    except Exception as e:
+        for email in lot:
+            _programmer_nouvel_essai(email, e, maintenant)
+        return 0, len(lot)
+
+    envoyes, echecs = 0, 0
+    try:
+        for email in lot:
+            message = EmailMessage(email.sujet, email.corps, email.expediteur, [email.destinataire], connection=connexion)
+            try:
+                message.send()
+            except Exception as e:
+                _programmer_nouvel_essai(email, e, maintenant)
+                echecs += 1
+            else:
+                EmailSortant.objects.filter(pk=email.pk).update(statut='envoye', date_envoi=timezone.now(), derniere_erreur='')
+                envoyes += 1
+    finally:
+        connexion.close()
+    return envoyes, echecs
@@ -0,0 +1,168 @@
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+def _blacklist_setting(nom):
+    defauts = {
+        'PURGE_BATCH_SIZE': 1000,
+        'PURGE_PAUSE': 0.05,
+        'BLOOM_CAPACITY': 100000,
+        'BLOOM_ERROR_RATE': 0.001,
+        'REBUILD_INTERVAL': 3600,
+        'SYNC_INTERVAL': 0,
+    }
+    return getattr(settings, 'TOKEN_BLACKLIST', {}).get(nom, defauts[nom])
+
+
+class FiltreBloom:
+    """Filtre de Bloom : aucun faux négatif, faux positifs au taux choisi pour la capacité donnée."""
+
+    def __init__(self, capacite, taux_erreur):
+        capacite = max(capacite, 1)
+        self.nombre_bits = max(int(-capacite * math.log(taux_erreur) / math.log(2) ** 2), 8)
+        self.nombre_hachages = max(round(self.nombre_bits / capacite * math.log(2)), 1)
+        self.bits = bytearray((self.nombre_bits + 7) // 8)
+
+    def _positions(self, valeur):
+        # Double hachage (Kirsch-Mitzenmacher) à partir d'une seule empreinte
+        empreinte = hashlib.blake2b(valeur.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(empreinte[:8], 'little'), int.from_bytes(empreinte[8:], 'little') | 1
+        return ((h1 + i * h2) % self.nombre_bits for i in range(self.nombre_hachages))
+
+    def ajouter(self, valeur):
+        for position in self._positions(valeur):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, valeur):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(valeur))
+
+
+class FiltreListeNoire:
+    """
+    Filtre en mémoire (un par processus) devant la table des jetons révoqués.
+    Il est reconstruit périodiquement à partir des jetons révoqués non expirés ; entre deux
+    reconstructions, les révocations postérieures à l'instantané sont lues par une requête bornée
+    à id > dernier identifiant connu (parcours de la clé primaire, indépendant de la taille de la table).
+    Un jti absent du filtre n'est donc jamais révoqué ; seul un « peut-être » relit la table.
+
+    Par défaut (SYNC_INTERVAL = 0) cette lecture incrémentale a lieu à chaque contrôle : une révocation
+    faite par un autre processus (rotation, déconnexion) est vue immédiatement, ce qu'exige la
+    protection contre le rejeu de BLACKLIST_AFTER_ROTATION. Un intervalle positif est un choix explicite :
+    moins de lectures, mais un jeton révoqué ailleurs reste accepté jusqu'à SYNC_INTERVAL secondes.
+    """
+
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self._filtre = None
+        self._dernier_id = 0
+        self._construit_le = 0.0
+        self._synchronise_le = 0.0
+
+    def reconstruire(self):
+        maintenant = timezone.now()
+        lignes = (
+            BlacklistedToken.objects.filter(token__expires_at__gt=maintenant)
+            .order_by('id').values_list('id', 'token__jti')
+        )
+        nombre = lignes.count()
+        filtre = FiltreBloom(max(nombre * 2, _blacklist_setting('BLOOM_CAPACITY')), _blacklist_setting('BLOOM_ERROR_RATE'))
+        dernier_id = BlacklistedToken.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        for identifiant, jti in lignes.filter(id__lte=dernier_id).iterator(chunk_size=5000):
+            filtre.ajouter(jti)
+        with self._verrou:
+            self._filtre, self._dernier_id = filtre, dernier_id
+            self._construit_le = self._synchronise_le = time.monotonic()
+        return filtre
+
+    def _synchroniser(self):
+        """Met le filtre à jour si nécessaire et le retourne (état partagé lu et modifié sous le verrou)."""
+        maintenant = time.monotonic()
+        with self._verrou:
+            filtre, dernier_id = self._filtre, self._dernier_id
+            a_reconstruire = filtre is None or maintenant - self._construit_le > _blacklist_setting('REBUILD_INTERVAL')
+            if not a_reconstruire:
+                intervalle = _blacklist_setting('SYNC_INTERVAL')
+                if intervalle and maintenant - self._synchronise_le < intervalle:
+                    return filtre
+                self._synchronise_le = maintenant
+        if a_reconstruire:
+            return self.reconstruire()
+        nouveaux = list(
+            BlacklistedToken.objects.filter(id__gt=dernier_id).order_by('id').values_list('id', 'token__jti')
+        )
+        if nouveaux:
+            with self._verrou:
+                for identifiant, jti in nouveaux:
+                    filtre.ajouter(jti)
+                if self._filtre is filtre:
+                    self._dernier_id = max(self._dernier_id, nouveaux[-1][0])
+        return filtre
+
+    def est_revoque(self, jti):
+        if jti not in self._synchroniser():
+            return False
+        # « Peut-être » : confirmation dans la table (faux positif possible)
+        return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+    def ajouter(self, jti):
+        with self._verrou:
+            if self._filtre is not None:
+                self._filtre.ajouter(jti)
+
+    def invalider(self):
+        with self._verrou:
+            self._filtre = None
+
+
+filtre_liste_noire = FiltreListeNoire()
+
+
+class RefreshTokenFiltre(RefreshToken):
+    """RefreshToken dont le contrôle de révocation passe d'abord par filtre_liste_noire."""
+
+    def check_blacklist(self):
+        if filtre_liste_noire.est_revoque(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        resultat = super().blacklist()
+        jti = self.payload[api_settings.JTI_CLAIM]
+        transaction.on_commit(lambda: filtre_liste_noire.ajouter(jti))
+        return resultat
+
+
+def purger_jetons_expires(taille_lot=None, pause=None):
+    """
+    Supprime par lots les jetons expirés (et leur révocation), en parcourant la clé primaire :
+    chaque lot est une transaction courte, les verrous sont relâchés entre deux lots.
+    """
+    taille_lot = taille_lot or _blacklist_setting('PURGE_BATCH_SIZE')
+    pause = _blacklist_setting('PURGE_PAUSE') if pause is None else pause
+    maintenant = timezone.now()
+    dernier_id = 0
+    supprimes = 0
+    while True:
+        ids = list(
+            OutstandingToken.objects.filter(id__gt=dernier_id, expires_at__lte=maintenant)
+            .order_by('id').values_list('id', flat=True)[:taille_lot]
+        )
+        if not ids:
+            break
+        with transaction.atomic():
+            BlacklistedToken.objects.filter(token_id__in=ids).delete()
+            supprimes += OutstandingToken.objects.filter(id__in=ids).delete()[1].get(OutstandingToken._meta.label, 0)
+        dernier_id = ids[-1]
+        if pause:
+            time.sleep(pause)
+    return supprimes
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.emails import envoyer_lot
+
+
+class Command(BaseCommand):
+    help = "Vide la file des e-mails sortants par lots, sur une connexion SMTP réutilisée."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--une-fois', action='store_true', help="Traite les e-mails échus puis s'arrête.")
+        parser.add_argument('--taille-lot', type=int, default=None)
+        parser.add_argument('--intervalle', type=float, default=5.0, help="Pause (s) quand la file est vide.")
+
+    def handle(self, *args, **options):
+        while True:
+            envoyes, echecs = envoyer_lot(options['taille_lot'])
+            if envoyes or echecs:
+                self.stdout.write(f"{envoyes} e-mail(s) envoyé(s), {echecs} en échec.")
+            if options['une_fois']:
+                if not envoyes and not echecs:
+                    return
+                continue
+            if not envoyes and not echecs:
+                time.sleep(options['intervalle'])
@@ -0,0 +1,64 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from oauth2_provider.contrib.rest_framework import OAuth2Authentication
+from oauth2_provider.models import get_access_token_model, get_application_model
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.authentication import AuthentificationParTypeDeJeton, CachedJWTAuthentication, cache_utilisateurs
+from users.models import User
+
+VARIANTES = {
+    'chaine': (OAuth2Authentication, CachedJWTAuthentication),  # ancien ordre de DEFAULT_AUTHENTICATION_CLASSES
+    'aiguillage': (AuthentificationParTypeDeJeton,),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare le coût par requête de l'authentification en chaîne (OAuth2 puis JWT) et de l'aiguillage "
+        "par type de jeton. Les données de mesure sont créées dans une transaction annulée."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        with transaction.atomic():
+            user = User.objects.create_user(username='mesure-authentification', email='mesure@authentification.invalid', password=None)
+            application = get_application_model().objects.create(
+                name='mesure', user=user, client_type='confidential', authorization_grant_type='password'
+            )
+            opaque = get_access_token_model().objects.create(
+                user=user, application=application, token='mesure-authentification-opaque',
+                expires=timezone.now() + datetime.timedelta(hours=1), scope='read write',
+            )
+            jetons = {'JWT': str(AccessToken.for_user(user)), 'OAuth2': opaque.token}
+
+            for type_jeton, jeton in jetons.items():
+                for nom, classes in VARIANTES.items():
+                    duree, requetes = self.mesurer(classes, jeton, iterations)
+                    self.stdout.write(
+                        f"{type_jeton:<7} {nom:<11} {duree / iterations * 1e6:8.1f} µs/requête "
+                        f"{requetes / iterations:5.2f} requête(s) SQL"
+                    )
+            transaction.set_rollback(True)
+        cache_utilisateurs.invalider(user.pk)
+
+    def mesurer(self, classes, jeton, iterations):
+        fabrique = APIRequestFactory()
+        cache_utilisateurs.vider()
+        with CaptureQueriesContext(connection) as requetes:
+            debut = time.perf_counter()
+            for _ in range(iterations):
+                requete = Request(fabrique.get('/', HTTP_AUTHORIZATION=f'Bearer {jeton}'), authenticators=[classe() for classe in classes])
+                assert requete.user.is_authenticated
+            duree = time.perf_counter() - debut
+        return duree, len(requetes)
@@ -0,0 +1,61 @@
+import time
+
+from django.contrib.auth.backends import ModelBackend
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from users.backends import EmailOuNomUtilisateurBackend
+from users.models import User
+
+MOT_DE_PASSE = 'mesure-connexion-1234'
+
+
+def connexion_historique(identifiant, mot_de_passe):
+    # Ancienne logique de UserLoginView : ModelBackend puis recherche par e-mail et second hachage
+    user = ModelBackend().authenticate(None, username=identifiant, password=mot_de_passe)
+    if not user:
+        try:
+            user = User.objects.get(email=identifiant)
+            if not user.check_password(mot_de_passe):
+                user = None
+        except User.DoesNotExist:
+            user = None
+    return user
+
+
+def connexion_backend(identifiant, mot_de_passe):
+    return EmailOuNomUtilisateurBackend().authenticate(None, username=identifiant, password=mot_de_passe)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare le temps CPU par tentative de connexion (nom d'utilisateur, e-mail, identifiant inconnu) "
+        "entre l'ancienne logique de UserLoginView et EmailOuNomUtilisateurBackend. "
+        "Le compte de mesure est créé dans une transaction annulée."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=5)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        with transaction.atomic():
+            User.objects.create_user(username='mesure-connexion', email='mesure@connexion.invalid', password=MOT_DE_PASSE)
+            identifiants = {
+                "nom d'utilisateur": 'mesure-connexion',
+                'e-mail': 'mesure@connexion.invalid',
+                'inconnu': 'personne@connexion.invalid',
+            }
+            for libelle, identifiant in identifiants.items():
+                durees = {}
+                for nom, connexion in (('historique', connexion_historique), ('backend', connexion_backend)):
+                    debut = time.process_time()
+                    for _ in range(iterations):
+                        connexion(identifiant, MOT_DE_PASSE)
+                    durees[nom] = (time.process_time() - debut) / iterations
+                self.stdout.write(
+                    f"{libelle:<18} historique {durees['historique'] * 1000:8.1f} ms  "
+                    f"backend {durees['backend'] * 1000:8.1f} ms  "
+                    f"(x{durees['historique'] / max(durees['backend'], 1e-9):.2f})"
+                )
+            transaction.set_rollback(True)
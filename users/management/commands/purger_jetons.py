@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.liste_noire import purger_jetons_expires
+
+
+class Command(BaseCommand):
+    help = "Supprime par lots les jetons JWT expirés de la liste des jetons émis et de la liste noire."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--taille-lot', type=int, default=None)
+        parser.add_argument('--pause', type=float, default=None, help="Pause (s) entre deux lots.")
+        parser.add_argument(
+            '--intervalle', type=float, default=None,
+            help="Relance la purge toutes les N secondes au lieu de s'arrêter après un passage.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            supprimes = purger_jetons_expires(options['taille_lot'], options['pause'])
+            self.stdout.write(f"{supprimes} jeton(s) expiré(s) supprimé(s).")
+            if not options['intervalle']:
+                return
+            time.sleep(options['intervalle'])
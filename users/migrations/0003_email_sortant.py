@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:04
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_is_verified'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailSortant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('destinataire', models.EmailField(max_length=254)),
+                ('sujet', models.CharField(max_length=255)),
+                ('corps', models.TextField()),
+                ('expediteur', models.CharField(blank=True, max_length=255)),
+                ('statut', models.CharField(choices=[('en_attente', 'En attente'), ('envoye', 'Envoyé'), ('abandonne', 'Abandonné')], default='en_attente', max_length=20)),
+                ('tentatives', models.PositiveIntegerField(default=0)),
+                ('prochain_essai', models.DateTimeField(default=django.utils.timezone.now)),
+                ('derniere_erreur', models.TextField(blank=True)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('date_envoi', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'E-mail sortant',
+                'verbose_name_plural': 'E-mails sortants',
+                'indexes': [models.Index(fields=['statut', 'prochain_essai'], name='email_sortant_a_envoyer_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0003_email_sortant'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emailsortant',
+            index=models.Index(fields=['date_creation', 'id'], name='email_sortant_creation_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['date_joined', 'id'], name='utilisateur_inscription_idx'),
+        ),
+    ]
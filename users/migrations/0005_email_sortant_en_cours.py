@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_index_admin'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='emailsortant',
+            name='statut',
+            field=models.CharField(choices=[('en_attente', 'En attente'), ('en_cours', "En cours d'envoi"), ('envoye', 'Envoyé'), ('abandonne', 'Abandonné')], default='en_attente', max_length=20),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 
 class User(AbstractUser):
     ROLE_CHOICES = (
@@ -36,6 +37,40 @@ class User(AbstractUser):
     class Meta:
         verbose_name = "Utilisateur"
         verbose_name_plural = "Utilisateurs"
+        indexes = [
+            # date_hierarchy de l'admin
+            models.Index(fields=['date_joined', 'id'], name='utilisateur_inscription_idx'),
+        ]
 
     def __str__(self):
-        return self.email
\ No newline at end of file
+        return self.email
+
+
+class EmailSortant(models.Model):
+    STATUT_CHOICES = (
+        ('en_attente', 'En attente'),
+        ('en_cours', "En cours d'envoi"),
+        ('envoye', 'Envoyé'),
+        ('abandonne', 'Abandonné'),
+    )
+    destinataire = models.EmailField()
+    sujet = models.CharField(max_length=255)
+    corps = models.TextField()
+    expediteur = models.CharField(max_length=255, blank=True)
+    statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='en_attente')
+    tentatives = models.PositiveIntegerField(default=0)
+    prochain_essai = models.DateTimeField(default=timezone.now)
+    derniere_erreur = models.TextField(blank=True)
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_envoi = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "E-mail sortant"
+        verbose_name_plural = "E-mails sortants"
+        indexes = [
+            models.Index(fields=['statut', 'prochain_essai'], name='email_sortant_a_envoyer_idx'),
+            models.Index(fields=['date_creation', 'id'], name='email_sortant_creation_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.destinataire} - {self.sujet} [{self.statut}]"
@@ -0,0 +1,13 @@
+from drf_spectacular.extensions import OpenApiAuthenticationExtension
+
+
+class AuthentificationParTypeDeJetonScheme(OpenApiAuthenticationExtension):
+    target_class = 'users.authentication.AuthentificationParTypeDeJeton'
+    name = 'jwtOuOAuth2'
+
+    def get_security_definition(self, auto_schema):
+        return {
+            'type': 'http',
+            'scheme': 'bearer',
+            'description': "JWT (users/token/, users/login/) ou jeton d'accès OAuth2 (auth/).",
+        }
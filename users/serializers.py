@@ -1,8 +1,13 @@
 from rest_framework import serializers
 from .models import User
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from .liste_noire import RefreshTokenFiltre
 
 
+class TokenRefreshFiltreSerializer(TokenRefreshSerializer):
+    # Contrôle de révocation via le filtre en mémoire (users.liste_noire)
+    token_class = RefreshTokenFiltre
+
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
     def get_token(cls, user):
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import cache_utilisateurs
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalider_cache_authentification(sender, instance, **kwargs):
+    cache_utilisateurs.invalider(instance.pk)
@@ -1,3 +1,361 @@
-from django.test import TestCase
+import datetime
+import io
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import auth
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from oauth2_provider.models import get_access_token_model, get_application_model
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .authentication import cache_utilisateurs, est_jwt
+from .liste_noire import FiltreBloom, filtre_liste_noire, purger_jetons_expires
+from .emails import envoyer_lot, mettre_en_file, reserver_lot
+from .models import EmailSortant, User
+
+
+class BudgetRequetesUtilisateursTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', email='admin@example.com', password='x', is_staff=True)
+        for i in range(5):
+            User.objects.create_user(username=f'agent{i}', email=f'agent{i}@example.com', password='x')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_liste_admin(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('admin_user_list'))
+        self.assertEqual(response.data['count'], 6)
+
+    def test_profil(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('user_profile'))
+        self.assertEqual(response.data['email'], 'admin@example.com')
+
+    def test_profil_conditionnel(self):
+        etag = self.client.get(reverse('user_profile'))['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('user_profile'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.client.patch(reverse('user_profile'), {'phone_number': '+22890000000'})
+        response = self.client.get(reverse('user_profile'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['phone_number'], '+22890000000')
+
+
+class FileEmailsTests(TestCase):
+    # Le lanceur de tests Django remplace le backend SMTP par le backend locmem (mail.outbox)
+
+    def test_inscription_met_l_email_en_file_sans_l_envoyer(self):
+        response = APIClient().post(reverse('register'), {
+            'username': 'agent', 'email': 'agent@example.com',
+            'password': 'Un-mot-de-passe-solide', 'password2': 'Un-mot-de-passe-solide',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(mail.outbox), 0)
+        email = EmailSortant.objects.get()
+        self.assertEqual(email.destinataire, 'agent@example.com')
+        self.assertIn('/activate?token=', email.corps)
+
+        call_command('envoyer_emails', '--une-fois', stdout=mock.Mock())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(EmailSortant.objects.get().statut, 'envoye')
+
+    def test_lot_sur_une_seule_connexion(self):
+        mettre_en_file('Sujet', 'Corps', [f'agent{i}@example.com' for i in range(3)])
+        with mock.patch('users.emails.get_connection', wraps=mail.get_connection) as get_connection:
+            self.assertEqual(envoyer_lot(), (3, 0))
+        get_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_echec_programme_un_nouvel_essai(self):
+        mettre_en_file('Sujet', 'Corps', ['agent@example.com'])
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError('SMTP indisponible')):
+            self.assertEqual(envoyer_lot(), (0, 1))
+            email = EmailSortant.objects.get()
+            self.assertEqual((email.statut, email.tentatives), ('en_attente', 1))
+            self.assertGreater(email.prochain_essai, timezone.now())
+            # non échu : pas de nouvel essai immédiat
+            self.assertEqual(envoyer_lot(), (0, 0))
+
+        EmailSortant.objects.update(prochain_essai=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(envoyer_lot(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_lot_reserve_par_un_autre_processus(self):
+        mettre_en_file('Sujet', 'Corps', ['agent1@example.com', 'agent2@example.com'])
+        maintenant = timezone.now()
+        self.assertEqual(len(reserver_lot(1, maintenant)), 1)
+        self.assertEqual(envoyer_lot(), (1, 0))
+        self.assertEqual([m.to for m in mail.outbox], [['agent2@example.com']])
+        self.assertEqual(envoyer_lot(), (0, 0))
+
+        # Bail expiré (processus interrompu) : l'e-mail est repris
+        EmailSortant.objects.filter(statut='en_cours').update(prochain_essai=maintenant)
+        self.assertEqual(envoyer_lot(), (1, 0))
+        self.assertFalse(EmailSortant.objects.exclude(statut='envoye').exists())
+
+    def test_chaque_email_marque_des_son_envoi(self):
+        mettre_en_file('Sujet', 'Corps', ['agent1@example.com', 'agent2@example.com'])
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=[1, KeyboardInterrupt]):
+            with self.assertRaises(KeyboardInterrupt):
+                envoyer_lot()
+        statuts = dict(EmailSortant.objects.values_list('destinataire', 'statut'))
+        self.assertEqual(statuts, {'agent1@example.com': 'envoye', 'agent2@example.com': 'en_cours'})
+
+
+class CacheAuthentificationJWTTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', email='admin@example.com', password='x', is_staff=True)
+        cls.agent = User.objects.create_user(username='agent', email='agent@example.com', password='x')
+
+    def setUp(self):
+        cache_utilisateurs.vider()
+        self.addCleanup(cache_utilisateurs.vider)
+
+    def client_jwt(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return client
+
+    def test_utilisateur_servi_depuis_le_cache(self):
+        client = self.client_jwt(self.agent)
+        with self.assertNumQueries(1):
+            self.assertEqual(client.get(reverse('user_profile')).status_code, 200)
+        with self.assertNumQueries(0):
+            response = client.get(reverse('user_profile'))
+        self.assertEqual(response.data['email'], 'agent@example.com')
+
+    def test_desactivation_invalide_le_cache(self):
+        client = self.client_jwt(self.agent)
+        self.assertEqual(client.get(reverse('user_profile')).status_code, 200)
+
+        response = self.client_jwt(self.admin).patch(reverse('admin_user_detail', args=[self.agent.pk]), {'is_active': False})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.get(reverse('user_profile')).status_code, 401)
+
+    def test_mode_strict_relit_en_base(self):
+        client = self.client_jwt(self.admin)
+        self.assertEqual(client.get(reverse('statistiques-demandes')).status_code, 200)
+
+        # Modification hors signaux (QuerySet.update) : seul le mode strict la voit avant expiration
+        User.objects.filter(pk=self.admin.pk).update(is_staff=False)
+        self.assertEqual(client.get(reverse('statistiques-demandes')).status_code, 200)
+        self.assertEqual(client.get(reverse('admin_user_list')).status_code, 403)
+
+
+class AiguillageAuthentificationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='social', email='social@example.com', password='x')
+        application = get_application_model().objects.create(
+            name='front', user=cls.user, client_type='confidential', authorization_grant_type='password'
+        )
+        get_access_token_model().objects.create(
+            user=cls.user, application=application, token='jetonopaque123',
+            expires=timezone.now() + datetime.timedelta(hours=1), scope='read write',
+        )
+
+    def setUp(self):
+        cache_utilisateurs.vider()
+        self.addCleanup(cache_utilisateurs.vider)
+
+    def test_reconnaissance_jwt(self):
+        self.assertTrue(est_jwt(str(AccessToken.for_user(self.user)).encode()))
+        self.assertFalse(est_jwt(b'jetonopaque123'))
+        self.assertFalse(est_jwt(b'a.b.c'))
+
+    def test_jwt_sans_recherche_oauth2(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        with CaptureQueriesContext(connection) as requetes:
+            self.assertEqual(client.get(reverse('user_profile')).status_code, 200)
+        self.assertFalse(any('oauth2_provider' in requete['sql'] for requete in requetes))
+
+    def test_jeton_opaque_vers_oauth2(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer jetonopaque123')
+        response = client.get(reverse('user_profile'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['email'], 'social@example.com')
+
+        client.credentials(HTTP_AUTHORIZATION='Bearer inconnu')
+        self.assertEqual(client.get(reverse('user_profile')).status_code, 401)
+
+    def test_commande_de_mesure(self):
+        sortie = io.StringIO()
+        call_command('mesurer_authentification', iterations=3, stdout=sortie)
+        self.assertIn('aiguillage', sortie.getvalue())
+        self.assertFalse(User.objects.filter(username='mesure-authentification').exists())
+
+
+class ConnexionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='agent', email='agent@example.com', password='secret123', is_verified=True)
+        User.objects.create_user(username='nouveau', email='nouveau@example.com', password='secret123', is_active=False)
+
+    def connexion(self, identifiant, mot_de_passe='secret123'):
+        with mock.patch.object(PBKDF2PasswordHasher, 'encode', autospec=True, side_effect=PBKDF2PasswordHasher.encode) as hachage:
+            with CaptureQueriesContext(connection) as requetes:
+                response = APIClient().post(reverse('login'), {'username_or_email': identifiant, 'password': mot_de_passe})
+        lectures = [r for r in requetes if 'FROM "users_user"' in r['sql'] and r['sql'].startswith('SELECT')]
+        return response, hachage.call_count, len(lectures)
+
+    def test_un_seul_hachage_et_une_seule_requete(self):
+        for identifiant in ('agent', 'agent@example.com', 'inconnu@example.com'):
+            with self.subTest(identifiant=identifiant):
+                response, hachages, lectures = self.connexion(identifiant)
+                self.assertEqual(response.status_code, 401 if identifiant.startswith('inconnu') else 200)
+                self.assertEqual(hachages, 1)
+                self.assertEqual(lectures, 1)
+
+        response, hachages, _ = self.connexion('agent@example.com', 'mauvais')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(hachages, 1)
+
+    def test_compte_non_verifie(self):
+        response, _, _ = self.connexion('nouveau@example.com')
+        self.assertEqual(response.status_code, 403)
+        self.assertIn('vérifié', response.data['detail'])
+
+    def test_compte_desactive(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response, _, _ = self.connexion('agent')
+        self.assertEqual(response.status_code, 403)
+        self.assertIn('désactivé', response.data['detail'])
+
+    def test_session_close_a_la_desactivation(self):
+        self.client.force_login(self.user, backend='users.backends.EmailOuNomUtilisateurBackend')
+        self.assertEqual(auth.get_user(self.client).pk, self.user.pk)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertFalse(auth.get_user(self.client).is_authenticated)
+
+    def test_commande_de_mesure(self):
+        sortie = io.StringIO()
+        call_command('mesurer_connexion', iterations=1, stdout=sortie)
+        self.assertIn('e-mail', sortie.getvalue())
+        self.assertFalse(User.objects.filter(username='mesure-connexion').exists())
+
+
+class ListeNoireJetonsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='agent', email='agent@example.com', password='x', is_verified=True)
+
+    def setUp(self):
+        filtre_liste_noire.invalider()
+        self.addCleanup(filtre_liste_noire.invalider)
+
+    def rafraichir(self, refresh):
+        # Révocations ajoutées au filtre à la validation de la transaction (on_commit)
+        with self.captureOnCommitCallbacks(execute=True):
+            return APIClient().post(reverse('token_refresh'), {'refresh': refresh})
+
+    def test_filtre_de_bloom(self):
+        filtre = FiltreBloom(1000, 0.01)
+        for i in range(1000):
+            filtre.ajouter(f'jti-{i}')
+        self.assertTrue(all(f'jti-{i}' in filtre for i in range(1000)))
+        faux_positifs = sum(f'autre-{i}' in filtre for i in range(10000))
+        self.assertLess(faux_positifs, 300)
+
+    def test_rotation_sans_lecture_de_la_liste_noire(self):
+        refresh = str(RefreshToken.for_user(self.user))
+        self.assertEqual(self.rafraichir(refresh).status_code, 200)  # construit le filtre
+
+        suivant = str(RefreshToken.for_user(self.user))
+        with CaptureQueriesContext(connection) as requetes:
+            response = self.rafraichir(suivant)
+        self.assertEqual(response.status_code, 200)
+        # Pas de recherche par jti : seules la lecture incrémentale des révocations récentes (clé primaire)
+        # et la révocation de l'ancien jeton (get_or_create par token_id) touchent la table
+        lectures = [
+            r['sql'] for r in requetes
+            if r['sql'].startswith('SELECT') and '"token_blacklist_blacklistedtoken"' in r['sql']
+            and 'WHERE "token_blacklist_blacklistedtoken"."token_id" =' not in r['sql']
+        ]
+        self.assertEqual(len(lectures), 1)
+        self.assertIn('WHERE "token_blacklist_blacklistedtoken"."id" >', lectures[0])
+
+        # jetons révoqués par la rotation : refusés
+        self.assertEqual(self.rafraichir(refresh).status_code, 401)
+        self.assertEqual(self.rafraichir(suivant).status_code, 401)
+
+    def test_revocation_par_un_autre_processus(self):
+        refresh = RefreshToken.for_user(self.user)
+        self.assertEqual(self.rafraichir(str(RefreshToken.for_user(self.user))).status_code, 200)
+        # révocation écrite directement en base, sans passer par ce filtre
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=refresh['jti']))
+        self.assertEqual(self.rafraichir(str(refresh)).status_code, 401)
+
+    @override_settings(TOKEN_BLACKLIST={'SYNC_INTERVAL': 30})
+    def test_intervalle_de_synchronisation_choisi(self):
+        refresh = RefreshToken.for_user(self.user)
+        self.assertEqual(self.rafraichir(str(RefreshToken.for_user(self.user))).status_code, 200)
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=refresh['jti']))
+        # vue au plus tard après SYNC_INTERVAL
+        with mock.patch('users.liste_noire.time.monotonic', return_value=time.monotonic() + 31):
+            self.assertEqual(self.rafraichir(str(refresh)).status_code, 401)
+
+    def test_deconnexion(self):
+        refresh = RefreshToken.for_user(self.user)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(reverse('logout'), {'refresh_token': str(refresh)})
+        self.assertEqual(response.status_code, 205)
+        self.assertEqual(self.rafraichir(str(refresh)).status_code, 401)
+
+    def test_purge_par_lots(self):
+        expire = timezone.now() - datetime.timedelta(days=1)
+        for i in range(5):
+            jeton = OutstandingToken.objects.create(user=self.user, jti=f'expire-{i}', token='x', expires_at=expire)
+            if i % 2:
+                BlacklistedToken.objects.create(token=jeton)
+        valide = RefreshToken.for_user(self.user)
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=valide['jti']))
+
+        sortie = io.StringIO()
+        call_command('purger_jetons', taille_lot=2, pause=0, stdout=sortie)
+        self.assertIn('5 jeton(s)', sortie.getvalue())
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), [valide['jti']])
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+        self.assertEqual(purger_jetons_expires(pause=0), 0)
+
+
+class AdminUtilisateursTests(TestCase):
+
+    def test_listes_en_requetes_constantes(self):
+        superuser = User.objects.create_superuser(username='superadmin', email='superadmin@example.com', password='x')
+        self.client.force_login(superuser)
+
+        def nombre_requetes(nom):
+            with CaptureQueriesContext(connection) as requetes:
+                self.assertEqual(self.client.get(reverse(nom)).status_code, 200)
+            return len(requetes)
+
+        for nom in ('admin:users_user_changelist', 'admin:users_emailsortant_changelist'):
+            avant = nombre_requetes(nom)
+            for i in range(5):
+                utilisateur = User.objects.create_user(username=f'{nom}{i}', email=f'{i}-{nom}@example.com'.replace(':', '-'))
+                EmailSortant.objects.create(destinataire=utilisateur.email, sujet='Bienvenue', corps='...')
+            self.assertEqual(nombre_requetes(nom), avant, nom)
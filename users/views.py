@@ -4,12 +4,16 @@ from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
 from django.shortcuts import get_object_or_404
-from django.core.mail import send_mail
 from django.conf import settings
+from django.db import transaction
 import jwt
 from django.utils import timezone
 import datetime
 
+from Pret.conditionnel import ConditionalGetMixin
+from Pret.pagination import CursorPaginationMixin
+from .emails import mettre_en_file
+from .liste_noire import RefreshTokenFiltre
 from .models import User
 from .serializers import (
     UserRegistrationSerializer,
@@ -29,6 +33,7 @@ class UserRegistrationView(generics.CreateAPIView):
     serializer_class = UserRegistrationSerializer
     permission_classes = [permissions.AllowAny]
 
+    @transaction.atomic
     def perform_create(self, serializer):
         user = serializer.save(is_active=False, is_verified=False)
         payload = {
@@ -54,16 +59,9 @@ class UserRegistrationView(generics.CreateAPIView):
         Cordialement,
         L'équipe de la plateforme de prêt
         """
-        email_from = settings.DEFAULT_FROM_EMAIL if hasattr(settings, 'DEFAULT_FROM_EMAIL') else 'noreply@votreapp.com'
-        recipient_list = [user.email]
-
-        try:
-            send_mail(subject, message, email_from, recipient_list, fail_silently=False)
-        except Exception as e:
-            print(f"Erreur lors de l'envoi de l'e-mail d'activation à {user.email}: {e}")
-            return Response({"detail": "Votre compte a été créé, mais nous n'avons pas pu envoyer l'e-mail d'activation. Veuillez contacter l'administrateur.", "error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-        return Response({"detail": "Un lien d'activation a été envoyé à votre adresse e-mail. Veuillez vérifier votre boîte de réception pour activer votre compte."}, status=status.HTTP_201_CREATED)
+        # L'e-mail est mis en file dans la même transaction que l'utilisateur ;
+        # la commande `envoyer_emails` se charge de l'envoi SMTP.
+        mettre_en_file(subject, message, [user.email])
 
 class UserLoginView(APIView):
     permission_classes = [permissions.AllowAny]
@@ -74,14 +72,8 @@ class UserLoginView(APIView):
 
         username_or_email = serializer.validated_data.get('username_or_email')
         password = serializer.validated_data.get('password')
+        # users.backends.EmailOuNomUtilisateurBackend accepte indifféremment nom d'utilisateur ou e-mail
         user = authenticate(request, username=username_or_email, password=password)
-        if not user:
-            try:
-                user = User.objects.get(email=username_or_email)
-                if not user.check_password(password):
-                    user = None
-            except User.DoesNotExist:
-                user = None
 
         if user is not None:
             if not user.is_verified and not user.is_staff and not user.is_superuser:
@@ -99,11 +91,12 @@ class UserLoginView(APIView):
 
 class UserLogoutView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    authentification_stricte = True
 
     def post(self, request):
         try:
             refresh_token = request.data["refresh_token"]
-            token = RefreshToken(refresh_token)
+            token = RefreshTokenFiltre(refresh_token)
             token.blacklist()
             return Response({"detail": "Déconnexion réussie."}, status=status.HTTP_205_RESET_CONTENT)
         except Exception as e:
@@ -147,15 +140,21 @@ class AccountActivationView(APIView):
         except Exception as e:
             print(f"Erreur inattendue lors de l'activation du compte: {e}")
             return Response({"detail": "Une erreur est survenue lors de l'activation de votre compte."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-class UserProfileView(generics.RetrieveUpdateAPIView):
+class UserProfileView(ConditionalGetMixin, generics.RetrieveUpdateAPIView):
     serializer_class = UserProfileSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
         return self.request.user
 
+    def validateurs(self):
+        # L'utilisateur authentifié est déjà chargé : aucune requête. Pas de date de modification
+        # sur User, donc pas de Last-Modified (last_login ne change pas avec le profil)
+        return tuple(getattr(self.request.user, champ) for champ in UserProfileSerializer.Meta.fields), None
+
 class PasswordChangeView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    authentification_stricte = True
 
     def post(self, request):
         serializer = PasswordChangeSerializer(data=request.data)
@@ -173,21 +172,24 @@ class PasswordChangeView(APIView):
         try:
             refresh_token = request.data.get("refresh_token")
             if refresh_token:
-                token = RefreshToken(refresh_token)
+                token = RefreshTokenFiltre(refresh_token)
                 token.blacklist()
         except Exception:
             pass
         return Response({"detail": "Mot de passe modifié avec succès. Veuillez vous reconnecter."}, status=status.HTTP_200_OK)
 
-class AdminUserListView(generics.ListAPIView):
-    queryset = User.objects.all().order_by('email')
+class AdminUserListView(CursorPaginationMixin, generics.ListAPIView):
+    queryset = User.objects.all().order_by('email', 'id')
     serializer_class = AdminUserManagementSerializer
     permission_classes = [permissions.IsAdminUser]
+    authentification_stricte = True
+    cursor_ordering = ('email', 'id')
 
 class AdminUserDetailView(generics.RetrieveUpdateDestroyAPIView):
     queryset = User.objects.all()
     serializer_class = AdminUserManagementSerializer
     permission_classes = [permissions.IsAdminUser]
+    authentification_stricte = True
     lookup_field = 'pk'
 
     def get_object(self):